@@ -0,0 +1,3 @@
+"""
+转换流程的性能基准测试
+"""
@@ -0,0 +1,104 @@
+"""
+生成基准测试用的合成语料：不同节点数的SVG、较大的PDF和位图
+
+同一个随机种子总是生成完全相同的文件，不同机器上的结果可以直接比较。
+"""
+import random
+import struct
+import zlib
+from pathlib import Path
+
+# 默认语料：每种SVG节点数各生成若干个文件
+DEFAULT_SVG_NODES = (100, 1000, 10000)
+DEFAULT_SVG_COUNT = 4
+DEFAULT_PDF_SIZES_MB = (1, 5)
+DEFAULT_BITMAP_SIZES = ((640, 480), (2000, 1500))
+
+
+def write_svg(path, nodes, rng):
+    """写出包含指定数量图形元素的SVG"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<svg xmlns="http://www.w3.org/2000/svg" width="800" height="600" viewBox="0 0 800 600">\n')
+        for i in range(nodes):
+            x, y = rng.uniform(0, 800), rng.uniform(0, 600)
+            color = f"#{rng.randrange(0x1000000):06x}"
+            if i % 3 == 0:
+                f.write(f'<circle cx="{x:.2f}" cy="{y:.2f}" r="{rng.uniform(1, 20):.2f}" fill="{color}"/>\n')
+            elif i % 3 == 1:
+                f.write(f'<rect x="{x:.2f}" y="{y:.2f}" width="{rng.uniform(1, 40):.2f}" '
+                        f'height="{rng.uniform(1, 40):.2f}" fill="{color}"/>\n')
+            else:
+                points = " ".join(f"{rng.uniform(0, 800):.1f},{rng.uniform(0, 600):.1f}" for _ in range(6))
+                f.write(f'<polyline points="{points}" stroke="{color}" fill="none"/>\n')
+        f.write('</svg>\n')
+
+
+def write_pdf(path, size_mb, rng):
+    """写出一个大约size_mb大小的单页PDF，内容是大量线段"""
+    commands = []
+    target = size_mb * 1024 * 1024
+    length = 0
+    while length < target:
+        line = (f"{rng.uniform(0, 595):.2f} {rng.uniform(0, 842):.2f} m "
+                f"{rng.uniform(0, 595):.2f} {rng.uniform(0, 842):.2f} l S\n")
+        commands.append(line)
+        length += len(line)
+    content = "".join(commands).encode('ascii')
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R >>",
+        b"<< /Length " + str(len(content)).encode() + b" >>\nstream\n" + content + b"\nendstream",
+    ]
+    with open(path, 'wb') as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, 1):
+            offsets.append(f.tell())
+            f.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode())
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode())
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+
+
+def write_png(path, width, height, rng):
+    """写出一个带随机噪声的RGB PNG"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    raw = bytearray()
+    for _ in range(height):
+        raw.append(0)
+        raw.extend(rng.randbytes(width * 3))
+    with open(path, 'wb') as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(bytes(raw), 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def generate_corpus(directory, seed=0, svg_nodes=DEFAULT_SVG_NODES, svg_count=DEFAULT_SVG_COUNT,
+                    pdf_sizes_mb=DEFAULT_PDF_SIZES_MB, bitmap_sizes=DEFAULT_BITMAP_SIZES):
+    """在directory中生成语料，返回生成的文件路径列表"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    files = []
+    for nodes in svg_nodes:
+        for i in range(svg_count):
+            path = directory / f"svg_{nodes}_{i}.svg"
+            write_svg(path, nodes, rng)
+            files.append(path)
+    for size_mb in pdf_sizes_mb:
+        path = directory / f"pdf_{size_mb}mb.pdf"
+        write_pdf(path, size_mb, rng)
+        files.append(path)
+    for width, height in bitmap_sizes:
+        path = directory / f"bitmap_{width}x{height}.png"
+        write_png(path, width, height, rng)
+        files.append(path)
+    return files
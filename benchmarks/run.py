@@ -0,0 +1,270 @@
+"""
+转换流程基准测试
+
+    python -m benchmarks.run --output bench.json
+    python -m benchmarks.run --compare bench.json
+
+默认使用模拟的Inkscape（benchmarks/stub_inkscape.py），不需要安装Inkscape；
+使用 --inkscape 指定真实的Inkscape可以测量实际性能。
+结果写为JSON，--compare 与之前的结果比较，吞吐量下降超过容差时以退出码1结束。
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from fig_converter.backends import BackendRegistry
+from fig_converter.cache import ConversionCache
+from fig_converter.formats import FILE_TYPES
+from fig_converter.scheduler import ConversionScheduler, default_worker_count
+from fig_converter.tasks import build_tasks
+
+from .corpus import generate_corpus
+
+logger = logging.getLogger("FigConverter.benchmarks")
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+STUB_PATH = Path(__file__).resolve().parent / "stub_inkscape.py"
+RESULT_VERSION = 1
+
+
+def make_stub_launcher(directory):
+    """生成调用模拟Inkscape的可执行文件，返回其路径"""
+    if os.name == 'nt':
+        launcher = Path(directory) / "inkscape.cmd"
+        launcher.write_text(f'@"{sys.executable}" "{STUB_PATH}" %*\n', encoding='utf-8')
+    else:
+        launcher = Path(directory) / "inkscape"
+        launcher.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{STUB_PATH}" "$@"\n', encoding='utf-8')
+        launcher.chmod(0o755)
+    return str(launcher)
+
+
+def clean_outputs(corpus_dir, corpus_files):
+    """删除语料目录中除语料以外的文件（上一个场景的输出）"""
+    keep = {path.name for path in corpus_files}
+    for path in Path(corpus_dir).iterdir():
+        if path.is_file() and path.name not in keep:
+            path.unlink()
+
+
+def summarize(name, runs, results, **extra):
+    """汇总一个场景的多次运行"""
+    wall = statistics.median(runs)
+    counts = Counter(result.status for result in results)
+    return {
+        "name": name,
+        "tasks": len(results),
+        "runs": [round(seconds, 4) for seconds in runs],
+        "wall_seconds": round(wall, 4),
+        "tasks_per_second": round(len(results) / wall, 3) if wall > 0 else None,
+        "failed": counts.get("failed", 0),
+        "cache_hit_rate": round((counts.get("fresh", 0) + counts.get("restored", 0)) / len(results), 3)
+        if results else 0.0,
+        "backends": dict(Counter(result.backend for result in results)),
+        **extra,
+    }
+
+
+class BenchmarkSuite:
+    """按场景运行基准测试"""
+
+    def __init__(self, inkscape_path, corpus_dir, corpus_files, formats, dpi, repeat):
+        self.inkscape_path = inkscape_path
+        self.corpus_dir = corpus_dir
+        self.corpus_files = corpus_files
+        self.formats = formats
+        self.dpi = dpi
+        self.repeat = repeat
+        self.tasks, _ = build_tasks(corpus_files, formats, FILE_TYPES, dpi)
+
+    def _timed(self, scheduler, clean=True):
+        if clean:
+            clean_outputs(self.corpus_dir, self.corpus_files)
+        start = time.perf_counter()
+        results = scheduler.run(list(self.tasks))
+        return time.perf_counter() - start, results
+
+    def conversion(self, name, workers, use_shell):
+        """不使用缓存的转换，比较单次调用和交互模式以及不同并发数"""
+        runs = []
+        results = []
+        for _ in range(self.repeat):
+            scheduler = ConversionScheduler(self.inkscape_path, workers=workers, use_shell=use_shell,
+                                            backends=BackendRegistry())
+            seconds, results = self._timed(scheduler)
+            runs.append(seconds)
+        return summarize(name, runs, results, workers=workers, use_shell=use_shell)
+
+    def cache(self, workers):
+        """缓存命中率：第一次为冷缓存，第二次输出未变化，第三次删除输出后从缓存恢复"""
+        summaries = []
+        for _ in range(self.repeat):
+            with tempfile.TemporaryDirectory(prefix="fig_bench_cache_") as cache_dir:
+                clean_outputs(self.corpus_dir, self.corpus_files)
+                for phase, clean in (("cold", False), ("warm", False), ("restore", True)):
+                    cache = ConversionCache(cache_dir, inkscape_version="benchmark")
+                    scheduler = ConversionScheduler(self.inkscape_path, workers=workers, cache=cache,
+                                                    backends=BackendRegistry())
+                    seconds, results = self._timed(scheduler, clean=clean)
+                    summaries.append((phase, seconds, results))
+        return [
+            summarize(f"cache-{phase}", [seconds for p, seconds, _ in summaries if p == phase],
+                      [results for p, _, results in summaries if p == phase][-1], workers=workers)
+            for phase in ("cold", "warm", "restore")
+        ]
+
+    def batch_cli(self, workers):
+        """通过命令行批处理模式端到端运行，包括Python启动和任务展开"""
+        runs = []
+        lines = []
+        for _ in range(self.repeat):
+            clean_outputs(self.corpus_dir, self.corpus_files)
+            cmd = [sys.executable, str(REPO_ROOT / "main.py"), "--batch", "-q", "--no-cache",
+                   "--inkscape-only", "--inkscape", self.inkscape_path, "--workers", str(workers),
+                   "--dpi", str(self.dpi), "-f", ",".join(self.formats), str(self.corpus_dir)]
+            start = time.perf_counter()
+            completed = subprocess.run(cmd, capture_output=True, text=True, encoding='utf-8')
+            runs.append(time.perf_counter() - start)
+            lines = [json.loads(line) for line in completed.stdout.splitlines() if line.strip()]
+        wall = statistics.median(runs)
+        return {
+            "name": "batch-cli",
+            "tasks": len(lines),
+            "runs": [round(seconds, 4) for seconds in runs],
+            "wall_seconds": round(wall, 4),
+            "tasks_per_second": round(len(lines) / wall, 3) if wall > 0 else None,
+            "failed": sum(1 for line in lines if line["status"] == "failed"),
+            "workers": workers,
+        }
+
+
+def compare(results, baseline, tolerance):
+    """与基准结果比较吞吐量，返回出现退化的场景名列表"""
+    previous = {scenario["name"]: scenario for scenario in baseline.get("scenarios", [])}
+    regressions = []
+    for scenario in results["scenarios"]:
+        old = previous.get(scenario["name"])
+        if not old or not old.get("tasks_per_second") or not scenario.get("tasks_per_second"):
+            continue
+        ratio = scenario["tasks_per_second"] / old["tasks_per_second"]
+        flag = ""
+        if ratio < 1 - tolerance:
+            regressions.append(scenario["name"])
+            flag = "  <-- 退化"
+        print(f"{scenario['name']:<20} {old['tasks_per_second']:>10.3f} -> {scenario['tasks_per_second']:>10.3f} "
+              f"任务/秒 ({ratio:.2f}x){flag}", file=sys.stderr)
+    return regressions
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="图片格式转换流程基准测试")
+    parser.add_argument("--inkscape", default=None, help="真实Inkscape的路径，默认使用模拟的Inkscape")
+    parser.add_argument("--seed", type=int, default=0, help="语料随机种子")
+    parser.add_argument("--svg-count", type=int, default=4, help="每种节点数生成的SVG数量")
+    parser.add_argument("-f", "--formats", default="PNG,PDF,EPS", help="输出格式，逗号分隔")
+    parser.add_argument("--dpi", type=int, default=300)
+    parser.add_argument("--repeat", type=int, default=3, help="每个场景重复次数，取中位数")
+    parser.add_argument("--workers", default=None,
+                        help="并发场景使用的并发数，逗号分隔 (默认: 1,2,4,CPU核心数)")
+    parser.add_argument("--scenarios", default="oneshot,shell,concurrency,cache,batch-cli",
+                        help="要运行的场景，逗号分隔")
+    parser.add_argument("--startup", type=float, default=0.3, help="模拟Inkscape的启动耗时（秒）")
+    parser.add_argument("--open", type=float, default=0.02, help="模拟Inkscape打开文档的耗时（秒）")
+    parser.add_argument("--render", type=float, default=0.05, help="模拟Inkscape每次导出的耗时（秒）")
+    parser.add_argument("--render-per-mb", type=float, default=0.1, help="模拟Inkscape每MB输入额外的导出耗时（秒）")
+    parser.add_argument("-o", "--output", default=None, help="结果JSON文件，默认输出到标准输出")
+    parser.add_argument("--compare", default=None, help="与之前的结果JSON比较")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="允许的吞吐量下降比例 (默认: 0.10)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    formats = [name.strip().upper() for name in args.formats.split(',') if name.strip()]
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    if args.workers:
+        worker_levels = [int(value) for value in args.workers.split(',')]
+    else:
+        worker_levels = sorted({1, 2, 4, default_worker_count()})
+
+    work_dir = Path(tempfile.mkdtemp(prefix="fig_bench_"))
+    try:
+        stub = {
+            "STUB_INKSCAPE_STARTUP": args.startup,
+            "STUB_INKSCAPE_OPEN": args.open,
+            "STUB_INKSCAPE_RENDER": args.render,
+            "STUB_INKSCAPE_RENDER_PER_MB": args.render_per_mb,
+        }
+        if args.inkscape:
+            inkscape_path = args.inkscape
+        else:
+            os.environ.update({key: str(value) for key, value in stub.items()})
+            inkscape_path = make_stub_launcher(work_dir)
+
+        corpus_dir = work_dir / "corpus"
+        corpus_files = generate_corpus(corpus_dir, seed=args.seed, svg_count=args.svg_count)
+        suite = BenchmarkSuite(inkscape_path, corpus_dir, corpus_files, formats, args.dpi, args.repeat)
+
+        results = {
+            "version": RESULT_VERSION,
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": default_worker_count(),
+                "inkscape": args.inkscape or "stub",
+                "stub": None if args.inkscape else stub,
+                "seed": args.seed,
+                "corpus_files": len(corpus_files),
+                "corpus_bytes": sum(path.stat().st_size for path in corpus_files),
+                "formats": formats,
+                "dpi": args.dpi,
+                "repeat": args.repeat,
+            },
+            "scenarios": [],
+        }
+        for scenario in scenarios:
+            print(f"运行场景: {scenario}", file=sys.stderr)
+            if scenario == "oneshot":
+                results["scenarios"].append(suite.conversion("oneshot", 1, use_shell=False))
+            elif scenario == "shell":
+                results["scenarios"].append(suite.conversion("shell", 1, use_shell=True))
+            elif scenario == "concurrency":
+                for workers in worker_levels:
+                    results["scenarios"].append(suite.conversion(f"concurrency-{workers}", workers, use_shell=True))
+            elif scenario == "cache":
+                results["scenarios"].extend(suite.cache(max(worker_levels)))
+            elif scenario == "batch-cli":
+                results["scenarios"].append(suite.batch_cli(max(worker_levels)))
+            else:
+                print(f"未知场景: {scenario}", file=sys.stderr)
+                return 2
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(text + "\n", encoding='utf-8')
+    else:
+        print(text)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding='utf-8'))
+        if compare(results, baseline, args.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
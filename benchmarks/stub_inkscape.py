@@ -0,0 +1,131 @@
+"""
+模拟Inkscape的可执行文件，用于在没有安装Inkscape的环境中运行基准测试
+
+支持单次调用 (inkscape 输入文件 --export-type=... --export-filename=...)、
+交互模式 (inkscape --shell) 和 --version。延迟通过环境变量配置：
+
+    STUB_INKSCAPE_STARTUP      进程启动耗时（秒）
+    STUB_INKSCAPE_OPEN         打开文档耗时（秒）
+    STUB_INKSCAPE_RENDER       每次导出的固定耗时（秒）
+    STUB_INKSCAPE_RENDER_PER_MB  每MB输入额外的导出耗时（秒）
+
+设置STUB_INKSCAPE_CRASH时，打开路径中包含该字符串的文档会使进程崩溃（用于测试）。
+"""
+import os
+import signal
+import struct
+import sys
+import time
+import zlib
+
+VERSION = "Inkscape 1.2.2 (stub)"
+
+
+def _delay(name):
+    seconds = float(os.environ.get(name, "0") or 0)
+    if seconds > 0:
+        time.sleep(seconds)
+
+
+def _crash_if_requested(input_path):
+    """模拟Inkscape打开文档时崩溃"""
+    marker = os.environ.get("STUB_INKSCAPE_CRASH")
+    if not marker or marker not in str(input_path):
+        return
+    sys.stdout.flush()
+    if os.name == 'nt':
+        os._exit(0xC0000005)
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def _png_bytes(width=16, height=16):
+    """生成一个有效的纯色PNG"""
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xffffffff)
+
+    row = b"\x00" + b"\x80\x80\x80\xff" * width
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(row * height))
+            + chunk(b"IEND", b""))
+
+
+def export(input_path, options):
+    """模拟一次导出，写出输出文件"""
+    if not input_path or not os.path.isfile(input_path):
+        sys.stderr.write(f"stub: cannot open {input_path}\n")
+        sys.stderr.flush()
+        return False
+    size_mb = os.path.getsize(input_path) / (1024 * 1024)
+    _delay("STUB_INKSCAPE_RENDER")
+    per_mb = float(os.environ.get("STUB_INKSCAPE_RENDER_PER_MB", "0") or 0)
+    if per_mb > 0:
+        time.sleep(per_mb * size_mb)
+
+    output_path = options.get("export-filename")
+    export_type = options.get("export-type") or os.path.splitext(output_path)[1].lstrip('.')
+    if export_type == "png":
+        # 分块渲染的条带按 --export-width/--export-height 输出
+        data = _png_bytes(int(options.get("export-width") or 16), int(options.get("export-height") or 16))
+    else:
+        data = f"stub {export_type} export of {input_path} dpi={options.get('export-dpi', '96')}\n".encode()
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def run_shell():
+    """模拟交互模式：每行若干以分号分隔的动作，处理完输出提示符"""
+    out = sys.stdout.buffer
+    out.write(b"Inkscape interactive shell mode. Type 'action-list' to list all actions. Type 'quit' to quit.\n> ")
+    out.flush()
+    document = None
+    options = {}
+    for raw_line in sys.stdin.buffer:
+        for action in raw_line.decode('utf-8').strip().split(';'):
+            name, _, argument = action.strip().partition(':')
+            if not name:
+                continue
+            if name == "quit":
+                return 0
+            if name == "file-open":
+                _crash_if_requested(argument)
+                _delay("STUB_INKSCAPE_OPEN")
+                document = argument if os.path.isfile(argument) else None
+                if document is None:
+                    sys.stderr.write(f"stub: cannot open {argument}\n")
+                    sys.stderr.flush()
+            elif name == "file-close":
+                document = None
+            elif name == "export-do":
+                export(document, options)
+            elif name.startswith("export-"):
+                options[name] = argument
+        out.write(b"> ")
+        out.flush()
+    return 0
+
+
+def main(argv):
+    if "--version" in argv:
+        print(VERSION)
+        return 0
+    _delay("STUB_INKSCAPE_STARTUP")
+    if "--shell" in argv:
+        return run_shell()
+
+    options = {}
+    input_path = None
+    for argument in argv:
+        if argument.startswith("--"):
+            name, _, value = argument[2:].partition('=')
+            options[name] = value
+        else:
+            input_path = argument
+    _crash_if_requested(input_path)
+    _delay("STUB_INKSCAPE_OPEN")
+    return 0 if export(input_path, options) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
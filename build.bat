@@ -1,5 +1,10 @@
 @echo off
 echo 开始打包图像格式转换工具...
-pyinstaller --clean build.spec
+rem build.bat onedir 生成启动更快的目录版
+if /i "%1"=="onedir" (
+    pyinstaller --clean build_onedir.spec
+) else (
+    pyinstaller --clean build.spec
+)
 echo 打包完成！
 pause
\ No newline at end of file
@@ -7,7 +7,7 @@ a = Analysis(
     pathex=[],
     binaries=[],
     datas=[],
-    hiddenimports=['tkinterdnd2'],
+    hiddenimports=['tkinterdnd2', 'fig_converter.gui'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
@@ -0,0 +1,54 @@
+# -*- mode: python ; coding: utf-8 -*-
+# 目录版打包：生成 dist/fig_converter/ 目录而不是单一可执行文件。
+# 单文件版每次启动都要先把全部依赖解压到临时目录，目录版省去这一步，启动明显更快。
+# 目录版不使用UPX压缩，避免每次启动时解压DLL。
+
+block_cipher = None
+
+a = Analysis(
+    ['main.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=['tkinterdnd2', 'fig_converter.gui'],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=[],
+    win_no_prefer_redirects=False,
+    win_private_assemblies=False,
+    cipher=block_cipher,
+    noarchive=False,
+)
+pyz = PYZ(a.pure, a.zipped_data, cipher=block_cipher)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='fig_converter',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+    # 如果有图标文件，取消下面这行的注释，并将图标文件放在正确位置
+    # icon='fig_converter.ico',
+)
+
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.zipfiles,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='fig_converter',
+)
@@ -0,0 +1,7 @@
+"""
+图片格式转换引擎 - 与图形界面无关的转换组件
+"""
+from .startup import process_started_at
+
+# 程序启动的时间 (time.time())，用于测量启动耗时；单文件版从引导进程开始解压时算起
+STARTED_AT = process_started_at()
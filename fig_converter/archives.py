@@ -0,0 +1,285 @@
+import hashlib
+import logging
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path, PurePosixPath
+
+from .formats import VALID_EXTENSIONS
+
+
+logger = logging.getLogger("FigConverter.archives")
+
+# 可以作为输入和输出的压缩包类型，tar包的压缩方式由扩展名决定
+ARCHIVE_SUFFIXES = {
+    ".zip": ("zip", None),
+    ".tar": ("tar", ""),
+    ".tar.gz": ("tar", "gz"),
+    ".tgz": ("tar", "gz"),
+    ".tar.bz2": ("tar", "bz2"),
+    ".tbz2": ("tar", "bz2"),
+    ".tar.xz": ("tar", "xz"),
+    ".txz": ("tar", "xz"),
+}
+
+# 写入zip时不再压缩的格式（本身已经压缩过，再压缩只会浪费时间）
+STORED_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif"}
+
+
+class ArchiveError(Exception):
+    """压缩包无法读取或写入"""
+
+
+def _archive_suffix(path):
+    name = Path(path).name.lower()
+    for suffix in sorted(ARCHIVE_SUFFIXES, key=len, reverse=True):
+        if name.endswith(suffix):
+            return suffix
+    return None
+
+
+def is_archive(path):
+    """是否为支持的压缩包（只看扩展名）"""
+    return _archive_suffix(path) is not None
+
+
+def archive_stem(path):
+    """去掉压缩包扩展名的文件名，例如 figs.tar.gz -> figs"""
+    name = Path(path).name
+    suffix = _archive_suffix(path)
+    return name[:-len(suffix)] if suffix else Path(path).stem
+
+
+def _safe_member_name(name):
+    """成员名是否可以安全地作为相对路径使用（不是绝对路径，不包含 ..）"""
+    parts = PurePosixPath(name.replace('\\', '/')).parts
+    return bool(parts) and not name.startswith(('/', '\\')) and ".." not in parts and ':' not in parts[0]
+
+
+@dataclass(frozen=True)
+class ArchiveMember:
+    """
+    压缩包中的一个输入文件
+
+    path为成员解压到压缩包旁同名目录时的路径（例如 figs.zip 中的 sub/a.svg 为 figs/sub/a.svg），
+    用于显示和生成输出文件名；成员只在转换时才解压到临时目录。
+    """
+    archive: str
+    name: str
+    size: int = 0
+    mtime: float = 0.0
+
+    @property
+    def path(self):
+        return Path(self.archive).parent / archive_stem(self.archive) / self.name
+
+    def __str__(self):
+        return str(self.path)
+
+
+def list_members(archive, extensions=VALID_EXTENSIONS):
+    """
+    逐个返回压缩包中扩展名符合要求的成员，不解压
+
+    跳过目录、隐藏文件和不安全的成员名；压缩包无法读取时记录警告。
+    """
+    archive = str(archive)
+    try:
+        if ARCHIVE_SUFFIXES[_archive_suffix(archive)][0] == "zip":
+            with zipfile.ZipFile(archive) as zf:
+                entries = [(info.filename, info.file_size, _zip_mtime(info))
+                           for info in zf.infolist() if not info.is_dir()]
+        else:
+            with tarfile.open(archive, 'r:*') as tf:
+                entries = [(info.name, info.size, info.mtime) for info in tf.getmembers() if info.isfile()]
+    except (OSError, zipfile.BadZipFile, tarfile.TarError, KeyError) as e:
+        logger.warning(f"无法读取压缩包 {archive}: {e}")
+        return
+    for name, size, mtime in entries:
+        basename = PurePosixPath(name).name
+        if basename.startswith('.') or os.path.splitext(basename)[1].lower() not in extensions:
+            continue
+        if not _safe_member_name(name):
+            logger.warning(f"跳过压缩包中路径不安全的文件: {archive}: {name}")
+            continue
+        yield ArchiveMember(archive, name, size, mtime)
+
+
+def _zip_mtime(info):
+    try:
+        return time.mktime(info.date_time + (0, 0, -1))
+    except (OverflowError, ValueError):
+        return 0.0
+
+
+class ScratchArea:
+    """
+    压缩包成员的临时解压目录
+
+    成员在第一次被使用时解压，最后一个使用者释放后删除，同一时间只占用正在转换的成员的空间。
+    解压后的文件保留成员的修改时间，转换缓存可以按 (修改时间, 大小) 复用之前计算的哈希。
+    zip和未压缩的tar可以直接定位到成员；压缩的tar包只能顺序读取，定位靠后的成员需要从头解压。
+    """
+
+    def __init__(self):
+        self._root = None
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._archives = {}
+
+    def _directory(self):
+        with self._lock:
+            if self._root is None:
+                self._root = tempfile.mkdtemp(prefix="fig_archive_")
+            return self._root
+
+    def acquire(self, member, count=1):
+        """解压成员（已解压时直接复用），返回解压后的路径；count为之后调用release的次数"""
+        digest = hashlib.sha1(f"{member.archive}\0{member.name}".encode('utf-8')).hexdigest()[:16]
+        target = Path(self._directory()) / digest / PurePosixPath(member.name).name
+        with self._lock:
+            entry = self._entries.setdefault(str(target), {"count": 0, "lock": threading.Lock(), "ready": False})
+            entry["count"] += count
+        try:
+            with entry["lock"]:
+                if not entry["ready"]:
+                    self._extract(member, target)
+                    entry["ready"] = True
+        except BaseException:
+            self.release(target, count)
+            raise
+        return target
+
+    def release(self, path, count=1):
+        """释放成员，没有使用者时删除解压出的文件"""
+        with self._lock:
+            entry = self._entries.get(str(path))
+            if entry is None:
+                return
+            entry["count"] -= count
+            if entry["count"] > 0:
+                return
+            del self._entries[str(path)]
+            # 在锁内删除，同一成员随后再次解压时不会与删除交错
+            shutil.rmtree(Path(path).parent, ignore_errors=True)
+
+    def _extract(self, member, target):
+        target.parent.mkdir(parents=True, exist_ok=True)
+        reader = self._reader(member.archive)
+        try:
+            with reader["lock"]:
+                handle = reader["archive"]
+                if isinstance(handle, zipfile.ZipFile):
+                    source = handle.open(member.name)
+                else:
+                    source = handle.extractfile(member.name)
+                    if source is None:
+                        raise ArchiveError(f"{member.name} 不是普通文件")
+                with source, open(target, 'wb') as f:
+                    shutil.copyfileobj(source, f, 1024 * 1024)
+        except (zipfile.BadZipFile, tarfile.TarError, KeyError, EOFError) as e:
+            raise ArchiveError(f"无法解压 {member.name}: {e}") from e
+        if member.mtime:
+            os.utime(target, (member.mtime, member.mtime))
+
+    def _reader(self, archive):
+        """每个压缩包只打开一次，同一压缩包的成员依次解压"""
+        with self._lock:
+            reader = self._archives.get(archive)
+            if reader is not None:
+                return reader
+        try:
+            if ARCHIVE_SUFFIXES[_archive_suffix(archive)][0] == "zip":
+                handle = zipfile.ZipFile(archive)
+            else:
+                handle = tarfile.open(archive, 'r:*')
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            raise ArchiveError(f"无法读取压缩包 {archive}: {e}") from e
+        with self._lock:
+            reader = self._archives.setdefault(archive, {"archive": handle, "lock": threading.Lock()})
+        if reader["archive"] is not handle:
+            handle.close()
+        return reader
+
+    def close(self):
+        """关闭打开的压缩包并删除临时目录"""
+        with self._lock:
+            readers = list(self._archives.values())
+            self._archives.clear()
+            self._entries.clear()
+            root, self._root = self._root, None
+        for reader in readers:
+            reader["archive"].close()
+        if root is not None:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def output_member_name(task, roots=()):
+    """
+    任务的输出文件在输出压缩包中的名称，保留子目录
+
+    压缩包成员的输出相对于压缩包所在的目录（即以压缩包名开头，如 figs/sub/a.png），
+    输入目录roots中文件的输出相对于所在的输入目录（取最外层的），其他文件的输出只用文件名。
+    """
+    output_path = os.path.abspath(task.output_path)
+    if task.member is not None:
+        base = os.path.dirname(os.path.abspath(task.member.archive))
+    else:
+        source = os.path.abspath(task.input_path)
+        base = os.path.dirname(source)
+        for root in roots:
+            root = os.path.abspath(root)
+            if source.startswith(root + os.sep) and len(root) < len(base):
+                base = root
+    relative = os.path.relpath(output_path, base)
+    if relative.startswith(os.pardir):
+        return Path(output_path).name
+    return relative.replace(os.sep, '/')
+
+
+class ArchiveWriter:
+    """
+    把输出文件逐个写入输出压缩包（zip或tar）
+
+    写入期间使用同目录下的临时文件，关闭时才替换为最终文件。可以在多个线程中调用add。
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        suffix = _archive_suffix(self.path)
+        if suffix is None:
+            raise ValueError(f"不支持的压缩包类型: {self.path.name}（可用 {', '.join(ARCHIVE_SUFFIXES)}）")
+        self.kind, compression = ARCHIVE_SUFFIXES[suffix]
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._partial = self.path.with_name(f".{self.path.name}.{os.getpid()}.partial")
+        self._lock = threading.Lock()
+        self._names = set()
+        self.count = 0
+        if self.kind == "zip":
+            self._archive = zipfile.ZipFile(self._partial, 'w', zipfile.ZIP_DEFLATED)
+        else:
+            self._archive = tarfile.open(self._partial, f"w:{compression}")
+
+    def add(self, file_path, name):
+        """写入一个文件；已有同名的成员时抛出FileExistsError，不会覆盖"""
+        with self._lock:
+            if name in self._names:
+                raise FileExistsError(f"已有同名的成员 {name}")
+            if self.kind == "zip":
+                stored = Path(name).suffix.lower() in STORED_SUFFIXES
+                self._archive.write(file_path, name, zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+            else:
+                self._archive.add(str(file_path), name, recursive=False)
+            self._names.add(name)
+            self.count += 1
+
+    def close(self):
+        """写完压缩包并替换为最终文件"""
+        with self._lock:
+            self._archive.close()
+            os.replace(self._partial, self.path)
@@ -0,0 +1,107 @@
+import logging
+import os
+
+from .formats import BITMAP_FORMATS
+from .tasks import TaskResult
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow是可选依赖，未安装时全部交给Inkscape
+    Image = None
+
+
+logger = logging.getLogger("FigConverter.backends")
+
+# Inkscape导入没有分辨率信息的位图时使用的默认DPI
+DEFAULT_IMPORT_DPI = 96
+
+
+class Backend:
+    """
+    转换后端的基类
+
+    子类实现supports和convert。Inkscape本身不在注册表中，是所有任务的最终后备。
+    """
+    name = ""
+
+    def supports(self, task):
+        """是否能处理该任务"""
+        raise NotImplementedError
+
+    def convert(self, task):
+        """执行任务并返回TaskResult"""
+        raise NotImplementedError
+
+
+class PillowBackend(Backend):
+    """
+    用Pillow在进程内完成位图到位图的转换 (JPG/BMP/GIF/TIFF/PNG → PNG/TIFF)
+
+    Inkscape处理位图时要先把它嵌入SVG文档再渲染，这里直接重新编码。
+    输出尺寸与Inkscape一致：按 导出DPI / 图片自身DPI 缩放，并写入导出DPI。
+    """
+    name = "pillow"
+
+    def supports(self, task):
+        return task.input_path.suffix.lower() in BITMAP_FORMATS and task.export_type in ('png', 'tiff')
+
+    def convert(self, task):
+        output_path = task.output_path
+        partial_path = output_path.with_name(f".{output_path.stem}.partial{output_path.suffix}")
+        try:
+            with Image.open(task.source_file) as image:
+                image.seek(0)
+                source_dpi = image.info.get("dpi", (DEFAULT_IMPORT_DPI, DEFAULT_IMPORT_DPI))
+                scale_x = task.dpi / (float(source_dpi[0]) or DEFAULT_IMPORT_DPI)
+                scale_y = task.dpi / (float(source_dpi[1]) or DEFAULT_IMPORT_DPI)
+                size = (max(1, round(image.width * scale_x)), max(1, round(image.height * scale_y)))
+
+                # Inkscape的位图输出为RGBA
+                converted = image.convert("RGBA")
+                if converted.size != size:
+                    converted = converted.resize(size, Image.LANCZOS)
+                converted.save(partial_path, format=task.export_type.upper(), dpi=(task.dpi, task.dpi))
+            os.replace(partial_path, output_path)
+        except (OSError, ValueError, Image.DecompressionBombError) as e:
+            try:
+                partial_path.unlink()
+            except OSError:
+                pass
+            return TaskResult(task, False, str(e), backend=self.name)
+        return TaskResult(task, True, backend=self.name)
+
+
+class BackendRegistry:
+    """
+    转换后端注册表
+
+    按注册顺序查找第一个支持 (输入格式, 输出格式) 的后端，没有则返回None，由Inkscape处理。
+    """
+
+    def __init__(self):
+        self._backends = []
+
+    def register(self, backend):
+        """注册一个后端，先注册的优先"""
+        self._backends.append(backend)
+
+    def select(self, task):
+        """返回能处理该任务的后端，没有则返回None"""
+        for backend in self._backends:
+            if backend.supports(task):
+                return backend
+        return None
+
+    @property
+    def names(self):
+        return [backend.name for backend in self._backends]
+
+
+def default_registry():
+    """默认注册表：已安装的轻量级进程内后端"""
+    registry = BackendRegistry()
+    if Image is not None:
+        registry.register(PillowBackend())
+    else:
+        logger.debug("未安装Pillow，位图转换将使用Inkscape")
+    return registry
@@ -0,0 +1,282 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+from .paths import user_cache_dir
+
+
+logger = logging.getLogger("FigConverter.cache")
+
+# 默认缓存容量上限：1 GB
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def default_cache_dir():
+    """默认的转换缓存目录"""
+    return user_cache_dir() / "conversions"
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """计算文件内容的SHA-256"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stat_signature(path):
+    """文件的 (修改时间, 大小)，用于判断文件是否被改动"""
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _output_label(task):
+    """清单中输出记录的键：输出文件的路径，写入输出压缩包的输出为 "压缩包路径!成员名" """
+    member = task.output_member
+    return f"{member.archive}!{member.name}" if member is not None else str(task.output_path)
+
+
+def _output_record(task, key, signature):
+    record = {"key": key, "stat": signature}
+    if task.output_member is not None:
+        record["container"] = str(task.output_member.archive)
+    return record
+
+
+def _prune(entries, outputs, inputs):
+    """
+    去掉清单中已经无用的记录：缓存结果已被淘汰或文件已不存在的输出记录，以及文件已不存在的输入记录
+
+    压缩包成员（输入或输出）的记录按所在的压缩包是否存在判断。
+    """
+    def exists(path, record):
+        return os.path.exists(record.get("container") or path)
+
+    outputs = {path: record for path, record in outputs.items()
+               if record.get("key") in entries and exists(path, record)}
+    inputs = {path: record for path, record in inputs.items() if exists(path, record)}
+    return outputs, inputs
+
+
+class ConversionCache:
+    """
+    基于内容哈希的转换缓存
+
+    缓存键由输入文件内容的哈希、导出格式、DPI和Inkscape版本（多页文档还有页码）组成，
+    使用进程内后端或PNG压缩时还包括后端名称和压缩模式，不同设置的输出不会互相替代。
+    清单文件记录每个输出文件对应的缓存键：输出仍是最新时直接跳过，
+    输出缺失或过期但缓存目录中有相同键的结果时复制恢复。
+    写回清单时去掉结果已被淘汰或文件已不存在的记录，清单不会无限增长。
+    缓存目录可以在多台机器之间共享，超出容量时按最近使用时间淘汰。
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, inkscape_version=""):
+        self.cache_dir = Path(cache_dir) if cache_dir else default_cache_dir()
+        self.max_bytes = max_bytes
+        self.inkscape_version = inkscape_version
+        self.manifest_path = self.cache_dir / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._outputs = {}
+        self._inputs = {}
+        self._removed_entries = set()
+        self._load()
+
+    def _load(self):
+        """读取清单文件，文件损坏时从空缓存开始"""
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"无法读取缓存清单，将重新建立: {e}")
+            return
+        if manifest.get("version") != MANIFEST_VERSION:
+            return
+        self._entries = manifest.get("entries", {})
+        self._outputs = manifest.get("outputs", {})
+        self._inputs = manifest.get("inputs", {})
+
+    def save(self):
+        """写回清单文件，与其他进程写入的内容合并"""
+        with self._lock:
+            entries, outputs, inputs = dict(self._entries), dict(self._outputs), dict(self._inputs)
+            removed = set(self._removed_entries)
+
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                on_disk = json.load(f)
+            if on_disk.get("version") == MANIFEST_VERSION:
+                entries = {**on_disk.get("entries", {}), **entries}
+                outputs = {**on_disk.get("outputs", {}), **outputs}
+                inputs = {**on_disk.get("inputs", {}), **inputs}
+        except (OSError, ValueError):
+            pass
+        for key in removed:
+            entries.pop(key, None)
+        outputs, inputs = _prune(entries, outputs, inputs)
+
+        manifest = {"version": MANIFEST_VERSION, "entries": entries, "outputs": outputs, "inputs": inputs}
+        temp_path = self.manifest_path.with_name(f"{MANIFEST_NAME}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+
+    def input_hash(self, path, source=None, container=None):
+        """
+        输入文件内容的哈希，文件未改动时复用清单中记录的结果
+
+        source为内容实际所在的文件（例如压缩包成员解压出的临时文件），记录仍以path为键；
+        container为path所在的压缩包，清理清单时按压缩包是否存在判断记录是否还有用。
+        """
+        source = source or path
+        path = str(path)
+        signature = _stat_signature(source)
+        with self._lock:
+            record = self._inputs.get(path)
+            if record and record["stat"] == signature:
+                return record["sha256"]
+        digest = hash_file(source)
+        record = {"stat": signature, "sha256": digest}
+        if container is not None:
+            record["container"] = str(container)
+        with self._lock:
+            self._inputs[path] = record
+        return digest
+
+    def task_key(self, task, backend=None, compression=None, preflight=False):
+        """
+        计算任务的缓存键，backend为进程内后端的名称（Inkscape为None），compression为PNG压缩模式，
+        preflight表示Inkscape打开的是预处理后的文档
+        """
+        params = [
+            self.input_hash(task.input_path, task.source_file, task.member.archive if task.member else None),
+            task.export_type,
+            task.dpi if task.is_raster else None,
+            self.inkscape_version,
+        ]
+        # 多页文档的每一页各有自己的缓存项，不拆分页面的任务缓存键不变
+        if task.page is not None:
+            params.append(task.page)
+        # 同样只在使用时加入，默认设置下的缓存键不变
+        variant = {key: value for key, value in (("backend", backend), ("compression", compression),
+                                                 ("preflight", preflight)) if value}
+        if variant:
+            params.append(variant)
+        return hashlib.sha256(json.dumps(params).encode('utf-8')).hexdigest()
+
+    def _blob_path(self, key, export_type):
+        return self.cache_dir / "objects" / key[:2] / f"{key}.{export_type}"
+
+    def fetch(self, task, backend=None, compression=None, preflight=False):
+        """
+        查找任务的缓存结果，backend、compression和preflight见task_key
+
+        返回 "fresh"（输出文件已是最新）、"restored"（已从缓存复制到输出位置）或 None（需要转换）。
+        """
+        key = self.task_key(task, backend, compression, preflight)
+        output_path = str(task.output_path)
+
+        with self._lock:
+            record = self._outputs.get(_output_label(task))
+            entry = self._entries.get(key)
+        if record and record["key"] == key:
+            try:
+                if _stat_signature(output_path) == record["stat"]:
+                    self._touch(key)
+                    return "fresh"
+            except OSError:
+                pass
+
+        if entry is None:
+            return None
+        blob_path = self._blob_path(key, task.export_type)
+        temp_path = task.output_path.with_name(f".{task.output_path.name}.{os.getpid()}.restore")
+        try:
+            shutil.copyfile(blob_path, temp_path)
+            os.replace(temp_path, task.output_path)
+        except OSError as e:
+            logger.warning(f"无法从缓存恢复 {task.output_path.name}: {e}")
+            with self._lock:
+                self._entries.pop(key, None)
+                self._removed_entries.add(key)
+            try:
+                temp_path.unlink()
+            except OSError:
+                pass
+            return None
+
+        with self._lock:
+            self._outputs[_output_label(task)] = _output_record(task, key, _stat_signature(output_path))
+        self._touch(key)
+        return "restored"
+
+    def store(self, task, backend=None, compression=None, preflight=False):
+        """转换成功后把输出文件存入缓存，backend、compression和preflight见task_key"""
+        try:
+            key = self.task_key(task, backend, compression, preflight)
+            blob_path = self._blob_path(key, task.export_type)
+            blob_path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path = blob_path.with_name(f"{blob_path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            shutil.copyfile(task.output_path, temp_path)
+            os.replace(temp_path, blob_path)
+            size = blob_path.stat().st_size
+            signature = _stat_signature(task.output_path)
+        except OSError as e:
+            logger.warning(f"无法写入缓存 {task.output_path.name}: {e}")
+            return
+
+        with self._lock:
+            self._entries[key] = {
+                "blob": str(blob_path.relative_to(self.cache_dir)),
+                "size": size,
+                "last_used": time.time(),
+            }
+            self._removed_entries.discard(key)
+            self._outputs[_output_label(task)] = _output_record(task, key, signature)
+        self.evict()
+
+    def _touch(self, key):
+        """更新缓存项的最近使用时间"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry["last_used"] = time.time()
+
+    def total_size(self):
+        """缓存中所有结果的总大小"""
+        with self._lock:
+            return sum(entry["size"] for entry in self._entries.values())
+
+    def evict(self):
+        """超出容量上限时，按最近使用时间从旧到新删除缓存结果"""
+        with self._lock:
+            total = sum(entry["size"] for entry in self._entries.values())
+            if total <= self.max_bytes:
+                return
+            victims = []
+            for key, entry in sorted(self._entries.items(), key=lambda item: item[1]["last_used"]):
+                if total <= self.max_bytes:
+                    break
+                total -= entry["size"]
+                victims.append((key, entry))
+                del self._entries[key]
+                self._removed_entries.add(key)
+
+        for key, entry in victims:
+            try:
+                (self.cache_dir / entry["blob"]).unlink()
+            except OSError:
+                pass
+        logger.info(f"缓存超出容量上限，已淘汰 {len(victims)} 个结果")
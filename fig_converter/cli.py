@@ -0,0 +1,489 @@
+import argparse
+import glob
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+from pathlib import Path
+
+from .archives import is_archive, list_members
+from .backends import BackendRegistry
+from .cache import DEFAULT_MAX_BYTES, ConversionCache
+from .daemon import ConversionDaemon, DaemonClient, DaemonError
+from .discovery import resolve_inkscape
+from .engine import ConversionEngine
+from .formats import FILE_TYPES, VALID_EXTENSIONS
+from .history import format_seconds
+from .ingest import FolderWatcher, walk_files
+from .inkscape import get_inkscape_version
+from .logs import setup_logging
+from .memory import MB, default_memory_budget
+from .paths import metrics_report_dir
+from .pngcompress import COMPRESSION_MODES
+from .scheduler import DEFAULT_TASK_TIMEOUT, RetryPolicy, default_worker_count
+from .tasks import ERROR_CRASH, ERROR_TIMEOUT, parse_dpi_list, resolve_name_template
+
+
+logger = logging.getLogger("FigConverter.cli")
+
+# 退出码
+EXIT_OK = 0
+EXIT_TASK_FAILED = 1
+EXIT_USAGE = 2
+# 被Ctrl+C或终止信号取消，与shell中被SIGINT结束的惯例一致
+EXIT_CANCELLED = 130
+
+# 批处理模式在标准错误输出进度和剩余时间的最小间隔（秒）
+PROGRESS_LOG_SECONDS = 10
+
+
+def build_parser():
+    """构建命令行参数解析器"""
+    parser = argparse.ArgumentParser(
+        prog="fig-converter",
+        description="图片格式转换工具。默认启动图形界面，使用 --batch 在命令行中直接转换。"
+    )
+    parser.add_argument("inputs", nargs="*",
+                        help="要转换的文件、文件夹或通配符；使用 - 从标准输入读取任务列表（每行一个路径或一个JSON对象）")
+    parser.add_argument("--batch", action="store_true",
+                        help="不启动图形界面，转换完成后退出，每个任务在标准输出输出一行JSON结果")
+    parser.add_argument("-f", "--formats", default=None,
+                        help=f"输出格式，逗号分隔 (可选: {', '.join(FILE_TYPES)})")
+    parser.add_argument("--dpi", default="300",
+                        help="位图输出的DPI，可以用逗号分隔多个，例如 96,192,288,600 (默认: 300)")
+    parser.add_argument("--name-template", default=None,
+                        help="位图输出的文件名模板，可用 {stem} {ext} {format} {dpi} {scale} {page}，"
+                             "例如 {stem}@{scale}x.{ext} (默认: 单个DPI为 {stem}.{ext}，多个DPI为 {stem}_{dpi}dpi.{ext}；"
+                             "多页PDF/PS按页导出，模板中没有 {page} 时在扩展名前加上 _p{page})")
+    parser.add_argument("--workers", type=int, default=None,
+                        help=f"并发转换数 (默认: CPU核心数 {default_worker_count()})")
+    parser.add_argument("--inkscape", default=None, help="Inkscape可执行文件路径，默认自动查找")
+    parser.add_argument("--inkscape-only", action="store_true",
+                        help="所有任务都交给Inkscape，不使用Pillow等进程内后端")
+    parser.add_argument("--no-cache", action="store_true", help="不使用转换缓存")
+    parser.add_argument("--force", action="store_true", help="强制重新转换所有文件")
+    parser.add_argument("--cache-dir", default=None, help="转换缓存目录，可以是多台机器共享的目录")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help="转换缓存容量上限 (MB)")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TASK_TIMEOUT,
+                        help=f"单个任务的超时 (秒，默认: {DEFAULT_TASK_TIMEOUT}，0为不限制)，超时后结束Inkscape进程树")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="Inkscape进程崩溃的任务最多重试的次数 (默认: 1)")
+    parser.add_argument("--retry-timeouts", action="store_true", help="超时的任务也重试")
+    parser.add_argument("--memory-budget", type=int, default=None,
+                        help="同时运行的Inkscape任务的内存预算 (MB，默认: 物理内存的70%%，0为不限制)，"
+                             "按页面尺寸和DPI估计每个任务的内存，超出预算的任务等待")
+    parser.add_argument("--preflight", action="store_true",
+                        help="转换前清理SVG文档（删除元数据、未使用的定义和冗余变换，提取内嵌位图），加快Inkscape解析")
+    parser.add_argument("--png-compression", choices=COMPRESSION_MODES, default=None,
+                        help="重新压缩PNG输出：fast 只重新压缩图像数据，max 另外尝试用Pillow重新编码，取较小的结果")
+    parser.add_argument("--output-archive", default=None, metavar="PATH",
+                        help="把输出逐个写入该压缩包 (.zip/.tar/.tar.gz/.tar.bz2/.tar.xz)，而不是写在源文件旁")
+    parser.add_argument("--tile-threshold", type=float, default=None, metavar="MEGAPIXELS",
+                        help="输出超过该像素数（百万像素）的SVG位图导出分块并行渲染后拼接，默认不分块")
+    parser.add_argument("--verify-tiles", action="store_true",
+                        help="分块渲染后再整幅渲染一次逐像素校验，不一致时使用整幅渲染的结果（需要Pillow，未安装时不分块）")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="只列出转换计划（按执行顺序）和根据历史耗时预测的耗时，不执行转换")
+    parser.add_argument("--watch", action="store_true",
+                        help="批处理模式下转换完成后继续监视给出的文件夹，自动转换新增或修改的文件")
+    parser.add_argument("--interval", type=float, default=2.0, help="监视文件夹的轮询间隔 (秒，默认: 2)")
+    parser.add_argument("--metrics-dir", default=None,
+                        help="每批转换结束后在该目录写出统计报告 (JSON和Prometheus文本格式；"
+                             "图形界面默认写在用户缓存目录的metrics中)")
+    parser.add_argument("--daemon", choices=("start", "stop", "status"), default=None,
+                        help="本地转换服务：start 在前台运行服务（常驻Inkscape进程和共享缓存），stop 停止，status 查看状态")
+    parser.add_argument("--no-daemon", action="store_true",
+                        help="即使本地转换服务正在运行，也在当前进程中转换")
+    parser.add_argument("--no-thumbnails", action="store_true", help="图形界面的文件列表中不显示缩略图")
+    parser.add_argument("--measure-startup", action="store_true",
+                        help="启动图形界面，窗口就绪后输出启动耗时并退出")
+    parser.add_argument("-q", "--quiet", action="store_true", help="批处理模式下只输出警告和错误日志")
+    return parser
+
+
+def parse_formats(value):
+    """解析逗号分隔的输出格式，返回格式名列表"""
+    if isinstance(value, str):
+        value = value.split(',')
+    formats = []
+    for item in value:
+        name = item.strip().upper()
+        if not name:
+            continue
+        if name not in FILE_TYPES:
+            raise ValueError(f"不支持的输出格式: {item}")
+        if name not in formats:
+            formats.append(name)
+    return formats
+
+
+def expand_inputs(patterns):
+    """展开文件路径和通配符，保持给出的顺序并去重"""
+    files = []
+    seen = set()
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern, recursive=True)) if glob.has_magic(pattern) else [pattern]
+        if not matches:
+            logger.warning(f"没有匹配的文件: {pattern}")
+        for match in matches:
+            if match not in seen:
+                seen.add(match)
+                files.append(match)
+    return files
+
+
+def iter_job_files(patterns, on_missing):
+    """
+    逐个产生要转换的文件：展开通配符，递归扫描目录，压缩包产生其中的成员 (ArchiveMember)
+
+    不存在的路径调用 on_missing(path)，类型不支持的文件记录警告后跳过。
+    """
+    seen = set()
+    for match in expand_inputs(patterns):
+        if os.path.isdir(match):
+            candidates = walk_files(match)
+        elif os.path.isfile(match) and is_archive(match):
+            candidates = list_members(match)
+        elif os.path.isfile(match):
+            if Path(match).suffix.lower() not in VALID_EXTENSIONS:
+                logger.warning(f"不支持的文件类型: {match}")
+                continue
+            candidates = [match]
+        else:
+            on_missing(match)
+            continue
+        for file_path in candidates:
+            if file_path not in seen:
+                seen.add(file_path)
+                yield file_path
+
+
+def read_jobs(stream, default_formats, default_dpi, on_error, default_template=None):
+    """
+    从标准输入逐行读取任务列表
+
+    每行可以是一个文件路径/通配符/目录，或一个JSON对象，例如
+    {"input": "figs/*.svg", "formats": ["PNG", "PDF"], "dpi": [96, 192, 600], "name_template": "{stem}@{dpi}.{ext}"}
+    逐个产生 (通配符列表, 格式列表, DPI列表, 文件名模板)；格式错误的行调用 on_error(line, message)，
+    批处理按参数错误处理。
+    """
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith('{'):
+            try:
+                job = json.loads(line)
+                formats = parse_formats(job.get("formats") or default_formats)
+                dpis = parse_dpi_list(job.get("dpi", default_dpi))
+                template = resolve_name_template(job.get("name_template", default_template), dpis)
+                pattern = job["input"]
+                if not isinstance(pattern, str) or not pattern:
+                    raise ValueError(f"input 应为文件路径、通配符或目录: {pattern!r}")
+            except (ValueError, KeyError, TypeError) as e:
+                on_error(line, f"第 {line_number} 行任务格式错误: {e}")
+                continue
+        else:
+            pattern, formats, dpis = line, default_formats, default_dpi
+            template = resolve_name_template(default_template, dpis)
+        if not formats:
+            on_error(line, f"第 {line_number} 行没有指定输出格式")
+            continue
+        yield [pattern], formats, dpis, template
+
+
+class BatchRunner:
+    """
+    无界面批处理：逐个产生任务交给引擎，每个结果在标准输出输出一行JSON
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.failed = 0
+        self.bad_jobs = 0
+        self._output_lock = threading.Lock()
+        self._progress_logged = 0.0
+
+    def emit(self, record):
+        """输出一行JSON结果，并统计失败的任务数"""
+        with self._output_lock:
+            if record["status"] == "failed":
+                self.failed += 1
+            sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+
+    def report_missing(self, file_path):
+        logger.error(f"文件不存在: {file_path}")
+        self.emit({"input": file_path, "output": None, "format": None, "status": "failed", "error": "文件不存在"})
+
+    def report_bad_job(self, line, message):
+        logger.error(message)
+        self.bad_jobs += 1
+        self.emit({"input": line, "output": None, "format": None, "status": "failed", "error": message})
+
+    def iter_tasks(self, jobs):
+        """把任务列表展开为转换任务，目录边扫描边产生任务"""
+        for patterns, formats, dpis, template in jobs:
+            files = iter_job_files(patterns, self.report_missing)
+            yield from self.engine.iter_tasks(files, formats, dpis, template)
+
+    def exit_code(self):
+        """任务列表有格式错误的行时为参数错误，否则有任务失败时为失败"""
+        if self.bad_jobs:
+            return EXIT_USAGE
+        return EXIT_TASK_FAILED if self.failed else EXIT_OK
+
+    def run(self, tasks):
+        """执行任务，返回结果列表"""
+        results = self.engine.run(tasks, on_result=lambda result: self.emit(result.to_dict()),
+                                  on_progress=self.log_progress)
+        logger.info(f"转换结束: 共 {len(results)} 个任务")
+        return results
+
+    def log_progress(self, completed, total):
+        """定期记录按预测耗时加权的进度和剩余时间"""
+        now = time.monotonic()
+        if now - self._progress_logged < PROGRESS_LOG_SECONDS or completed >= total:
+            return
+        self._progress_logged = now
+        progress = self.engine.progress
+        logger.info(f"进度 {progress.fraction:.0%} ({completed}/{total})，"
+                    f"预计剩余 {format_seconds(progress.remaining_seconds())}")
+
+    def print_plan(self, tasks):
+        """按执行顺序输出转换计划，每个任务一行JSON，返回计划"""
+        plan = self.engine.plan(tasks)
+        with self._output_lock:
+            for unit in plan.units:
+                for item in unit:
+                    record = {"input": str(item.task.input_path), "output": str(item.task.output_path),
+                              "format": item.task.format_name, "status": "planned",
+                              "predicted_seconds": round(item.seconds, 3), "history": item.from_history}
+                    if item.task.page is not None:
+                        record["page"] = item.task.page
+                    sys.stdout.write(json.dumps(record, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+        logger.info(plan.describe())
+        return plan
+
+
+def run_batch(args):
+    """无界面批处理模式，返回退出码"""
+    setup_logging(logging.WARNING if args.quiet else logging.INFO, [logging.StreamHandler(sys.stderr)])
+
+    try:
+        default_formats = parse_formats(args.formats or "")
+        dpis = parse_dpi_list(args.dpi)
+        name_template = resolve_name_template(args.name_template, dpis)
+    except ValueError as e:
+        logger.error(str(e))
+        return EXIT_USAGE
+    patterns = [item for item in args.inputs if item != '-']
+    if patterns and not default_formats:
+        logger.error("请使用 --formats 指定至少一种输出格式")
+        return EXIT_USAGE
+    if not args.inputs:
+        logger.error("没有指定要转换的文件")
+        return EXIT_USAGE
+    watch_folders = [item for item in patterns if os.path.isdir(item)]
+    if args.watch and not watch_folders:
+        logger.error("--watch 需要至少指定一个文件夹")
+        return EXIT_USAGE
+    if args.output_archive and (args.watch or not is_archive(args.output_archive)):
+        logger.error("--output-archive 需要 .zip 或 .tar(.gz/.bz2/.xz) 文件名，且不能与 --watch 同时使用")
+        return EXIT_USAGE
+
+    inkscape = resolve_inkscape(args.inkscape)
+    # 只列出计划时不需要Inkscape
+    if inkscape is None and not args.dry_run and (args.no_daemon or DaemonClient.connect() is None):
+        logger.error("未找到Inkscape，请安装Inkscape或使用 --inkscape 指定路径")
+        return EXIT_USAGE
+    # 本地找不到Inkscape时仍然可以交给转换服务
+    inkscape_path = inkscape.path if inkscape is not None else None
+
+    engine = ConversionEngine(
+        inkscape_path,
+        workers=args.workers,
+        use_cache=not args.no_cache,
+        force_rebuild=args.force,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_size * 1024 * 1024,
+        backends=BackendRegistry() if args.inkscape_only else None,
+        metrics_dir=args.metrics_dir,
+        timeout=args.timeout or None,
+        retry=build_retry_policy(args),
+        memory_budget=memory_budget_bytes(args),
+        preflight=args.preflight,
+        use_daemon=not args.no_daemon,
+        png_compression=args.png_compression,
+        output_archive=args.output_archive,
+        tile_threshold=tile_threshold_pixels(args),
+        verify_tiles=args.verify_tiles,
+        input_roots=watch_folders
+    )
+    runner = BatchRunner(engine)
+    install_cancel_handlers(engine)
+
+    def jobs():
+        if patterns:
+            yield patterns, default_formats, dpis, name_template
+        if '-' in args.inputs:
+            yield from read_jobs(sys.stdin, default_formats, dpis, runner.report_bad_job, args.name_template)
+
+    if args.dry_run:
+        runner.print_plan(list(runner.iter_tasks(jobs())))
+        return runner.exit_code()
+
+    watcher = None
+    if args.watch:
+        # 先记录基准再开始转换，转换期间新增的文件也不会遗漏
+        watcher = FolderWatcher(watch_folders)
+        watcher.prime()
+
+    results = runner.run(runner.iter_tasks(jobs()))
+    if engine.cancelled:
+        return EXIT_CANCELLED
+    if watcher is None:
+        return runner.exit_code()
+
+    watcher.ignore(result.task.output_path for result in results if result.success)
+    logger.info(f"正在监视 {', '.join(watch_folders)}，按 Ctrl+C 退出")
+    while not engine.cancel_event.wait(args.interval):
+        changed = watcher.poll()
+        if not changed:
+            continue
+        logger.info(f"发现 {len(changed)} 个新增或修改的文件")
+        results = runner.run(engine.build_tasks(changed, default_formats, dpis, name_template)[0])
+        watcher.ignore(result.task.output_path for result in results if result.success)
+    logger.info("停止监视")
+    # 监视期间的任何一次转换有失败的任务时，与单次转换一样返回失败
+    return runner.exit_code()
+
+
+def tile_threshold_pixels(args):
+    """按命令行参数计算分块渲染的像素阈值，不分块时返回None"""
+    if not args.tile_threshold or args.tile_threshold <= 0:
+        return None
+    return int(args.tile_threshold * 1000 * 1000)
+
+
+def memory_budget_bytes(args):
+    """按命令行参数计算内存预算（字节），不限制时返回None"""
+    if args.memory_budget is None:
+        return default_memory_budget()
+    return args.memory_budget * MB if args.memory_budget > 0 else None
+
+
+def build_retry_policy(args):
+    """按命令行参数构建重试策略"""
+    retry_on = (ERROR_CRASH, ERROR_TIMEOUT) if args.retry_timeouts else (ERROR_CRASH,)
+    return RetryPolicy(max_attempts=max(0, args.retries) + 1, retry_on=retry_on)
+
+
+def install_cancel_handlers(engine):
+    """
+    收到Ctrl+C或终止信号时取消转换：排队中的任务不再执行，正在运行的Inkscape进程被结束
+
+    再次收到信号时立即退出。
+    """
+    def handle(signum, frame):
+        if engine.cancelled:
+            raise KeyboardInterrupt
+        logger.warning("收到中断信号，正在取消转换 (再次按 Ctrl+C 立即退出)")
+        engine.cancel()
+
+    for name in ("SIGINT", "SIGTERM", "SIGBREAK"):
+        signum = getattr(signal, name, None)
+        if signum is not None:
+            signal.signal(signum, handle)
+
+
+def run_daemon(args):
+    """管理本地转换服务，返回退出码"""
+    setup_logging(logging.INFO, [logging.StreamHandler(sys.stderr)])
+    client = DaemonClient.connect()
+    if args.daemon == "status":
+        if client is None:
+            logger.info("本地转换服务未运行")
+            return EXIT_TASK_FAILED
+        print(json.dumps(client.request("status"), ensure_ascii=False))
+        return EXIT_OK
+    if args.daemon == "stop":
+        if client is None:
+            logger.info("本地转换服务未运行")
+            return EXIT_OK
+        try:
+            client.request("shutdown")
+        except DaemonError as e:
+            logger.error(f"无法停止转换服务: {e}")
+            return EXIT_TASK_FAILED
+        logger.info(f"已停止本地转换服务 (PID {client.pid})")
+        return EXIT_OK
+
+    if client is not None:
+        logger.error(f"本地转换服务已在运行 (PID {client.pid})")
+        return EXIT_USAGE
+    inkscape = resolve_inkscape(args.inkscape)
+    if inkscape is None:
+        logger.error("未找到Inkscape，请安装Inkscape或使用 --inkscape 指定路径")
+        return EXIT_USAGE
+    cache = None
+    if not args.no_cache:
+        cache = ConversionCache(args.cache_dir, max_bytes=args.cache_size * 1024 * 1024,
+                                inkscape_version=inkscape.version or get_inkscape_version(inkscape.path))
+    daemon = ConversionDaemon(inkscape.path, workers=args.workers, cache=cache,
+                              memory_budget=memory_budget_bytes(args))
+    sigterm = getattr(signal, "SIGTERM", None)
+    if sigterm is not None:
+        signal.signal(sigterm, lambda signum, frame: daemon.shutdown())
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return EXIT_OK
+
+
+def run_gui(args):
+    """启动图形界面"""
+    # 图形界面依赖tkinter和tkinterdnd2，只在需要时导入，批处理模式不依赖它们
+    from .gui import FigConverter
+
+    cache_options = {
+        "enabled": not args.no_cache,
+        "force_rebuild": args.force,
+        "cache_dir": args.cache_dir,
+        "max_bytes": args.cache_size * 1024 * 1024,
+    }
+    app = FigConverter(workers=args.workers, cache_options=cache_options, inkscape_path=args.inkscape,
+                       watch_interval=args.interval, metrics_dir=args.metrics_dir or metrics_report_dir(),
+                       measure_startup=args.measure_startup, task_timeout=args.timeout or None,
+                       retry=build_retry_policy(args), memory_budget=memory_budget_bytes(args),
+                       preflight=args.preflight, use_daemon=not args.no_daemon,
+                       png_compression=args.png_compression, thumbnails=not args.no_thumbnails,
+                       tile_threshold=tile_threshold_pixels(args))
+    paths = expand_inputs([item for item in args.inputs if item != '-'])
+    if paths:
+        app._add_paths(paths)
+    app.mainloop()
+    return EXIT_OK
+
+
+def main(argv=None):
+    """命令行入口 (fig-converter)"""
+    args = build_parser().parse_args(argv)
+    if args.daemon:
+        sys.exit(run_daemon(args))
+    if args.batch:
+        try:
+            sys.exit(run_batch(args))
+        except KeyboardInterrupt:
+            sys.exit(EXIT_CANCELLED)
+    sys.exit(run_gui(args))
+
+
+if __name__ == "__main__":
+    main()
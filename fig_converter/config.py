@@ -0,0 +1,44 @@
+import json
+import logging
+import os
+
+from .paths import user_config_dir
+
+
+logger = logging.getLogger("FigConverter.config")
+
+CONFIG_NAME = "settings.json"
+
+
+def config_path():
+    """当前用户的配置文件路径"""
+    return user_config_dir() / CONFIG_NAME
+
+
+def load_config(path=None):
+    """读取配置，文件不存在或内容无效时返回空字典"""
+    path = path or config_path()
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"无法读取配置文件 {path}: {e}")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def update_config(values, path=None):
+    """把values合并到配置文件中，写入失败时只记录警告"""
+    path = path or config_path()
+    data = load_config(path)
+    data.update(values)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"无法写入配置文件 {path}: {e}")
@@ -0,0 +1,409 @@
+import hmac
+import json
+import logging
+import os
+import queue
+import secrets
+import socket
+import socketserver
+import threading
+from pathlib import Path
+
+from .archives import ArchiveMember
+from .backends import BackendRegistry, default_registry
+from .history import DurationHistory
+from .memory import MemoryBudget
+from .paths import user_config_dir
+from .scheduler import DEFAULT_TASK_TIMEOUT, ConversionScheduler, RetryPolicy, ShellPool, default_worker_count
+from .tasks import ConversionTask, TaskResult, cancelled_result
+
+
+logger = logging.getLogger("FigConverter.daemon")
+
+# 转换服务的地址和访问令牌，写在用户配置目录中
+DAEMON_FILE_NAME = "daemon.json"
+PROTOCOL_VERSION = 1
+
+# 连接转换服务的超时（秒），服务没有响应时尽快改为进程内转换
+CONNECT_TIMEOUT = 2.0
+
+
+class DaemonError(Exception):
+    """与转换服务通信失败"""
+
+
+def daemon_file():
+    """转换服务信息文件的路径"""
+    return user_config_dir() / DAEMON_FILE_NAME
+
+
+def _send(stream, message):
+    stream.write((json.dumps(message, ensure_ascii=False) + "\n").encode('utf-8'))
+    stream.flush()
+
+
+def _task_to_dict(task):
+    # 服务进程的工作目录与客户端不同，路径一律转为绝对路径
+    data = {
+        "input": str(Path(task.input_path).resolve()),
+        "output": str(Path(task.output_path).resolve()),
+        "format": task.format_name,
+        "export_type": task.export_type,
+        "dpi": task.dpi,
+    }
+    if task.page is not None:
+        data["page"] = task.page
+        data["page_count"] = task.page_count
+    if task.member is not None:
+        data["member"] = {"archive": str(Path(task.member.archive).resolve()), "name": task.member.name,
+                          "size": task.member.size, "mtime": task.member.mtime}
+    if task.output_member is not None:
+        data["output_member"] = {"archive": str(Path(task.output_member.archive).resolve()),
+                                 "name": task.output_member.name}
+    return data
+
+
+def _task_from_dict(data):
+    member = ArchiveMember(**data["member"]) if data.get("member") else None
+    output_member = ArchiveMember(**data["output_member"]) if data.get("output_member") else None
+    return ConversionTask(Path(data["input"]), Path(data["output"]), data["format"], data["export_type"],
+                          int(data.get("dpi", 300)), member=member, page=data.get("page"),
+                          page_count=data.get("page_count"), output_member=output_member)
+
+
+def retry_to_dict(retry):
+    if retry is None:
+        return None
+    return {"max_attempts": retry.max_attempts, "backoff": retry.backoff, "retry_on": list(retry.retry_on)}
+
+
+def retry_from_dict(data):
+    if not data:
+        return None
+    return RetryPolicy(max_attempts=int(data.get("max_attempts", 2)), backoff=float(data.get("backoff", 1.0)),
+                       retry_on=tuple(data.get("retry_on", ())))
+
+
+class ConversionDaemon:
+    """
+    本地转换服务
+
+    监听127.0.0.1上的随机端口，端口和访问令牌写入用户配置目录下的daemon.json（仅当前用户可读）。
+    常驻的Inkscape交互进程池、转换缓存和内存预算在所有提交的批次之间共享，
+    图形界面和命令行提交的转换不必各自查找Inkscape、冷启动Inkscape。
+    """
+
+    def __init__(self, inkscape_path, workers=None, cache=None, memory_budget=None, info_file=None):
+        self.inkscape_path = inkscape_path
+        self.workers = max(1, workers or default_worker_count())
+        self.cache = cache
+        # 所有批次共用一个预算，同时提交的批次合计不超过memory_budget（字节，None为不限制）
+        self.memory_budget = MemoryBudget(memory_budget) if memory_budget else None
+        self.info_file = Path(info_file) if info_file else daemon_file()
+        self.token = secrets.token_hex(16)
+        self.pool = ShellPool(inkscape_path, self.workers)
+        # 用于安排执行顺序；耗时记录由客户端保存，这里只在内存中更新
+        self.history = DurationHistory()
+        self.server = None
+
+    def serve_forever(self):
+        """启动服务并一直运行，直到shutdown被调用"""
+        self.server = _Server(("127.0.0.1", 0), _Handler)
+        self.server.daemon = self
+        port = self.server.server_address[1]
+        self._write_info(port)
+        logger.info(f"转换服务已启动: 127.0.0.1:{port}，{self.workers} 个工作进程")
+        try:
+            self.server.serve_forever()
+        finally:
+            self.server.server_close()
+            self._remove_info()
+            self.pool.close()
+            logger.info("转换服务已停止")
+
+    def shutdown(self):
+        """停止服务，可以在任意线程中调用"""
+        if self.server is not None:
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+    def _write_info(self, port):
+        self.info_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.info_file.with_name(f"{self.info_file.name}.{os.getpid()}.tmp")
+        # 令牌只有当前用户可以读取，其他用户无法提交任务
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({"port": port, "pid": os.getpid(), "token": self.token,
+                       "protocol": PROTOCOL_VERSION, "inkscape": self.inkscape_path}, f)
+        os.replace(temp_path, self.info_file)
+
+    def _remove_info(self):
+        try:
+            with open(self.info_file, 'r', encoding='utf-8') as f:
+                if json.load(f).get("pid") != os.getpid():
+                    return
+            self.info_file.unlink()
+        except (OSError, ValueError):
+            pass
+
+    def status(self):
+        return {"type": "status", "pid": os.getpid(), "protocol": PROTOCOL_VERSION,
+                "inkscape": self.inkscape_path, "workers": self.workers,
+                "cache": str(self.cache.cache_dir) if self.cache is not None else None}
+
+    def run_job(self, options, tasks, cancel_event, on_result, on_progress, on_complete=None):
+        """执行客户端提交的一批任务，tasks为逐个收到的任务的迭代器"""
+        scheduler = ConversionScheduler(
+            self.inkscape_path,
+            workers=min(self.workers, options.get("workers") or self.workers),
+            cache=self.cache if options.get("use_cache", True) else None,
+            force_rebuild=options.get("force_rebuild", False),
+            backends=BackendRegistry() if options.get("inkscape_only") else default_registry(),
+            timeout=options.get("timeout", DEFAULT_TASK_TIMEOUT),
+            retry=retry_from_dict(options.get("retry")),
+            cancel_event=cancel_event,
+            memory_budget=self.memory_budget,
+            preflight=options.get("preflight", False),
+            png_compression=options.get("png_compression"),
+            shell_pool=self.pool,
+            history=self.history,
+            tile_threshold=options.get("tile_threshold"),
+            verify_tiles=options.get("verify_tiles", False),
+        )
+
+        def record(result):
+            self.history.record(result)
+            on_result(result)
+
+        return scheduler.run(tasks, on_result=record, on_progress=on_progress, on_complete=on_complete)
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    一个客户端连接，消息为每行一个JSON对象
+
+    第一行为请求 {"token", "op"}；op为 "submit" 时随后逐行发送任务 {"task": {...}}，
+    以 {"op": "end"} 结束，期间可以发送 {"op": "cancel"}。服务按任务顺序逐行返回
+    {"type": "result"}，每个任务完成时（按完成顺序）返回 {"type": "complete"} 和 {"type": "progress"}，
+    最后返回 {"type": "done"}。
+    连接中断时取消该批转换。
+    """
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            request = json.loads(self.rfile.readline() or b"{}")
+        except ValueError:
+            return
+        if not hmac.compare_digest(str(request.get("token", "")), daemon.token):
+            _send(self.wfile, {"type": "error", "error": "访问令牌无效"})
+            return
+        op = request.get("op")
+        if op == "status":
+            _send(self.wfile, daemon.status())
+        elif op == "shutdown":
+            _send(self.wfile, {"type": "ok"})
+            daemon.shutdown()
+        elif op == "submit":
+            self._submit(daemon, request.get("options") or {})
+        else:
+            _send(self.wfile, {"type": "error", "error": f"未知的请求: {op}"})
+
+    def _submit(self, daemon, options):
+        task_queue = queue.Queue()
+        cancel_event = threading.Event()
+        send_lock = threading.Lock()
+
+        def send(message):
+            with send_lock:
+                try:
+                    _send(self.wfile, message)
+                except OSError:
+                    cancel_event.set()
+
+        def read_requests():
+            try:
+                for line in self.rfile:
+                    message = json.loads(line)
+                    if "task" in message:
+                        task_queue.put(_task_from_dict(message["task"]))
+                    elif message.get("op") == "end":
+                        task_queue.put(None)
+                    elif message.get("op") == "cancel":
+                        logger.info("客户端取消转换")
+                        cancel_event.set()
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"读取客户端请求失败: {e}")
+            # 连接已关闭：还没有结束的转换全部取消
+            cancel_event.set()
+            task_queue.put(None)
+
+        def received_tasks():
+            while True:
+                task = task_queue.get()
+                if task is None:
+                    return
+                yield task
+
+        threading.Thread(target=read_requests, daemon=True).start()
+        results = daemon.run_job(
+            options, received_tasks(), cancel_event,
+            on_result=lambda result: send({"type": "result", "result": result.to_dict()}),
+            on_progress=lambda completed, total: send({"type": "progress", "completed": completed, "total": total}),
+            on_complete=lambda index: send({"type": "complete", "index": index})
+        )
+        send({"type": "done", "tasks": len(results)})
+
+
+class DaemonClient:
+    """转换服务的客户端"""
+
+    def __init__(self, port, token, pid=None):
+        self.port = port
+        self.token = token
+        self.pid = pid
+
+    @classmethod
+    def connect(cls, info_file=None):
+        """读取服务信息并确认服务在运行，服务未运行时返回None"""
+        try:
+            with open(info_file or daemon_file(), 'r', encoding='utf-8') as f:
+                info = json.load(f)
+            client = cls(int(info["port"]), info["token"], info.get("pid"))
+            status = client.request("status")
+        except (OSError, ValueError, KeyError, TypeError, DaemonError):
+            return None
+        if status.get("protocol") != PROTOCOL_VERSION:
+            logger.warning("转换服务的版本与当前程序不一致，改为进程内转换")
+            return None
+        return client
+
+    def _open(self, op, **extra):
+        try:
+            sock = socket.create_connection(("127.0.0.1", self.port), timeout=CONNECT_TIMEOUT)
+        except OSError as e:
+            raise DaemonError(f"无法连接转换服务: {e}") from e
+        sock.settimeout(None)
+        stream = sock.makefile('rwb')
+        _send(stream, {"token": self.token, "op": op, **extra})
+        return sock, stream
+
+    def request(self, op):
+        """发送一个简单请求 (status / shutdown) 并返回响应"""
+        sock, stream = self._open(op)
+        try:
+            sock.settimeout(CONNECT_TIMEOUT)
+            line = stream.readline()
+        except OSError as e:
+            raise DaemonError(f"转换服务没有响应: {e}") from e
+        finally:
+            stream.close()
+            sock.close()
+        if not line:
+            raise DaemonError("转换服务没有响应")
+        response = json.loads(line)
+        if response.get("type") == "error":
+            raise DaemonError(response.get("error", ""))
+        return response
+
+    def run(self, tasks, options, on_result=None, on_progress=None, cancel_event=None, on_complete=None):
+        """
+        提交任务并按顺序接收结果，返回 (结果列表, 未完成的任务)
+
+        回调与ConversionScheduler.run相同。
+
+        连接中断或服务返回错误时未完成的任务为已发送但没有结果的任务加上尚未发送的任务（迭代器），
+        调用方可以改为在进程内转换它们；全部完成时为None。
+        """
+        tasks = iter(tasks)
+        cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        try:
+            sock, stream = self._open("submit", options=options)
+        except (OSError, DaemonError) as e:
+            logger.warning(f"无法提交到转换服务: {e}")
+            return [], tasks
+        sent = []
+        results = []
+        stop = threading.Event()
+        write_lock = threading.Lock()
+
+        def write(message):
+            with write_lock:
+                _send(stream, message)
+
+        def send_tasks():
+            try:
+                for task in tasks:
+                    sent.append(task)
+                    if stop.is_set() or cancel_event.is_set():
+                        break
+                    write({"task": _task_to_dict(task)})
+                write({"op": "end"})
+                # 等待结果期间转发取消请求
+                while not stop.is_set():
+                    if cancel_event.wait(0.2):
+                        write({"op": "cancel"})
+                        break
+            except OSError:
+                pass
+
+        sender = threading.Thread(target=send_tasks, daemon=True)
+        sender.start()
+        completed = False
+        try:
+            for line in stream:
+                message = json.loads(line)
+                kind = message.get("type")
+                if kind == "result":
+                    result = TaskResult.from_dict(sent[len(results)], message["result"])
+                    results.append(result)
+                    if on_result is not None:
+                        on_result(result)
+                elif kind == "progress" and on_progress is not None:
+                    on_progress(message["completed"], message["total"])
+                elif kind == "complete" and on_complete is not None:
+                    on_complete(message["index"])
+                elif kind == "done":
+                    completed = True
+                    break
+                elif kind == "error":
+                    raise DaemonError(message.get("error", ""))
+        except (OSError, ValueError) as e:
+            logger.warning(f"与转换服务的连接中断: {e}")
+        except DaemonError as e:
+            logger.warning(f"转换服务返回错误: {e}")
+        finally:
+            stop.set()
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            sender.join()
+            try:
+                # 连接已断开时关闭会写出缓冲中未发送的数据而出错
+                stream.close()
+            except OSError:
+                pass
+            sock.close()
+
+        unfinished = sent[len(results):]
+        if cancel_event.is_set():
+            # 已发送但没有执行的任务记为已取消，不再在进程内重新执行
+            for task in unfinished:
+                result = cancelled_result(task)
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+            return results, None
+        if completed:
+            return results, None
+        return results, _chain(unfinished, tasks)
+
+
+def _chain(first, rest):
+    yield from first
+    yield from rest
@@ -0,0 +1,127 @@
+import logging
+import os
+import subprocess
+from dataclasses import dataclass
+
+from .config import load_config, update_config
+from .inkscape import get_inkscape_version, remember_inkscape_version
+
+
+logger = logging.getLogger("FigConverter.discovery")
+
+# 配置文件中保存查找结果的键
+CONFIG_KEY = "inkscape"
+
+# Windows上Inkscape的常见安装路径
+WINDOWS_COMMON_PATHS = [
+    r"C:\Program Files\Inkscape\bin\inkscape.exe",
+    r"C:\Program Files (x86)\Inkscape\bin\inkscape.exe",
+    r"C:\Program Files\Inkscape\inkscape.exe",
+    r"C:\Program Files (x86)\Inkscape\inkscape.exe"
+]
+
+
+def find_inkscape():
+    """查找Inkscape可执行文件，找不到时返回None，不进行任何交互"""
+    if os.name == 'nt':  # Windows
+        # 检查环境变量PATH中的inkscape
+        try:
+            result = subprocess.run(["where", "inkscape"], 
+                                    capture_output=True, 
+                                    text=True, 
+                                    encoding='utf-8',
+                                    check=True)
+            for path in result.stdout.strip().split('\n'):
+                path = path.strip()
+                if path and os.path.exists(path):
+                    logger.info(f"从PATH中找到Inkscape: {path}")
+                    return path
+        except (OSError, subprocess.CalledProcessError):
+            logger.warning("在PATH中未找到Inkscape")
+        
+        # 检查常见路径
+        for path in WINDOWS_COMMON_PATHS:
+            if os.path.exists(path):
+                logger.info(f"找到Inkscape: {path}")
+                return path
+    else:  # Linux/Mac
+        try:
+            result = subprocess.run(["which", "inkscape"], 
+                                    capture_output=True, 
+                                    text=True, 
+                                    encoding='utf-8',
+                                    check=True)
+            path = result.stdout.strip()
+            if path:
+                logger.info(f"找到Inkscape: {path}")
+                return path
+        except (OSError, subprocess.CalledProcessError):
+            logger.warning("未找到Inkscape")
+    
+    return None
+
+
+@dataclass
+class InkscapeInfo:
+    """查找到的Inkscape：路径、版本，以及是否来自配置文件中保存的结果"""
+    path: str
+    version: str = ""
+    from_config: bool = False
+
+
+def _signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def load_saved_inkscape(config_file=None):
+    """
+    读取配置文件中保存的Inkscape
+
+    保存的可执行文件不存在或修改时间、大小变化（例如升级了Inkscape）时返回None。
+    """
+    saved = load_config(config_file).get(CONFIG_KEY)
+    if not isinstance(saved, dict) or not saved.get("path"):
+        return None
+    signature = _signature(saved["path"])
+    if signature is None or signature != saved.get("signature"):
+        logger.info(f"保存的Inkscape已变化，重新检查: {saved['path']}")
+        return None
+    remember_inkscape_version(saved["path"], signature[0], saved.get("version", ""))
+    return InkscapeInfo(saved["path"], saved.get("version", ""), from_config=True)
+
+
+def save_inkscape(path, version, config_file=None):
+    """把Inkscape路径、版本和可执行文件的修改时间保存到配置文件"""
+    signature = _signature(path)
+    if signature is None:
+        return
+    update_config({CONFIG_KEY: {"path": path, "version": version, "signature": signature}}, config_file)
+
+
+def resolve_inkscape(preferred=None, config_file=None):
+    """
+    确定要使用的Inkscape及其版本，找不到时返回None
+
+    优先使用preferred（命令行指定的路径），其次使用配置文件中保存的结果，
+    都没有时再查找系统中的Inkscape并保存。Inkscape启动较慢，查询版本的结果同样保存，
+    可执行文件未变化时不再启动Inkscape。可能耗时数秒，图形界面应在后台线程中调用。
+    """
+    saved = load_saved_inkscape(config_file)
+    if preferred:
+        if saved is not None and os.path.abspath(saved.path) == os.path.abspath(preferred):
+            remember_inkscape_version(preferred, _signature(preferred)[0], saved.version)
+            return InkscapeInfo(preferred, saved.version, from_config=True)
+        return InkscapeInfo(preferred, get_inkscape_version(preferred))
+    if saved is not None:
+        return saved
+
+    path = find_inkscape()
+    if not path:
+        return None
+    info = InkscapeInfo(path, get_inkscape_version(path))
+    save_inkscape(info.path, info.version, config_file)
+    return info
@@ -0,0 +1,316 @@
+import logging
+import shutil
+import tempfile
+import threading
+import time
+from dataclasses import replace
+from pathlib import Path
+
+from .archives import ArchiveMember, ArchiveWriter, output_member_name
+from .backends import default_registry
+from .cache import DEFAULT_MAX_BYTES, ConversionCache
+from .daemon import DaemonClient, retry_to_dict
+from .formats import FILE_TYPES
+from .history import BatchPlan, DurationHistory, ProgressTracker
+from .inkscape import get_inkscape_version
+from .memory import MB
+from .metrics import BatchMetrics
+from .scheduler import DEFAULT_TASK_TIMEOUT, ConversionScheduler, default_worker_count
+from .tasks import TaskResult, build_tasks, iter_tasks
+
+
+logger = logging.getLogger("FigConverter.engine")
+
+
+class ConversionEngine:
+    """
+    与界面无关的转换引擎
+
+    图形界面和命令行批处理模式共用，负责构建任务、准备缓存并交给调度器执行。
+    use_daemon为True且本地转换服务正在运行时，任务提交给转换服务执行（复用其常驻的Inkscape进程和缓存），
+    服务未运行或连接中断时改为在进程内执行。
+    每个任务的耗时记入history (DurationHistory)，用于预测之后的任务耗时、安排执行顺序和估计剩余时间。
+    设置output_archive时输出不写在源文件旁，而是逐个写入该压缩包（zip或tar）。
+    设置tile_threshold（像素）时，超过该像素数的SVG位图导出分块并行渲染（见ConversionScheduler）。
+    """
+
+    def __init__(self, inkscape_path, workers=None, use_cache=True, force_rebuild=False,
+                 cache_dir=None, cache_max_bytes=DEFAULT_MAX_BYTES, file_types=FILE_TYPES, backends=None,
+                 metrics_dir=None, timeout=DEFAULT_TASK_TIMEOUT, retry=None, cancel_event=None,
+                 memory_budget=None, preflight=False, use_daemon=False, png_compression=None, history=None,
+                 output_archive=None, tile_threshold=None, verify_tiles=False, input_roots=()):
+        self.inkscape_path = inkscape_path
+        self.workers = workers
+        self.use_cache = use_cache
+        self.force_rebuild = force_rebuild
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes
+        self.file_types = file_types
+        # 进程内转换后端，不支持的任务交给Inkscape
+        self.backends = backends if backends is not None else default_registry()
+        # 每批转换结束后写出JSON报告和Prometheus文件的目录，为None时不写
+        self.metrics_dir = metrics_dir
+        self.last_metrics = None
+        # 单个Inkscape任务的超时（秒，None为不限制）和失败重试策略
+        self.timeout = timeout
+        self.retry = retry
+        # 设置后停止排队中的任务并结束正在运行的Inkscape进程
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        # Inkscape任务的内存预算（字节），为None时不限制
+        self.memory_budget = memory_budget
+        # 交给Inkscape之前先清理SVG文档
+        self.preflight = preflight
+        self.use_daemon = use_daemon
+        # PNG输出的重新压缩模式 ("fast" / "max")，为None时不压缩
+        self.png_compression = png_compression
+        self.history = history if history is not None else DurationHistory()
+        # 当前（或最近一次）转换的加权进度
+        self.progress = None
+        # 输出压缩包的路径，为None时输出写在源文件旁；输入目录中文件的输出在压缩包中保留相对于输入目录的路径
+        self.output_archive = output_archive
+        self.input_roots = list(input_roots)
+        # 大幅位图分块渲染的像素阈值（为None时不分块），以及是否整幅渲染一次校验分块的结果
+        self.tile_threshold = tile_threshold
+        self.verify_tiles = verify_tiles
+
+    def cancel(self):
+        """取消正在进行的转换，可以在任意线程（包括信号处理函数）中调用"""
+        self.cancel_event.set()
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def build_tasks(self, files, formats, dpi, name_template=None):
+        """
+        构建转换任务，跳过与源文件格式相同的组合
+
+        dpi可以是DPI列表，位图格式为每个DPI各生成一个任务，文件名按name_template生成。
+        """
+        tasks, skipped = build_tasks(files, formats, self.file_types, dpi, name_template)
+        for file_path, format_name in skipped:
+            self._log_skipped(file_path, format_name)
+        return tasks, skipped
+
+    def iter_tasks(self, files, formats, dpi, name_template=None):
+        """逐个产生转换任务，files可以是正在扫描目录的迭代器"""
+        return iter_tasks(files, formats, self.file_types, dpi, on_skip=self._log_skipped,
+                          name_template=name_template)
+
+    def plan(self, tasks):
+        """按历史耗时预测任务列表的执行计划，不执行转换"""
+        return BatchPlan(tasks, self.history, self.workers or default_worker_count())
+
+    def _log_skipped(self, file_path, format_name):
+        logger.info(f"跳过相同格式转换: {file_path} 已经是 {format_name} 格式")
+
+    def create_cache(self):
+        """按当前设置创建转换缓存，未启用缓存时返回None"""
+        if not self.use_cache:
+            return None
+        # 缓存键包含Inkscape版本，升级Inkscape后旧结果自动失效
+        return ConversionCache(
+            self.cache_dir,
+            max_bytes=self.cache_max_bytes,
+            inkscape_version=get_inkscape_version(self.inkscape_path)
+        )
+
+    def run(self, tasks, on_result=None, on_progress=None, events=None):
+        """
+        执行任务并返回按提交顺序排列的结果
+
+        传入events (EventBus) 时，每个结果发布 "result" 事件，每次进度变化发布 "progress" 事件，
+        其中fraction为按预测耗时加权的进度，remaining为预计的剩余时间（秒）。
+        写入输出压缩包时，结果中的输出路径为 "压缩包路径!成员名"。
+        """
+        if not self.output_archive:
+            return self._run(tasks, on_result, on_progress, events)
+        writer = ArchiveWriter(self.output_archive)
+        # 输出先写到临时目录，任务完成后立即移入压缩包，临时目录中只有尚未写入的文件
+        staging = Path(tempfile.mkdtemp(prefix="fig_output_"))
+        try:
+            return self._run(self._staged(tasks, staging, self.input_roots, writer.path),
+                             self._archiving(on_result, writer), on_progress, events)
+        finally:
+            writer.close()
+            shutil.rmtree(staging, ignore_errors=True)
+            logger.info(f"已写入输出压缩包 {writer.path}（{writer.count} 个文件）")
+
+    def _run(self, tasks, on_result, on_progress, events):
+        progress = self.progress = ProgressTracker(self.history, self.workers or default_worker_count())
+        if isinstance(tasks, (list, tuple)):
+            for task in tasks:
+                progress.add(task)
+            if tasks:
+                logger.info(self.plan(tasks).describe())
+        else:
+            tasks = progress.track(tasks)
+        on_complete = progress.complete
+        if events is not None:
+            on_result = self._publishing(on_result, lambda result: events.publish("result", result=result))
+            on_progress = self._publishing(on_progress, lambda completed, total: events.publish(
+                "progress", completed=completed, total=total, fraction=progress.fraction,
+                remaining=progress.remaining_seconds()))
+
+        started = time.perf_counter()
+        results = []
+        client = DaemonClient.connect() if self.use_daemon else None
+        if client is not None:
+            logger.info(f"提交到本地转换服务 (PID {client.pid})")
+            results, tasks = client.run(tasks, self._daemon_options(), on_result, on_progress, self.cancel_event,
+                                        on_complete)
+            if tasks is not None:
+                logger.warning("转换服务连接中断或出错，其余任务改为在进程内转换")
+                on_progress = self._offset_progress(on_progress, len(results))
+                on_complete = self._offset_complete(on_complete, len(results))
+        if tasks is not None and not self.inkscape_path:
+            logger.error("未找到Inkscape，且本地转换服务不可用")
+            for task in tasks:
+                result = TaskResult(task, False, "未找到Inkscape")
+                results.append(result)
+                if on_result is not None:
+                    on_result(result)
+        elif tasks is not None:
+            results += self._run_in_process(tasks, on_result, on_progress, on_complete)
+        self.last_metrics = BatchMetrics(results, time.perf_counter() - started)
+        self._report(self.last_metrics)
+        self._record_history(results)
+        return results
+
+    @staticmethod
+    def _staged(tasks, staging, roots, archive):
+        """
+        把任务的输出改到临时目录中：每个任务使用单独的子目录 (序号/成员名)，
+        输出在压缩包中重名的任务也不会写到同一个临时文件；成员名记在task.output_member中
+        """
+        def stage(number, task):
+            name = output_member_name(task, roots)
+            output_path = staging / str(number) / name
+            output_path.parent.mkdir(parents=True, exist_ok=True)
+            return replace(task, output_path=output_path, output_member=ArchiveMember(str(archive), name))
+
+        if isinstance(tasks, (list, tuple)):
+            return [stage(number, task) for number, task in enumerate(tasks)]
+        return (stage(number, task) for number, task in enumerate(tasks))
+
+    @staticmethod
+    def _archiving(on_result, writer):
+        """
+        成功的输出写入压缩包后删除临时文件，再调用原有回调
+
+        压缩包中已有同名成员时任务记为失败。结果在写入缓存之后才交付，此时可以删除临时文件。
+        """
+        def archive(result):
+            output_path = result.task.output_path
+            name = result.task.output_member.name
+            if result.success:
+                try:
+                    writer.add(output_path, name)
+                except OSError as e:
+                    logger.error(f"无法写入输出压缩包 {name}: {e}")
+                    result.success = False
+                    result.error = f"无法写入输出压缩包: {e}"
+            try:
+                output_path.unlink()
+            except OSError:
+                pass
+            result.task = replace(result.task, output_path=Path(f"{writer.path}!{name}"))
+            if on_result is not None:
+                on_result(result)
+        return archive
+
+    def _record_history(self, results):
+        """把本批任务的实际耗时记入历史记录"""
+        for result in results:
+            self.history.record(result)
+        try:
+            self.history.save()
+        except OSError as e:
+            logger.warning(f"无法保存耗时记录: {e}")
+
+    def _run_in_process(self, tasks, on_result, on_progress, on_complete=None):
+        scheduler = ConversionScheduler(
+            self.inkscape_path,
+            workers=self.workers,
+            cache=self.create_cache(),
+            force_rebuild=self.force_rebuild,
+            backends=self.backends,
+            timeout=self.timeout,
+            retry=self.retry,
+            cancel_event=self.cancel_event,
+            memory_budget=self.memory_budget,
+            preflight=self.preflight,
+            png_compression=self.png_compression,
+            history=self.history,
+            tile_threshold=self.tile_threshold,
+            verify_tiles=self.verify_tiles
+        )
+        return scheduler.run(tasks, on_result=on_result, on_progress=on_progress, on_complete=on_complete)
+
+    def _daemon_options(self):
+        """提交给转换服务的转换设置"""
+        return {
+            "workers": self.workers,
+            "use_cache": self.use_cache,
+            "force_rebuild": self.force_rebuild,
+            "inkscape_only": not self.backends.names,
+            "timeout": self.timeout,
+            "retry": retry_to_dict(self.retry),
+            "preflight": self.preflight,
+            "png_compression": self.png_compression,
+            "tile_threshold": self.tile_threshold,
+            "verify_tiles": self.verify_tiles,
+        }
+
+    @staticmethod
+    def _offset_progress(on_progress, offset):
+        """转换服务已完成offset个任务后改为进程内执行，进度接着之前的计数"""
+        if on_progress is None:
+            return None
+        return lambda completed, total: on_progress(completed + offset, total + offset)
+
+    @staticmethod
+    def _offset_complete(on_complete, offset):
+        """进程内执行的任务序号从0开始，换算为整批任务中的序号"""
+        return lambda index: on_complete(index + offset)
+
+    def _report(self, metrics):
+        """记录本批转换的统计，并按设置写出报告文件"""
+        summary = metrics.summary()
+        if not summary["tasks"]:
+            return
+        # 统计各后端处理的任务数，便于比较不同后端的效果
+        logger.info("各后端完成的任务数: " + ", ".join(
+            f"{name} {count}" for name, count in sorted(summary["backends"].items())))
+        logger.info(f"共 {summary['tasks']} 个任务，耗时 {summary['wall_seconds']:.2f} 秒，"
+                    f"{summary['tasks_per_second']:.2f} 任务/秒")
+        for format_name, stats in summary["formats"].items():
+            logger.info(f"{format_name}: {stats['tasks']} 个任务，"
+                        f"p50 {stats['p50_seconds']:.3f} 秒，p95 {stats['p95_seconds']:.3f} 秒")
+        memory = summary["memory"]
+        if memory["measured_tasks"]:
+            logger.info(f"Inkscape峰值内存 {memory['peak_rss_bytes'] / MB:.0f} MB，"
+                        f"实测/估计 中位数 {memory['estimate_ratio_p50']:.2f}，"
+                        f"最大 {memory['estimate_ratio_max']:.2f}")
+        if summary["preflight_saved_bytes"]:
+            logger.info(f"SVG预处理共减少 {summary['preflight_saved_bytes'] / MB:.1f} MB，"
+                        f"耗时 {summary['stage_seconds']['preflight']:.2f} 秒")
+        if summary["compressed_saved_bytes"]:
+            logger.info(f"PNG压缩共减少 {summary['compressed_saved_bytes'] / MB:.1f} MB，"
+                        f"耗时 {summary['stage_seconds']['compress']:.2f} 秒")
+        if self.metrics_dir is None:
+            return
+        try:
+            json_path, prom_path = metrics.write_reports(self.metrics_dir)
+            logger.info(f"统计报告已写入: {json_path}, {prom_path}")
+        except OSError as e:
+            logger.warning(f"无法写入统计报告: {e}")
+
+    @staticmethod
+    def _publishing(callback, publish):
+        """在原有回调之后再发布事件"""
+        def wrapper(*args):
+            if callback is not None:
+                callback(*args)
+            publish(*args)
+        return wrapper
@@ -0,0 +1,40 @@
+import queue
+from dataclasses import dataclass, field
+
+
+@dataclass
+class Event:
+    """
+    转换过程中发布的事件
+
+    kind 为事件类型，例如 "status"、"progress"、"result"、"finished"，
+    data 为事件携带的数据。
+    """
+    kind: str
+    data: dict = field(default_factory=dict)
+
+
+class EventBus:
+    """
+    线程安全的事件队列
+
+    工作线程通过publish发布事件，界面线程定时调用drain一次取出全部事件，
+    工作线程不直接操作任何界面组件。
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+
+    def publish(self, kind, **data):
+        """发布一个事件，可以在任意线程中调用"""
+        self._queue.put(Event(kind, data))
+
+    def drain(self, max_events=None):
+        """不阻塞地取出当前队列中的事件，最多max_events个"""
+        events = []
+        while max_events is None or len(events) < max_events:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
@@ -0,0 +1,30 @@
+"""
+支持的输入和输出格式
+"""
+
+# 支持的输出文件类型
+FILE_TYPES = {
+    "PNG": "png",
+    # "JPEG": "jpg",  # 已移除JPEG输出格式
+    "SVG": "svg",   # 已移除SVG输出格式
+    "PDF": "pdf",
+    "EPS": "eps",
+    "EMF": "emf",
+}
+
+# 定义位图和矢量图格式
+BITMAP_FORMATS = ['.png', '.jpg', '.jpeg', '.tiff', '.bmp', '.gif']
+VECTOR_FORMATS = ['.svg', '.pdf', '.eps', '.ps', '.emf']
+
+# 定义输出格式类型（位图/矢量图）
+OUTPUT_FORMAT_TYPES = {
+    'PNG': 'bitmap',
+    'TIFF': 'bitmap',
+    'SVG': 'vector',
+    'PDF': 'vector',
+    'EPS': 'vector',
+    'EMF': 'vector'
+}
+
+# 可以作为输入的文件扩展名
+VALID_EXTENSIONS = ['.svg', '.png', '.jpg', '.jpeg', '.pdf', '.eps', '.ps', '.emf', '.tiff', '.bmp', '.gif']
@@ -0,0 +1,962 @@
+import base64
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+import tkinter as tk
+from collections import Counter, deque
+from pathlib import Path
+from tkinter import filedialog, messagebox, ttk
+from tkinter.scrolledtext import ScrolledText
+
+from tkinterdnd2 import DND_FILES, TkinterDnD
+
+from . import STARTED_AT
+from .archives import is_archive
+from .cache import DEFAULT_MAX_BYTES
+from .discovery import resolve_inkscape, save_inkscape
+from .engine import ConversionEngine
+from .events import EventBus
+from .formats import BITMAP_FORMATS, FILE_TYPES, OUTPUT_FORMAT_TYPES, VALID_EXTENSIONS, VECTOR_FORMATS
+from .history import format_seconds
+from .inkscape import get_inkscape_version
+from .ingest import FolderWatcher, iter_input_files
+from .jobs import CANCELLED, DONE, FAILED, PENDING, RUNNING, JobStore
+from .logs import setup_logging
+from .scheduler import DEFAULT_TASK_TIMEOUT, default_worker_count
+from .tasks import parse_dpi_list, resolve_name_template
+from .thumbnails import THUMBNAIL_SIZE, ThumbnailService
+
+# 界面处理工作线程事件的周期（毫秒），进度和状态最多以这个频率刷新
+EVENT_PUMP_INTERVAL_MS = 100
+# 每个周期最多处理的事件数，其余留到下个周期，保证界面始终能响应
+EVENT_PUMP_MAX_EVENTS = 5000
+
+# 文件列表每次最多插入的行数，大量文件分多次插入，界面不会长时间无响应
+ROW_INSERT_BATCH = 1000
+
+# 列表停止滚动多久（毫秒）后请求可见行的缩略图，快速滚动经过的行不生成
+THUMBNAIL_REQUEST_DELAY_MS = 150
+
+# 文件列表中显示的状态
+STATE_LABELS = {PENDING: "等待", RUNNING: "转换中", DONE: "完成", FAILED: "失败", CANCELLED: "已取消"}
+
+DROP_HINT = "请拖拽文件到此处或点击\"添加文件\"按钮..."
+
+# PNG输出重新压缩的选项
+PNG_COMPRESSION_LABELS = {None: "不压缩", "fast": "快速", "max": "最大"}
+
+
+class FigConverter(TkinterDnD.Tk):
+    """
+    主应用程序类 - 处理图像格式转换
+    """
+    def __init__(self, workers=None, cache_options=None, inkscape_path=None, watch_interval=2.0,
+                 metrics_dir=None, measure_startup=False, task_timeout=DEFAULT_TASK_TIMEOUT, retry=None,
+                 memory_budget=None, preflight=False, use_daemon=True, png_compression=None, thumbnails=True,
+                 tile_threshold=None):
+        super().__init__()
+        
+        # 设置窗口属性
+        self.title("图片格式转换工具")
+        self.geometry("600x500")
+        self.minsize(500, 400)
+        
+        # 支持的输出文件类型
+        self.file_types = dict(FILE_TYPES)
+        
+        # 定义位图和矢量图格式
+        self.bitmap_formats = list(BITMAP_FORMATS)
+        self.vector_formats = list(VECTOR_FORMATS)
+        
+        # 定义输出格式类型（位图/矢量图）
+        self.output_format_types = dict(OUTPUT_FORMAT_TYPES)
+        
+        # 选择的输出文件类型
+        self.selected_types = {}
+        
+        # 要转换的文件及其状态
+        self.jobs = JobStore()
+        # 等待插入文件列表的文件
+        self._pending_rows = deque()
+        self._rows_inserted = 0
+        
+        # DPI设置，默认为300
+        self.dpi_value = tk.IntVar(value=300)
+        # 同时导出的其他DPI（逗号分隔）和位图输出文件名模板，为空时使用默认文件名
+        self.extra_dpis = tk.StringVar(value="")
+        self.name_template = tk.StringVar(value="")
+        
+        # 并发转换数，默认为CPU核心数
+        self.worker_count = tk.IntVar(value=workers or default_worker_count())
+        
+        # 转换缓存设置
+        self.cache_options = cache_options or {}
+        self.use_cache = tk.BooleanVar(value=self.cache_options.get("enabled", True))
+        self.force_rebuild = tk.BooleanVar(value=self.cache_options.get("force_rebuild", False))
+        
+        # 转换前清理SVG文档（删除元数据、未使用的定义等）
+        self.preflight = tk.BooleanVar(value=preflight)
+        # PNG输出的重新压缩模式
+        self.png_compression = tk.StringVar(value=PNG_COMPRESSION_LABELS[png_compression])
+        # 输出压缩包的路径，为空时输出写在源文件旁
+        self.output_archive = tk.StringVar(value="")
+        # 加入的文件夹，其中文件的输出在输出压缩包中保留相对于文件夹的路径
+        self._input_roots = []
+        
+        # 监视文件夹设置
+        self.watch_interval = watch_interval
+        self._watch_stop = None
+        
+        # 每批转换的统计报告写出的目录，为None时不写
+        self.metrics_dir = metrics_dir
+        
+        # 单个任务的超时和失败重试策略
+        self.task_timeout = task_timeout
+        self.retry = retry
+        # Inkscape任务的内存预算（字节），为None时不限制
+        self.memory_budget = memory_budget
+        # 本地转换服务正在运行时把任务提交给它
+        self.use_daemon = use_daemon
+        # 大幅位图分块渲染的像素阈值，为None时不分块
+        self.tile_threshold = tile_threshold
+        # 进行中的转换（手动转换和监视中的每一批）的取消请求 -> 所属监视的停止事件（手动转换为None）
+        self._running = {}
+        self._running_lock = threading.Lock()
+        # 界面已收到开始、尚未收到结束的转换数，为0时取消按钮不可用
+        self._active_batches = 0
+        # 文件列表中显示缩略图
+        self.show_thumbnails = thumbnails
+        
+        # 创建GUI组件
+        self._create_widgets()
+        
+        # 设置日志
+        self._setup_logging()
+        
+        # 工作线程通过事件队列向界面报告进度和结果
+        self.events = EventBus()
+        self._batch_errors = []
+        self.after(EVENT_PUMP_INTERVAL_MS, self._pump_events)
+        
+        # 缩略图由后台线程以低优先级生成，只生成可见行的；界面只保留可见行的图片
+        self.thumbnails = None
+        self._thumbnail_images = {}
+        self._thumbnail_rows = {}
+        self._thumbnail_request = None
+        if thumbnails:
+            self.thumbnails = ThumbnailService(
+                lambda path, data: self.events.publish("thumbnail", path=path, data=data),
+                inkscape_path=inkscape_path)
+        
+        # 检查Inkscape（在后台线程中进行，不阻塞窗口显示）
+        self.inkscape_path = inkscape_path
+        self._checking_inkscape = False
+        if self.inkscape_path:
+            self.status_var.set(f"已设置Inkscape: {self.inkscape_path}")
+        else:
+            self._check_inkscape()
+        
+        # 窗口可以响应操作时记录启动耗时
+        self._measure_startup = measure_startup
+        self.after_idle(self._report_startup_time)
+    
+    def _create_widgets(self):
+        """创建GUI组件"""
+        # 创建主框架
+        main_frame = ttk.Frame(self)
+        main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        
+        # 创建顶部区域 - 输出格式选择
+        format_outer_frame = ttk.Frame(main_frame)
+        format_outer_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        format_frame = ttk.LabelFrame(format_outer_frame, text="选择输出格式")
+        format_frame.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        # 添加重置格式按钮到右侧
+        reset_format_button = ttk.Button(
+            format_outer_frame, 
+            text="重置格式", 
+            command=self._reset_format_options
+        )
+        reset_format_button.pack(side=tk.RIGHT, padx=5, pady=5)
+        
+        # 在网格中添加复选框
+        self.format_checkbuttons = {}
+        row, col = 0, 0
+        for file_type in self.file_types:
+            var = tk.BooleanVar(value=False)
+            self.selected_types[file_type] = var
+            chk = ttk.Checkbutton(format_frame, text=file_type, variable=var, command=self._update_button_state)
+            self.format_checkbuttons[file_type] = chk
+            chk.grid(row=row, column=col, sticky=tk.W, padx=5, pady=2)
+            col += 1
+            if col > 4:  # 每行显示4个选项
+                col = 0
+                row += 1
+        
+        # 创建DPI设置框架
+        dpi_frame = ttk.LabelFrame(main_frame, text="位图DPI设置 (仅对PNG、TIFF等位图格式生效)")
+        dpi_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        # 添加DPI滑动条
+        ttk.Label(dpi_frame, text="DPI:").grid(row=0, column=0, padx=5, pady=5)
+        dpi_scale = ttk.Scale(dpi_frame, from_=72, to=600, variable=self.dpi_value, 
+                             orient=tk.HORIZONTAL, length=200)
+        dpi_scale.grid(row=0, column=1, padx=5, pady=5, sticky=tk.W+tk.E)
+        
+        # 添加DPI数值显示和输入框
+        dpi_entry = ttk.Entry(dpi_frame, textvariable=self.dpi_value, width=5)
+        dpi_entry.grid(row=0, column=2, padx=5, pady=5)
+        ttk.Label(dpi_frame, text="(72-600)").grid(row=0, column=3, padx=5, pady=5, sticky=tk.W)
+        
+        # 同一文档一次加载导出多个DPI
+        ttk.Label(dpi_frame, text="其他DPI:").grid(row=1, column=0, padx=5, pady=5)
+        ttk.Entry(dpi_frame, textvariable=self.extra_dpis).grid(row=1, column=1, padx=5, pady=5, sticky=tk.W+tk.E)
+        ttk.Label(dpi_frame, text="逗号分隔，例如 192,288").grid(
+            row=1, column=2, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(dpi_frame, text="文件名模板:").grid(row=2, column=0, padx=5, pady=5)
+        ttk.Entry(dpi_frame, textvariable=self.name_template).grid(
+            row=2, column=1, padx=5, pady=5, sticky=tk.W+tk.E)
+        ttk.Label(dpi_frame, text="可用 {stem} {dpi} {scale} {page} {ext}，例如 {stem}@{scale}x.{ext}").grid(
+            row=2, column=2, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        
+        # 创建转换选项框架
+        options_frame = ttk.LabelFrame(main_frame, text="转换选项")
+        options_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        # 添加并发数设置
+        ttk.Label(options_frame, text="并发数:").grid(row=0, column=0, padx=5, pady=5)
+        worker_spinbox = ttk.Spinbox(options_frame, from_=1, to=max(64, default_worker_count()), 
+                                     textvariable=self.worker_count, width=4)
+        worker_spinbox.grid(row=0, column=1, padx=5, pady=5)
+        
+        # 添加缓存选项
+        ttk.Checkbutton(options_frame, text="跳过未变化的文件", variable=self.use_cache).grid(
+            row=0, column=2, padx=5, pady=5, sticky=tk.W)
+        ttk.Checkbutton(options_frame, text="强制重新转换", variable=self.force_rebuild).grid(
+            row=0, column=3, padx=5, pady=5, sticky=tk.W)
+        ttk.Checkbutton(options_frame, text="预处理SVG", variable=self.preflight).grid(
+            row=0, column=4, padx=5, pady=5, sticky=tk.W)
+        ttk.Label(options_frame, text="PNG压缩:").grid(row=1, column=0, padx=5, pady=5)
+        ttk.Combobox(options_frame, textvariable=self.png_compression, values=list(PNG_COMPRESSION_LABELS.values()),
+                     state="readonly", width=6).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Label(options_frame, text="输出压缩包:").grid(row=1, column=2, padx=5, pady=5, sticky=tk.E)
+        ttk.Entry(options_frame, textvariable=self.output_archive).grid(
+            row=1, column=3, columnspan=2, padx=5, pady=5, sticky=tk.W+tk.E)
+        
+        # 创建拖放区域
+        drop_frame = ttk.LabelFrame(main_frame, text="拖拽文件到此处")
+        drop_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        # 文件列表：Treeview只绘制可见的行，上万个文件也能流畅滚动
+        list_frame = ttk.Frame(drop_frame)
+        list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        if self.show_thumbnails:
+            # 第一列显示缩略图，行高按缩略图大小设置
+            ttk.Style(self).configure("Thumbnails.Treeview", rowheight=THUMBNAIL_SIZE + 4)
+            self.file_list = ttk.Treeview(list_frame, columns=("path", "state"), show=("tree", "headings"),
+                                          height=8, style="Thumbnails.Treeview")
+            self.file_list.column("#0", stretch=False, width=THUMBNAIL_SIZE + 12, anchor=tk.CENTER)
+        else:
+            self.file_list = ttk.Treeview(list_frame, columns=("path", "state"), show="headings", height=10)
+        self.file_list.heading("path", text="文件")
+        self.file_list.heading("state", text="状态")
+        self.file_list.column("path", stretch=True, width=450)
+        self.file_list.column("state", stretch=False, width=80, anchor=tk.CENTER)
+        self.file_list.tag_configure(FAILED, foreground="red")
+        self.list_scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.file_list.yview)
+        # 列表滚动、改变大小或插入行时都会调用，借此更新可见行的缩略图
+        self.file_list.configure(yscrollcommand=self._on_list_scrolled)
+        self.list_scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.file_list.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        
+        # 列表为空时显示的提示
+        self.drop_hint = ttk.Label(list_frame, text=DROP_HINT)
+        self.drop_hint.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+        
+        # 配置拖拽事件
+        for widget in (self.file_list, self.drop_hint):
+            widget.drop_target_register(DND_FILES)
+            widget.dnd_bind('<<Drop>>', self._on_drop)
+        
+        # 创建按钮区域
+        button_frame = ttk.Frame(main_frame)
+        button_frame.pack(fill=tk.X, padx=5, pady=5)
+        
+        # 添加按钮
+        ttk.Button(button_frame, text="添加文件", command=self._add_files).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="添加文件夹", command=self._add_folder).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="清除列表", command=self._clear_files).pack(side=tk.LEFT, padx=5)
+        self.watch_button = ttk.Button(button_frame, text="监视文件夹", command=self._toggle_watch)
+        self.watch_button.pack(side=tk.LEFT, padx=5)
+        
+        # 转换按钮
+        self.convert_button = ttk.Button(button_frame, text="开始转换", command=self._start_conversion)
+        self.convert_button.pack(side=tk.RIGHT, padx=5)
+        
+        # 取消按钮，转换进行中才可用
+        self.cancel_button = ttk.Button(button_frame, text="取消", command=self._cancel_conversion,
+                                        state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.RIGHT, padx=5)
+        
+        # 初始状态下禁用转换按钮
+        self.convert_button.config(state=tk.DISABLED)
+        
+        # 创建状态栏
+        self.status_var = tk.StringVar(value="就绪")
+        status_bar = ttk.Label(self, textvariable=self.status_var, relief=tk.SUNKEN, anchor=tk.W)
+        status_bar.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # 创建进度条
+        self.progress_var = tk.DoubleVar()
+        self.progress_bar = ttk.Progressbar(main_frame, variable=self.progress_var, maximum=100)
+        self.progress_bar.pack(fill=tk.X, padx=5, pady=5)
+    
+    def _setup_logging(self):
+        """设置日志"""
+        # 日志由后台线程写入文件，转换线程不会被磁盘写入阻塞
+        setup_logging(logging.INFO, [
+            logging.StreamHandler(),
+            logging.FileHandler("fig_converter.log")
+        ])
+        self.logger = logging.getLogger("FigConverter")
+    
+    def _check_inkscape(self):
+        """在后台线程中查找Inkscape，结果通过事件队列返回"""
+        self.status_var.set("检查Inkscape安装...")
+        self.logger.info("检查Inkscape安装")
+        self._checking_inkscape = True
+        threading.Thread(target=self._discover_inkscape, daemon=True).start()
+    
+    def _discover_inkscape(self):
+        """后台线程：查找Inkscape及其版本，优先使用配置文件中保存的结果"""
+        try:
+            self.events.publish("inkscape", info=resolve_inkscape(), error=None)
+        except Exception as e:
+            self.events.publish("inkscape", info=None, error=str(e))
+    
+    def _on_inkscape_checked(self, info, error):
+        """处理后台查找Inkscape的结果"""
+        self._checking_inkscape = False
+        if info is not None:
+            self.inkscape_path = info.path
+            self._thumbnail_inkscape_changed()
+            version = f" ({info.version})" if info.version else ""
+            self.status_var.set(f"已找到Inkscape: {info.path}{version}")
+            return
+        
+        if error:
+            self.logger.error(f"检查Inkscape时出错: {error}")
+            self.status_var.set("检查Inkscape失败，请手动选择")
+        else:
+            # 如果没有找到Inkscape
+            self.logger.error("未找到Inkscape，请确保已安装")
+            messagebox.showerror(
+                "错误", 
+                "未找到Inkscape。请安装Inkscape并确保其在系统PATH中，或手动选择Inkscape可执行文件。"
+            )
+        self._select_inkscape_manually()
+    
+    def _inkscape_ready(self):
+        """检查Inkscape是否可用，不可用时提示用户"""
+        if self.inkscape_path:
+            return True
+        if self._checking_inkscape:
+            messagebox.showinfo("提示", "正在查找Inkscape，请稍候再试")
+        else:
+            messagebox.showerror("错误", "Inkscape路径未设置，无法执行转换")
+        return False
+    
+    def _report_startup_time(self):
+        """记录从进程启动到窗口可以操作的耗时"""
+        elapsed = time.time() - STARTED_AT
+        self.logger.info(f"窗口已就绪，启动耗时 {elapsed:.3f} 秒")
+        if self._measure_startup:
+            # 打包为窗口程序时没有标准输出
+            if sys.stdout is not None:
+                print(json.dumps({"startup_seconds": round(elapsed, 4)}), flush=True)
+            self.destroy()
+    
+    def _select_inkscape_manually(self):
+        """手动选择Inkscape可执行文件"""
+        self.logger.info("请求用户手动选择Inkscape可执行文件")
+        if os.name == 'nt':  # Windows
+            file_types = [("Inkscape 可执行文件", "inkscape.exe"), ("所有文件", "*.*")]
+        else:  # Linux/Mac
+            file_types = [("Inkscape 可执行文件", "inkscape"), ("所有文件", "*.*")]
+        
+        path = filedialog.askopenfilename(
+            title="选择Inkscape可执行文件",
+            filetypes=file_types
+        )
+        
+        if path:
+            self.inkscape_path = path
+            self._thumbnail_inkscape_changed()
+            self.logger.info(f"手动选择的Inkscape路径: {path}")
+            self.status_var.set(f"已设置Inkscape: {path}")
+            # 查询版本并保存到配置文件，下次启动时直接使用
+            threading.Thread(target=self._save_inkscape, args=(path,), daemon=True).start()
+        else:
+            self.logger.warning("用户取消了Inkscape选择")
+            self.status_var.set("未设置Inkscape路径，部分功能可能不可用")
+    
+    def _save_inkscape(self, path):
+        """后台线程：把手动选择的Inkscape保存到配置文件"""
+        save_inkscape(path, get_inkscape_version(path))
+    
+    def _on_drop(self, event):
+        """处理文件拖放事件"""
+        # 解析拖放的文件路径
+        paths = self._parse_drop_data(event.data)
+        if paths:
+            self._add_paths(paths)
+    
+    def _parse_drop_data(self, data):
+        """解析拖放数据，提取文件路径列表"""
+        # 拖放数据是Tcl列表，包含空格的路径用花括号括起，交给Tcl解析
+        return [path for path in self.tk.splitlist(data) if path]
+    
+    def _add_paths(self, paths):
+        """添加文件和文件夹，文件夹和压缩包在后台线程中扫描"""
+        files = [path for path in paths if not os.path.isdir(path) and not is_archive(path)]
+        folders = [path for path in paths if os.path.isdir(path) or is_archive(path)]
+        self._input_roots += [path for path in folders if os.path.isdir(path)]
+        if files:
+            self._add_files_to_list(files)
+        if folders:
+            self.status_var.set(f"正在扫描 {len(folders)} 个文件夹或压缩包...")
+            threading.Thread(target=self._scan_folders, args=(folders,), daemon=True).start()
+    
+    def _scan_folders(self, folders):
+        """后台线程：逐批把扫描到的文件加入列表，不必等扫描完成"""
+        batch = []
+        last_flush = time.monotonic()
+        for file_path in iter_input_files(folders):
+            batch.append(file_path)
+            if len(batch) >= 500 or time.monotonic() - last_flush > 0.2:
+                self.events.publish("files", paths=batch, verified=True)
+                batch = []
+                last_flush = time.monotonic()
+        if batch:
+            self.events.publish("files", paths=batch, verified=True)
+        self.events.publish("scan_done")
+        
+    def _add_files_to_list(self, file_paths, verified=False):
+        """
+        添加文件到列表中
+
+        verified为True表示文件来自目录扫描，已确认存在且类型受支持，不再逐个检查。
+        """
+        if verified:
+            candidates = file_paths
+        else:
+            candidates = []
+            for file_path in file_paths:
+                path = Path(file_path)
+                if path.is_file() and path.suffix.lower() in VALID_EXTENSIONS:
+                    candidates.append(file_path)
+                else:
+                    self.logger.warning(f"不支持的文件类型或文件不存在: {file_path}")
+        
+        added = self.jobs.add(candidates)
+        if not added:
+            return
+        
+        # 每批文件只更新一次格式选项：有位图文件时禁用矢量图输出格式
+        bitmap_extensions = {job.extension for job in added} & set(self.bitmap_formats)
+        if bitmap_extensions:
+            self._update_format_options(next(iter(bitmap_extensions)))
+        
+        # 新文件先放入等待队列，分批插入列表
+        self._pending_rows.extend(added)
+        if len(self._pending_rows) == len(added):
+            self._insert_pending_rows()
+        self.status_var.set(f"已添加 {len(added)} 个文件，共 {len(self.jobs)} 个文件待转换")
+        
+        # 更新按钮状态
+        self._update_button_state()
+    
+    def _insert_pending_rows(self):
+        """把等待队列中的文件插入列表，每次最多ROW_INSERT_BATCH行，剩余的在下一次空闲时继续"""
+        if not self._pending_rows:
+            return
+        self.drop_hint.place_forget()
+        for _ in range(min(ROW_INSERT_BATCH, len(self._pending_rows))):
+            job = self._pending_rows.popleft()
+            self.file_list.insert("", tk.END, iid=str(job.index), values=(job.path, STATE_LABELS[job.state]),
+                                  tags=(job.state,))
+            self._rows_inserted += 1
+        if self._pending_rows:
+            self.after(1, self._insert_pending_rows)
+    
+    def _on_list_scrolled(self, first, last):
+        self.list_scrollbar.set(first, last)
+        self._schedule_thumbnails()
+    
+    def _schedule_thumbnails(self):
+        """稍后请求可见行的缩略图，连续滚动时只请求一次"""
+        if self.thumbnails is None or self._thumbnail_request is not None:
+            return
+        self._thumbnail_request = self.after(THUMBNAIL_REQUEST_DELAY_MS, self._request_thumbnails)
+    
+    def _request_thumbnails(self):
+        """请求可见行中还没有缩略图的文件，滚出可见区域的行释放图片"""
+        self._thumbnail_request = None
+        count = self._rows_inserted
+        first, last = self.file_list.yview()
+        visible = range(int(first * count), min(count, math.ceil(last * count) + 1))
+        for iid in [iid for iid in self._thumbnail_images if int(iid) not in visible]:
+            self.file_list.item(iid, image="")
+            del self._thumbnail_images[iid]
+        # 压缩包中的文件没有解压，不生成缩略图
+        self._thumbnail_rows = {job.path: str(job.index) for job in map(self.jobs.at, visible)
+                                if job.member is None and str(job.index) not in self._thumbnail_images}
+        self.thumbnails.request(list(self._thumbnail_rows))
+    
+    def _show_thumbnail(self, path, data):
+        """把后台生成的缩略图显示在对应的行上"""
+        iid = self._thumbnail_rows.get(path)
+        if iid is None or not self.file_list.exists(iid):
+            return
+        try:
+            image = tk.PhotoImage(data=base64.b64encode(data))
+        except tk.TclError:
+            return
+        # 没有Pillow时Inkscape只按宽度缩小，很高的图按整数倍缩小到行高以内
+        factor = math.ceil(max(image.width(), image.height()) / THUMBNAIL_SIZE)
+        if factor > 1:
+            image = image.subsample(factor)
+        self.file_list.item(iid, image=image)
+        self._thumbnail_images[iid] = image
+    
+    def _thumbnail_inkscape_changed(self):
+        """找到Inkscape后生成矢量文件的缩略图"""
+        if self.thumbnails is not None:
+            self.thumbnails.inkscape_path = self.inkscape_path
+            self._schedule_thumbnails()
+    
+    def _update_rows(self, jobs):
+        """只更新状态发生变化的行，尚未插入的行在插入时显示最新状态"""
+        for job in jobs:
+            if job.index < self._rows_inserted:
+                self.file_list.item(str(job.index), values=(job.path, STATE_LABELS[job.state]), tags=(job.state,))
+        
+    def _add_files(self):
+        """添加文件到转换列表"""
+        # 打开文件选择对话框
+        file_types = [
+            ("支持的图像文件", "*.svg *.png *.jpg *.jpeg *.pdf *.eps *.ps *.emf"),
+            ("SVG文件", "*.svg"),
+            ("PNG文件", "*.png"),
+            ("JPEG文件", "*.jpg *.jpeg"),
+            ("PDF文件", "*.pdf"),
+            ("EPS文件", "*.eps"),
+            ("PS文件", "*.ps"),
+            ("EMF文件", "*.emf"),
+            ("压缩包", "*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz"),
+            ("所有文件", "*.*")
+        ]
+        
+        files = filedialog.askopenfilenames(
+            title="选择要转换的图像文件",
+            filetypes=file_types
+        )
+        
+        if files:
+            self._add_paths(files)
+    
+    def _add_folder(self):
+        """添加文件夹中的所有图像文件（包括子文件夹）"""
+        folder = filedialog.askdirectory(title="选择要转换的文件夹")
+        if folder:
+            self._add_paths([folder])
+    
+    def _toggle_watch(self):
+        """开始或停止监视文件夹"""
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+            # 停止监视时同时取消正在进行的转换
+            self._cancel_running(lambda watch: watch is self._watch_stop)
+            self._watch_stop = None
+            self.watch_button.config(text="监视文件夹")
+            self.status_var.set("已停止监视文件夹")
+            return
+        
+        selected_formats = [fmt for fmt, var in self.selected_types.items() if var.get()]
+        if not selected_formats:
+            messagebox.showwarning("警告", "请先选择至少一种输出格式")
+            return
+        if not self._inkscape_ready():
+            return
+        folder = filedialog.askdirectory(title="选择要监视的文件夹")
+        if not folder:
+            return
+        
+        raster_settings = self._raster_settings()
+        if raster_settings is None:
+            return
+        
+        # 监视期间使用开始监视时的转换设置
+        dpis, name_template = raster_settings
+        settings = (selected_formats, dpis, name_template, self._worker_count(),
+                    self.use_cache.get(), self.force_rebuild.get(), self.preflight.get(),
+                    self._png_compression_mode())
+        self._watch_stop = threading.Event()
+        threading.Thread(target=self._watch_folder, args=(folder, settings, self._watch_stop), daemon=True).start()
+        self.watch_button.config(text="停止监视")
+        self.status_var.set(f"正在监视: {folder}")
+        self.logger.info(f"开始监视文件夹: {folder}")
+    
+    def _watch_folder(self, folder, settings, stop_event):
+        """后台线程：轮询文件夹，转换新增或修改的文件"""
+        formats, dpis, name_template, workers, use_cache, force_rebuild, preflight, png_compression = settings
+        watcher = FolderWatcher([folder])
+        watcher.prime()
+        while not stop_event.wait(self.watch_interval):
+            changed = watcher.poll()
+            if not changed:
+                continue
+            self.logger.info(f"发现 {len(changed)} 个新增或修改的文件")
+            self.events.publish("files", paths=changed)
+            # 每一批有自己的取消请求：取消按钮只取消这一批，停止监视时也会取消
+            results = self._execute_conversion(changed, formats, dpis, workers, use_cache, force_rebuild,
+                                               notify=False, cancel_event=threading.Event(),
+                                               name_template=name_template, preflight=preflight,
+                                               png_compression=png_compression, watch=stop_event)
+            # 刚生成的输出文件不再触发转换
+            watcher.ignore(result.task.output_path for result in results if result.success)
+    
+    def _clear_files(self):
+        """清除文件列表"""
+        self.jobs.clear()
+        self._input_roots = []
+        self._pending_rows.clear()
+        self._rows_inserted = 0
+        self._thumbnail_images.clear()
+        self._thumbnail_rows = {}
+        if self.thumbnails is not None:
+            self.thumbnails.request([])
+        self.file_list.delete(*self.file_list.get_children())
+        self.drop_hint.place(relx=0.5, rely=0.5, anchor=tk.CENTER)
+        self.status_var.set("文件列表已清除")
+        
+        # 更新按钮状态
+        self._update_button_state()
+    
+    def _reset_format_options(self):
+        """重置所有格式选项为可选状态"""
+        for format_name in self.file_types:
+            self.selected_types[format_name].set(False)
+            self.format_checkbuttons[format_name].config(state=tk.NORMAL)
+        
+        # 更新转换按钮状态
+        self._update_button_state()
+        
+        # 显示状态信息
+        self.status_var.set("格式选项已重置")
+    
+    def _update_format_options(self, file_extension):
+        """根据文件类型禁用不兼容的输出格式"""
+        # 判断文件是位图还是矢量图
+        is_bitmap = file_extension.lower() in self.bitmap_formats
+        
+        # 对于位图文件，禁用矢量图输出格式
+        if is_bitmap:
+            for format_name, format_type in self.output_format_types.items():
+                if format_type == 'vector':
+                    # 禁用复选框并取消选择
+                    self.format_checkbuttons[format_name].config(state=tk.DISABLED)
+                    self.selected_types[format_name].set(False)
+        
+        # DPI设置框架始终显示，不再根据文件类型隐藏
+    
+    def _update_button_state(self):
+        """更新转换按钮状态"""
+        # 检查是否有选择的输出格式
+        has_selected_format = any(var.get() for var in self.selected_types.values())
+        
+        # 启用或禁用转换按钮
+        if has_selected_format:
+            self.convert_button.config(state=tk.NORMAL)
+        else:
+            self.convert_button.config(state=tk.DISABLED)
+    
+    def _start_conversion(self):
+        """开始转换流程"""
+        # 检查是否有文件要转换
+        if not len(self.jobs):
+            messagebox.showwarning("警告", "没有选择要转换的文件")
+            return
+        
+        # 检查是否选择了输出格式
+        selected_formats = [fmt for fmt, var in self.selected_types.items() if var.get()]
+        if not selected_formats:
+            messagebox.showwarning("警告", "请选择至少一种输出格式")
+            return
+        
+        # 检查Inkscape是否可用
+        if not self._inkscape_ready():
+            return
+        
+        raster_settings = self._raster_settings()
+        if raster_settings is None:
+            return
+        dpis, name_template = raster_settings
+        output_archive = self.output_archive.get().strip() or None
+        if output_archive and not is_archive(output_archive):
+            messagebox.showerror("错误", "输出压缩包需要 .zip 或 .tar(.gz/.bz2/.xz) 文件名")
+            return
+            
+        # 创建一个新线程执行转换，以免阻塞UI
+        conversion_thread = threading.Thread(
+            target=self._execute_conversion,
+            args=(self.jobs.paths(), selected_formats, dpis, self._worker_count(),
+                  self.use_cache.get(), self.force_rebuild.get()),
+            kwargs={"cancel_event": threading.Event(), "name_template": name_template,
+                    "preflight": self.preflight.get(), "png_compression": self._png_compression_mode(),
+                    "output_archive": output_archive}
+        )
+        conversion_thread.daemon = True
+        conversion_thread.start()
+        
+        self.status_var.set("开始转换...")
+        self.progress_var.set(0)
+    
+    def _raster_settings(self):
+        """读取位图导出设置，返回 (DPI列表, 文件名模板)；设置无效时提示并返回None"""
+        try:
+            dpis = parse_dpi_list(f"{self.dpi_value.get()},{self.extra_dpis.get()}")
+            name_template = resolve_name_template(self.name_template.get().strip(), dpis)
+        except (ValueError, tk.TclError) as e:
+            messagebox.showerror("错误", f"位图DPI设置无效: {e}")
+            return None
+        return dpis, name_template
+    
+    def _worker_count(self):
+        """界面中设置的并行转换数，输入无效时使用默认值"""
+        try:
+            return max(1, self.worker_count.get())
+        except tk.TclError:
+            self.logger.warning("并行转换数无效，使用默认值")
+            self.worker_count.set(default_worker_count())
+            return default_worker_count()
+    
+    def _png_compression_mode(self):
+        """界面中选择的PNG压缩模式，不压缩时为None"""
+        for mode, label in PNG_COMPRESSION_LABELS.items():
+            if label == self.png_compression.get():
+                return mode
+        return None
+    
+    def _cancel_conversion(self):
+        """取消当前转换：排队中的任务不再执行，正在运行的Inkscape进程被结束"""
+        if self._cancel_running(lambda watch: True):
+            self.cancel_button.config(state=tk.DISABLED)
+            self.status_var.set("正在取消转换...")
+            self.logger.info("用户取消转换")
+    
+    def _cancel_running(self, matches):
+        """取消所属监视满足matches(监视的停止事件)的进行中的转换，返回取消的数量"""
+        with self._running_lock:
+            events = [event for event, watch in self._running.items() if matches(watch)]
+        for event in events:
+            event.set()
+        return len(events)
+    
+    def _execute_conversion(self, files, formats, dpi, workers, use_cache, force_rebuild, notify=True,
+                            cancel_event=None, name_template=None, preflight=False, png_compression=None,
+                            output_archive=None, watch=None):
+        """
+        执行实际的文件转换，返回转换结果列表
+
+        在工作线程中运行，只通过事件队列向界面报告状态，不直接操作界面组件。
+        dpi可以是DPI列表，位图格式为每个DPI各导出一个文件；cancel_event被设置时取消转换。
+        preflight为True时SVG文档先经过预处理再交给Inkscape；png_compression为PNG输出的重新压缩模式；
+        设置output_archive时输出写入该压缩包。监视文件夹的转换由watch给出监视的停止事件，停止监视时取消转换。
+        """
+        results = []
+        cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        with self._running_lock:
+            self._running[cancel_event] = watch
+        # 登记之前已经停止监视时不会被取消，在这里补上
+        if watch is not None and watch.is_set():
+            cancel_event.set()
+        self.events.publish("started")
+        try:
+            engine = ConversionEngine(
+                self.inkscape_path,
+                workers=workers,
+                use_cache=use_cache,
+                force_rebuild=force_rebuild,
+                cache_dir=self.cache_options.get("cache_dir"),
+                cache_max_bytes=self.cache_options.get("max_bytes", DEFAULT_MAX_BYTES),
+                file_types=self.file_types,
+                metrics_dir=self.metrics_dir,
+                timeout=self.task_timeout,
+                retry=self.retry,
+                cancel_event=cancel_event,
+                memory_budget=self.memory_budget,
+                preflight=preflight,
+                use_daemon=self.use_daemon,
+                png_compression=png_compression,
+                output_archive=output_archive,
+                tile_threshold=self.tile_threshold,
+                input_roots=self._input_roots
+            )
+            
+            # 首先构建实际需要转换的任务（排除相同格式）
+            tasks, skipped_tasks = engine.build_tasks(files, formats, dpi, name_template)
+            total_tasks = len(tasks)
+            total_files = len(files)
+            total_formats = len(formats)
+            
+            # 界面据此显示每个文件的转换状态
+            self.events.publish("queued", paths=files,
+                                task_counts=Counter(str(task.input_path) for task in tasks))
+            
+            if len(skipped_tasks) > 0:
+                self.logger.info(f"跳过 {len(skipped_tasks)} 个相同格式的转换任务")
+            
+            # 如果没有实际需要转换的任务
+            if total_tasks == 0:
+                self.logger.info("没有需要转换的任务，所有选择的格式与源文件格式相同")
+                self.events.publish("finished", status="没有需要转换的任务", notify=notify,
+                                    message="没有需要转换的任务，所有选择的格式与源文件格式相同")
+                return results
+                
+            self.logger.info(f"开始转换 {total_files} 个文件到 {total_formats} 种格式，实际执行 {total_tasks} 个任务")
+            
+            def on_result(result):
+                task = result.task
+                if result.cache_hit == "fresh":
+                    self.logger.info(f"跳过未变化的文件: {task.output_path}")
+                elif result.cache_hit == "restored":
+                    self.logger.info(f"从缓存恢复: {task.output_path}")
+                elif result.success:
+                    self.logger.info(f"成功转换: {task.output_path} ({result.backend})")
+                elif result.status == "cancelled":
+                    self.logger.info(f"已取消: {task.input_path.name} 到 {task.format_name}")
+                else:
+                    self.logger.error(f"转换 {task.input_path.name} 到 {task.format_name} 失败: {result.error}")
+            
+            results = engine.run(tasks, on_result=on_result, events=self.events)
+            
+            if engine.cancelled:
+                self.logger.info("转换已取消")
+                self.events.publish("finished", status="转换已取消", notify=False, message="")
+                return results
+            
+            # 完成所有转换后
+            self.logger.info("所有转换任务已完成")
+            self.events.publish("finished", status="转换完成", notify=notify, message="所有文件已转换完成")
+            
+        except Exception as e:
+            self.logger.error(f"转换过程中出错: {str(e)}")
+            self.events.publish("failed", message=f"转换过程中出错: {str(e)}")
+        finally:
+            with self._running_lock:
+                del self._running[cancel_event]
+        return results
+    
+    def _pump_events(self):
+        """
+        定时处理工作线程发布的事件
+
+        每个周期只把最后一次的状态和进度写入界面，事件再多也不会阻塞界面刷新。
+        """
+        status = None
+        progress = None
+        for event in self.events.drain(EVENT_PUMP_MAX_EVENTS):
+            data = event.data
+            if event.kind == "inkscape":
+                self._on_inkscape_checked(data["info"], data["error"])
+            elif event.kind == "files":
+                self._add_files_to_list(data["paths"], verified=data.get("verified", False))
+            elif event.kind == "scan_done":
+                status = f"文件夹扫描完成，共 {len(self.jobs)} 个文件待转换"
+            elif event.kind == "queued":
+                self._update_rows(self.jobs.begin(data["paths"], data["task_counts"]))
+            elif event.kind == "thumbnail":
+                self._show_thumbnail(data["path"], data["data"])
+            elif event.kind == "started":
+                self._batch_errors = []
+                # 转换期间不生成新的缩略图，CPU留给转换
+                if self.thumbnails is not None:
+                    self.thumbnails.pause()
+                self._active_batches += 1
+                self.cancel_button.config(state=tk.NORMAL)
+                status, progress = "开始转换...", 0
+            elif event.kind == "progress":
+                status = f"正在转换... ({data['completed']}/{data['total']})"
+                # 进度条按预测耗时加权，大文件不会在最后卡在95%
+                progress = data.get("fraction", data["completed"] / data["total"]) * 100
+                if data.get("remaining") is not None and data["completed"] < data["total"]:
+                    status += f"，预计剩余 {format_seconds(data['remaining'])}"
+            elif event.kind == "result":
+                result = data["result"]
+                cancelled = result.status == "cancelled"
+                if not result.success and not cancelled:
+                    self._batch_errors.append(result)
+                job = self.jobs.record_result(result.task.input_path, result.success, result.error, cancelled)
+                if job is not None:
+                    self._update_rows([job])
+            elif event.kind == "finished":
+                status, progress = data["status"], 100
+                self._batch_ended()
+                if self._batch_errors:
+                    self._show_error_summary(self._batch_errors)
+                    status = f"转换完成，{len(self._batch_errors)} 个任务失败"
+                    self._batch_errors = []
+                elif data["notify"]:
+                    self.after_idle(lambda message=data["message"]: messagebox.showinfo("完成", message))
+            elif event.kind == "failed":
+                status, progress = "转换过程中出错", 100
+                self._batch_ended()
+                self.after_idle(lambda message=data["message"]: messagebox.showerror("错误", message))
+        
+        if status is not None:
+            self.status_var.set(status)
+        if progress is not None:
+            self.progress_var.set(progress)
+        self.after(EVENT_PUMP_INTERVAL_MS, self._pump_events)
+    
+    def _batch_ended(self):
+        """一次转换结束：没有其他进行中的转换时取消按钮不可用，恢复生成缩略图"""
+        self._active_batches = max(0, self._active_batches - 1)
+        if not self._active_batches:
+            self.cancel_button.config(state=tk.DISABLED)
+            self._resume_thumbnails()
+    
+    def _resume_thumbnails(self):
+        """转换结束后继续生成可见行的缩略图"""
+        if self.thumbnails is not None:
+            self.thumbnails.resume()
+            self._schedule_thumbnails()
+    
+    def destroy(self):
+        # 结束正在生成缩略图的Inkscape进程
+        if getattr(self, "thumbnails", None) is not None:
+            self.thumbnails.stop()
+        super().destroy()
+    
+    def _show_error_summary(self, failed_results):
+        """在一个窗口中汇总显示本次转换的全部错误"""
+        window = tk.Toplevel(self)
+        window.title(f"转换错误 ({len(failed_results)} 个任务失败)")
+        window.geometry("600x400")
+        window.transient(self)
+        
+        text = ScrolledText(window, wrap=tk.WORD)
+        text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        for result in failed_results:
+            task = result.task
+            text.insert(tk.END, f"转换 {task.input_path} 到 {task.format_name} 时出错:\n{result.error}\n\n")
+        text.config(state=tk.DISABLED)
+        
+        ttk.Button(window, text="关闭", command=window.destroy).pack(pady=5)
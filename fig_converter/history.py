@@ -0,0 +1,257 @@
+import heapq
+import json
+import logging
+import math
+import os
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+from .paths import user_cache_dir
+
+
+logger = logging.getLogger("FigConverter.history")
+
+HISTORY_NAME = "durations.json"
+HISTORY_VERSION = 1
+
+# 新的测量值在平滑平均中的权重
+SMOOTHING = 0.3
+
+# 没有任何历史记录时的估计：每个任务的固定开销加上按输入大小计算的解析时间
+DEFAULT_TASK_SECONDS = 1.0
+DEFAULT_BYTES_PER_SECOND = 2 * 1024 * 1024
+# 没有历史记录时位图导出按300 DPI为基准，DPI越高渲染越慢
+DEFAULT_REFERENCE_DPI = 300
+
+# 输入大小相差一倍时耗时的变化倍数：文档越大解析越慢，但启动、导出等固定开销不变，按平方根缩放
+SIZE_SCALING = 2 ** 0.5
+
+
+def size_bucket(size):
+    """输入大小的分档：按2的幂划分，同一档内的文件耗时接近"""
+    return max(0, int(size).bit_length() - 1)
+
+
+def format_pair(task):
+    """任务的格式组合，例如 svg>png"""
+    source = Path(task.input_path).suffix.lower().lstrip('.') or "?"
+    return f"{source}>{task.export_type}"
+
+
+def format_seconds(seconds):
+    """把秒数格式化为便于阅读的时长，例如 1小时5分、3分20秒、12秒"""
+    seconds = max(0, int(round(seconds)))
+    if seconds >= 3600:
+        return f"{seconds // 3600}小时{seconds % 3600 // 60}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60}秒"
+    return f"{seconds}秒"
+
+
+def estimate_makespan(unit_costs, workers):
+    """按最长优先把工作单元分配给workers个工作线程，返回预计的总耗时"""
+    if not unit_costs:
+        return 0.0
+    finish = [0.0] * max(1, min(workers, len(unit_costs)))
+    for cost in sorted(unit_costs, reverse=True):
+        heapq.heappush(finish, heapq.heappop(finish) + cost)
+    return max(finish)
+
+
+class DurationHistory:
+    """
+    任务耗时的历史记录
+
+    按 格式组合、输入大小分档、DPI（仅位图）记录每类任务耗时的平滑平均，保存在用户缓存目录中。
+    预测时优先使用完全相同的分类；没有时取同一格式组合中大小和DPI最接近的记录按比例换算；
+    再没有时按输入大小粗略估计。多个进程同时写入时与文件中的内容合并。
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else user_cache_dir() / HISTORY_NAME
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._changed = set()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"无法读取耗时记录，将重新建立: {e}")
+            return
+        if data.get("version") == HISTORY_VERSION:
+            self._entries = data.get("entries", {})
+
+    def save(self):
+        """写回记录文件，只覆盖本进程更新过的分类"""
+        with self._lock:
+            changed = {key: dict(self._entries[key]) for key in self._changed}
+            self._changed.clear()
+        if not changed:
+            return
+        entries = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                on_disk = json.load(f)
+            if on_disk.get("version") == HISTORY_VERSION:
+                entries = on_disk.get("entries", {})
+        except (OSError, ValueError):
+            pass
+        entries.update(changed)
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_name(f"{HISTORY_NAME}.{os.getpid()}.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": HISTORY_VERSION, "entries": entries}, f)
+        os.replace(temp_path, self.path)
+
+    @staticmethod
+    def _classify(task):
+        """任务的分类 (格式组合, 大小分档, DPI)，矢量导出的DPI记为0"""
+        size = task.input_size()
+        return format_pair(task), size_bucket(size), task.dpi if task.is_raster else 0, size
+
+    @staticmethod
+    def _key(pair, bucket, dpi):
+        return f"{pair}|{bucket}|{dpi}"
+
+    def record(self, result):
+        """记录一个结果的耗时：只记录实际执行成功的任务，命中缓存和失败的任务不计"""
+        if not result.success or result.backend == "cache" or result.timing.wall <= 0:
+            return
+        pair, bucket, dpi, _ = self._classify(result.task)
+        key = self._key(pair, bucket, dpi)
+        seconds = result.timing.wall
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = {"pair": pair, "size_bucket": bucket, "dpi": dpi, "seconds": seconds, "count": 0}
+            else:
+                entry = dict(entry, seconds=(1 - SMOOTHING) * entry["seconds"] + SMOOTHING * seconds)
+            entry["count"] += 1
+            self._entries[key] = entry
+            self._changed.add(key)
+
+    def predict(self, task):
+        """预测任务的耗时（秒），返回 (秒数, 是否有历史记录)"""
+        pair, bucket, dpi, size = self._classify(task)
+        with self._lock:
+            entry = self._entries.get(self._key(pair, bucket, dpi))
+            if entry is not None:
+                return entry["seconds"], True
+            candidates = [entry for entry in self._entries.values() if entry["pair"] == pair]
+        if not candidates:
+            seconds = DEFAULT_TASK_SECONDS + size / DEFAULT_BYTES_PER_SECOND
+            if dpi:
+                seconds *= max(1.0, dpi / DEFAULT_REFERENCE_DPI)
+            return seconds, False
+
+        def distance(entry):
+            dpi_distance = abs(math.log2(dpi / entry["dpi"])) if dpi and entry["dpi"] else 0
+            return abs(entry["size_bucket"] - bucket) + dpi_distance
+
+        nearest = min(candidates, key=distance)
+        seconds = nearest["seconds"] * SIZE_SCALING ** (bucket - nearest["size_bucket"])
+        if dpi and nearest["dpi"]:
+            # 渲染时间随像素数增长，但任务中还有与DPI无关的开销，按DPI的比例（而不是像素数的比例）换算
+            seconds *= dpi / nearest["dpi"]
+        return seconds, True
+
+
+@dataclass
+class PlannedTask:
+    """转换计划中的一个任务及其预测耗时"""
+    task: object
+    seconds: float
+    from_history: bool
+
+
+class BatchPlan:
+    """
+    一批任务的执行计划：按预测耗时从长到短排列的工作单元和预计总耗时
+
+    同一文档的任务与调度器一样放在一个工作单元中（只加载一次）。
+    """
+
+    def __init__(self, tasks, history, workers):
+        self.workers = max(1, workers)
+        self.tasks = []
+        documents = {}
+        for task in tasks:
+            seconds, from_history = history.predict(task)
+            planned = PlannedTask(task, seconds, from_history)
+            self.tasks.append(planned)
+            documents.setdefault(task.document_key, []).append(planned)
+        self.units = sorted(documents.values(), key=lambda unit: sum(item.seconds for item in unit), reverse=True)
+
+    @property
+    def total_seconds(self):
+        """全部任务预测耗时之和（单个工作线程依次执行所需的时间）"""
+        return sum(item.seconds for item in self.tasks)
+
+    @property
+    def estimated_seconds(self):
+        """workers个工作线程并发执行时预计的总耗时"""
+        return estimate_makespan([sum(item.seconds for item in unit) for unit in self.units], self.workers)
+
+    def describe(self):
+        known = sum(1 for item in self.tasks if item.from_history)
+        return (f"共 {len(self.tasks)} 个任务（{len(self.units)} 个文档），"
+                f"其中 {known} 个有历史耗时记录；预测耗时合计 {format_seconds(self.total_seconds)}，"
+                f"{self.workers} 个并发预计 {format_seconds(self.estimated_seconds)}")
+
+
+class ProgressTracker:
+    """
+    按预测耗时加权的转换进度和剩余时间
+
+    一个大文件和一个小文件不再各占一半进度。剩余时间按已完成任务的实际速度换算，
+    还没有任务完成时使用计划的预计总耗时。
+    """
+
+    def __init__(self, history, workers):
+        self.history = history
+        self.workers = max(1, workers)
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._predictions = []
+        self.total_seconds = 0.0
+        self.done_seconds = 0.0
+
+    def add(self, task):
+        """登记一个即将执行的任务，按登记顺序编号（与调度器的任务序号一致）"""
+        seconds, _ = self.history.predict(task)
+        with self._lock:
+            self._predictions.append(seconds)
+            self.total_seconds += seconds
+
+    def track(self, tasks):
+        """逐个登记迭代器产生的任务，原样产生"""
+        for task in tasks:
+            self.add(task)
+            yield task
+
+    def complete(self, index):
+        with self._lock:
+            if index < len(self._predictions):
+                self.done_seconds += self._predictions[index]
+
+    @property
+    def fraction(self):
+        with self._lock:
+            return self.done_seconds / self.total_seconds if self.total_seconds else 0.0
+
+    def remaining_seconds(self):
+        """预计的剩余时间（秒）"""
+        with self._lock:
+            done, total = self.done_seconds, self.total_seconds
+        elapsed = time.perf_counter() - self.started
+        if done > 0:
+            return (total - done) * elapsed / done
+        return max(0.0, total / self.workers - elapsed)
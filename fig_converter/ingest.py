@@ -0,0 +1,126 @@
+import logging
+import os
+from pathlib import Path
+
+from .archives import is_archive, list_members
+from .formats import VALID_EXTENSIONS
+
+
+logger = logging.getLogger("FigConverter.ingest")
+
+
+def _is_candidate(name, extensions):
+    """目录扫描时是否接受该文件：跳过隐藏文件（包括转换过程中的临时文件）"""
+    return not name.startswith('.') and os.path.splitext(name)[1].lower() in extensions
+
+
+def walk_files(directory, extensions=VALID_EXTENSIONS):
+    """
+    递归扫描目录，逐个返回扩展名符合要求的文件路径
+
+    使用os.scandir按需读取目录，不必等整棵目录树列完就可以开始处理。
+    同一目录中的条目按名称排序，保证结果顺序稳定。
+    """
+    stack = [str(directory)]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"无法读取目录 {current}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        subdirs.append(entry.path)
+                elif entry.is_file() and _is_candidate(entry.name, extensions):
+                    yield entry.path
+            except OSError:
+                continue
+        # 倒序压栈，使子目录按名称顺序处理
+        stack.extend(reversed(subdirs))
+
+
+def iter_input_files(paths, extensions=VALID_EXTENSIONS):
+    """
+    展开文件和目录，逐个返回可以转换的文件路径
+
+    目录会被递归扫描，压缩包逐个返回其中的成员 (ArchiveMember)；不存在或类型不支持的路径记录警告后跳过。
+    """
+    for path in paths:
+        path = str(path)
+        if os.path.isdir(path):
+            yield from walk_files(path, extensions)
+        elif os.path.isfile(path) and is_archive(path):
+            yield from list_members(path, extensions)
+        elif os.path.isfile(path) and Path(path).suffix.lower() in extensions:
+            yield path
+        else:
+            logger.warning(f"不支持的文件类型或文件不存在: {path}")
+
+
+class FolderWatcher:
+    """
+    轮询监视文件夹中新增或修改的文件
+
+    每次轮询只比较文件的 (修改时间, 大小)，不读取文件内容。
+    文件在连续两次轮询中保持不变才会被报告，避免处理还在写入的文件。
+    """
+
+    def __init__(self, folders, extensions=VALID_EXTENSIONS):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.extensions = extensions
+        self._known = {}
+        self._pending = {}
+
+    def snapshot(self):
+        """扫描所有监视的文件夹，返回 {路径: (修改时间, 大小)}"""
+        result = {}
+        for folder in self.folders:
+            for path in walk_files(folder, self.extensions):
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                result[path] = (stat.st_mtime_ns, stat.st_size)
+        return result
+
+    def prime(self):
+        """记录当前状态作为基准，已有的文件不会被当作新文件报告"""
+        self._known = self.snapshot()
+        self._pending = {}
+
+    def poll(self):
+        """返回自上次轮询以来新增或修改、并且已经写入完成的文件"""
+        current = self.snapshot()
+        ready = []
+        pending = {}
+        for path, signature in current.items():
+            if self._known.get(path) == signature:
+                continue
+            if self._pending.get(path) == signature:
+                ready.append(path)
+                self._known[path] = signature
+            else:
+                pending[path] = signature
+        self._pending = pending
+        # 删除的文件不再跟踪，重新出现时会被当作新文件
+        for path in list(self._known):
+            if path not in current:
+                del self._known[path]
+        return ready
+
+    def ignore(self, paths):
+        """把指定文件（例如刚生成的输出文件）的当前状态记为已知，不会触发转换"""
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            self._known[path] = (stat.st_mtime_ns, stat.st_size)
+            self._pending.pop(path, None)
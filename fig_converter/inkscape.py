@@ -0,0 +1,141 @@
+import logging
+import os
+import subprocess
+import time
+
+from .memory import read_peak_rss
+from .process import kill_process_tree, process_group_options
+from .tasks import ERROR_CANCELLED, ERROR_CRASH, ERROR_TIMEOUT, TaskResult, TaskTiming, cancelled_result
+
+
+logger = logging.getLogger("FigConverter.inkscape")
+
+# 等待进程时检查取消请求和采样内存的间隔（秒）
+CANCEL_POLL_SECONDS = 0.2
+
+
+def build_export_command(inkscape_path, task):
+    """构建单次调用Inkscape的导出命令"""
+    cmd = [
+        inkscape_path,
+        str(task.document_path),
+        f"--export-type={task.export_type}",
+        f"--export-filename={str(task.output_path)}"
+    ]
+
+    # 如果是导出位图格式，添加DPI设置
+    if task.is_raster:
+        cmd.append(f"--export-dpi={task.dpi}")
+    # 多页文档只导入指定的一页（PS导入时先转换为PDF，同样适用）
+    if task.page is not None:
+        cmd.append(f"--pdf-page={task.page}")
+    if task.export_area is not None:
+        cmd.append("--export-area=" + ":".join(f"{value:.6f}" for value in task.export_area))
+        cmd.append(f"--export-width={task.export_size[0]}")
+        cmd.append(f"--export-height={task.export_size[1]}")
+    return cmd
+
+
+def decode_output(data):
+    """解码Inkscape的输出，无法解码的字符使用'replace'策略替换"""
+    return data.decode('utf-8', errors='replace') if data else ""
+
+
+def is_crash_exit(returncode):
+    """返回码是否表示进程崩溃：POSIX上被信号结束，Windows上为异常代码 (0xC0000000以上)"""
+    return returncode < 0 or returncode >= 0xC0000000
+
+
+def run_export(inkscape_path, task, timeout=None, cancel_event=None):
+    """
+    启动一个Inkscape进程完成单个导出任务
+
+    超过timeout秒或cancel_event被设置时结束整个进程树。
+    """
+    if cancel_event is not None and cancel_event.is_set():
+        return cancelled_result(task)
+    cmd = build_export_command(inkscape_path, task)
+    logger.debug(f"执行命令: {' '.join(cmd)}")
+    started = time.perf_counter()
+    try:
+        # 不使用text=True，而是手动处理二进制输出
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                   **process_group_options())
+    except OSError as e:
+        return TaskResult(task, False, f"无法启动Inkscape: {e}", error_kind=ERROR_CRASH)
+    spawned = time.perf_counter()
+    deadline = spawned + timeout if timeout else None
+
+    stderr = b""
+    error_kind = ""
+    peak_rss = 0
+    while True:
+        # 进程退出后无法再读取其内存，运行期间定期采样峰值
+        peak_rss = max(peak_rss, read_peak_rss(process.pid))
+        wait = CANCEL_POLL_SECONDS
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.perf_counter())
+            wait = min(wait, remaining)
+        try:
+            _, stderr = process.communicate(timeout=wait)
+            break
+        except subprocess.TimeoutExpired:
+            if cancel_event is not None and cancel_event.is_set():
+                error_kind = ERROR_CANCELLED
+            elif deadline is not None and time.perf_counter() >= deadline:
+                error_kind = ERROR_TIMEOUT
+            else:
+                continue
+            kill_process_tree(process)
+            _, stderr = process.communicate()
+            break
+
+    timing = TaskTiming(
+        process_start=spawned - started,
+        render=time.perf_counter() - spawned,
+        exit_code=process.returncode,
+        peak_rss_bytes=peak_rss
+    )
+    if error_kind == ERROR_CANCELLED:
+        result = cancelled_result(task)
+        result.timing = timing
+        return result
+    if error_kind == ERROR_TIMEOUT:
+        return TaskResult(task, False, f"超过 {timeout:g} 秒未完成，已结束Inkscape进程",
+                          timing=timing, error_kind=ERROR_TIMEOUT)
+    if process.returncode == 0:
+        return TaskResult(task, True, timing=timing)
+    return TaskResult(task, False, decode_output(stderr), timing=timing,
+                      error_kind=ERROR_CRASH if is_crash_exit(process.returncode) else "")
+
+
+_version_cache = {}
+
+
+def remember_inkscape_version(inkscape_path, mtime_ns, version):
+    """记录已知的版本字符串（例如从配置文件读取的），之后不必再启动Inkscape查询"""
+    _version_cache[(inkscape_path, mtime_ns)] = version
+
+
+def get_inkscape_version(inkscape_path):
+    """查询Inkscape版本字符串，例如 "Inkscape 1.2.2 (b0a8486541, 2022-12-01)"，失败时返回空字符串"""
+    try:
+        cache_key = (inkscape_path, os.stat(inkscape_path).st_mtime_ns)
+    except OSError:
+        cache_key = None
+    if cache_key in _version_cache:
+        return _version_cache[cache_key]
+
+    try:
+        result = subprocess.run([inkscape_path, "--version"], capture_output=True, text=False, timeout=60)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning(f"无法获取Inkscape版本: {e}")
+        return ""
+    version = ""
+    for line in decode_output(result.stdout).splitlines():
+        if line.strip().startswith("Inkscape"):
+            version = line.strip()
+            break
+    if cache_key is not None:
+        _version_cache[cache_key] = version
+    return version
@@ -0,0 +1,140 @@
+import os
+from collections import Counter
+from dataclasses import dataclass
+
+from .archives import ArchiveMember
+
+# 文件的转换状态
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+
+def job_key(path):
+    """文件在任务表中的键：规范化的绝对路径，同一文件的不同写法只记一次"""
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+@dataclass
+class FileJob:
+    """任务表中的一个文件"""
+    index: int
+    path: str
+    extension: str
+    state: str = PENDING
+    error: str = ""
+    # 本批转换中尚未完成的任务数
+    remaining: int = 0
+    # 本批转换中有任务被取消
+    cancelled: bool = False
+    # 来自压缩包时为其中的成员 (ArchiveMember)，path为显示用的路径
+    member: ArchiveMember = None
+
+
+class JobStore:
+    """
+    有序的待转换文件表
+
+    按加入顺序保存文件，以规范化路径为键，去重和查找都是O(1)；
+    同时维护各状态和各扩展名的文件数，界面不必遍历全部文件。
+    """
+
+    def __init__(self):
+        self._jobs = {}
+        self._order = []
+        self.state_counts = Counter()
+        self.extension_counts = Counter()
+
+    def __len__(self):
+        return len(self._order)
+
+    def __iter__(self):
+        return iter(self._order)
+
+    def __contains__(self, path):
+        return job_key(path) in self._jobs
+
+    def get(self, path):
+        return self._jobs.get(job_key(path))
+
+    def at(self, index):
+        """按加入顺序的第index个文件"""
+        return self._order[index]
+
+    def add(self, paths):
+        """加入文件，返回新加入的FileJob列表（已存在的文件跳过）"""
+        added = []
+        for path in paths:
+            key = job_key(path)
+            if key in self._jobs:
+                continue
+            job = FileJob(len(self._order), str(path), os.path.splitext(str(path))[1].lower(),
+                          member=path if isinstance(path, ArchiveMember) else None)
+            self._jobs[key] = job
+            self._order.append(job)
+            self.state_counts[job.state] += 1
+            self.extension_counts[job.extension] += 1
+            added.append(job)
+        return added
+
+    def clear(self):
+        self._jobs.clear()
+        self._order = []
+        self.state_counts.clear()
+        self.extension_counts.clear()
+
+    def paths(self):
+        """按加入顺序返回全部文件路径，压缩包中的成员返回ArchiveMember"""
+        return [job.member or job.path for job in self._order]
+
+    def set_state(self, job, state, error=""):
+        self.state_counts[job.state] -= 1
+        job.state = state
+        job.error = error
+        self.state_counts[state] += 1
+
+    def begin(self, paths, task_counts):
+        """
+        一批转换开始：paths为本批的文件，task_counts为 {文件路径: 任务数}
+
+        有任务的文件标记为转换中，没有任务（全部输出格式与源文件相同）的文件直接标记为完成。
+        返回状态发生变化的FileJob列表。
+        """
+        counts = Counter()
+        for path, count in task_counts.items():
+            counts[job_key(path)] += count
+        changed = []
+        for path in paths:
+            job = self.get(path)
+            if job is None:
+                continue
+            job.remaining = counts[job_key(path)]
+            job.cancelled = False
+            self.set_state(job, RUNNING if job.remaining else DONE)
+            changed.append(job)
+        return changed
+
+    def record_result(self, path, success, error="", cancelled=False):
+        """
+        记录一个任务的结果，文件的全部任务都完成后更新其状态：
+        有任务失败时为失败，有任务被取消时为已取消，否则为完成。
+
+        返回状态发生变化的FileJob，没有变化时返回None。
+        """
+        job = self.get(path)
+        if job is None:
+            return None
+        if cancelled:
+            job.cancelled = True
+        elif not success and not job.error:
+            job.error = error
+        job.remaining = max(0, job.remaining - 1)
+        if job.remaining:
+            return None
+        if job.error:
+            self.set_state(job, FAILED, job.error)
+        else:
+            self.set_state(job, CANCELLED if job.cancelled else DONE)
+        return job
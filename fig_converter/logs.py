@@ -0,0 +1,33 @@
+import atexit
+import logging
+import logging.handlers
+import queue
+
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+def setup_logging(level, handlers):
+    """
+    配置根日志记录器
+
+    记录日志的线程只把记录放入队列，由后台线程写入handlers（终端、日志文件），
+    转换工作线程不会因为同步写文件而阻塞。与logging.basicConfig一样，
+    根记录器已经有处理器时不做任何修改，返回None；否则返回已启动的QueueListener。
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    listener.start()
+    # 退出前写完队列中剩余的日志
+    atexit.register(listener.stop)
+    return listener
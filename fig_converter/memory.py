@@ -0,0 +1,296 @@
+import logging
+import os
+import re
+import struct
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+from .tasks import BASE_DPI
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow是可选依赖，没有时只能识别PNG的尺寸
+    Image = None
+
+
+logger = logging.getLogger("FigConverter.memory")
+
+MB = 1024 * 1024
+
+# Inkscape进程本身的内存占用
+INKSCAPE_BASE_BYTES = 200 * MB
+# 解析后的文档相对于输入文件大小的膨胀倍数
+DOCUMENT_EXPANSION = 20
+# 位图导出时每个像素占用的内存：RGBA渲染表面加上导出和编码时的副本
+BYTES_PER_PIXEL = 4 * 3
+# 无法读取页面尺寸时按A4估计（英寸）
+DEFAULT_PAGE_INCHES = (8.27, 11.69)
+
+# 默认内存预算占物理内存的比例
+DEFAULT_BUDGET_FRACTION = 0.7
+
+# 读取PDF/EPS页面尺寸时最多读取的字节数（文件开头和结尾各一段）
+HEADER_SCAN_BYTES = 1024 * 1024
+
+# SVG长度单位换算为英寸
+SVG_UNITS_PER_INCH = {"": 96.0, "px": 96.0, "pt": 72.0, "pc": 6.0, "mm": 25.4, "cm": 2.54, "in": 1.0}
+
+_LENGTH_RE = re.compile(r"^\s*([0-9.eE+-]+)\s*([a-z%]*)\s*$")
+_MEDIABOX_RE = re.compile(rb"/MediaBox\s*\[\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\]")
+_BBOX_RE = re.compile(rb"%%BoundingBox:\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)")
+
+
+def total_memory_bytes():
+    """物理内存总量，无法获取时返回None"""
+    if os.name == 'nt':  # Windows
+        import ctypes
+
+        class MemoryStatus(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong),
+                        ("ullTotalPhys", ctypes.c_ulonglong), ("ullAvailPhys", ctypes.c_ulonglong),
+                        ("ullTotalPageFile", ctypes.c_ulonglong), ("ullAvailPageFile", ctypes.c_ulonglong),
+                        ("ullTotalVirtual", ctypes.c_ulonglong), ("ullAvailVirtual", ctypes.c_ulonglong),
+                        ("ullAvailExtendedVirtual", ctypes.c_ulonglong)]
+
+        status = MemoryStatus()
+        status.dwLength = ctypes.sizeof(status)
+        if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status)):
+            return status.ullTotalPhys
+        return None
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def default_memory_budget():
+    """默认内存预算：物理内存的70%，无法获取物理内存时不限制 (None)"""
+    total = total_memory_bytes()
+    return int(total * DEFAULT_BUDGET_FRACTION) if total else None
+
+
+def page_size_inches(path):
+    """
+    读取文档的页面尺寸 (宽, 高)，单位英寸，无法识别时返回None
+
+    只读取文件头部（PDF/EPS还有尾部），不解析整个文档。
+    """
+    suffix = os.path.splitext(str(path))[1].lower()
+    try:
+        if suffix == ".svg":
+            return _svg_size(path)
+        if suffix == ".pdf":
+            return _scan_box(path, _MEDIABOX_RE)
+        if suffix in (".eps", ".ps"):
+            return _scan_box(path, _BBOX_RE)
+        if suffix == ".emf":
+            return _emf_size(path)
+        return _bitmap_size(path)
+    except (OSError, ValueError, ET.ParseError, struct.error):
+        return None
+
+
+def _svg_length(value, units_per_inch_for_user):
+    match = _LENGTH_RE.match(value or "")
+    if not match or match.group(2) == "%":
+        return None
+    number, unit = float(match.group(1)), match.group(2)
+    if unit not in SVG_UNITS_PER_INCH:
+        return None
+    return number / SVG_UNITS_PER_INCH[unit] if unit else number / units_per_inch_for_user
+
+
+def _svg_size(path):
+    """SVG根元素的width/height，缺少时使用viewBox（按96用户单位每英寸）"""
+    for _, element in ET.iterparse(str(path), events=("start",)):
+        width = _svg_length(element.get("width"), BASE_DPI)
+        height = _svg_length(element.get("height"), BASE_DPI)
+        if width and height:
+            return width, height
+        view_box = (element.get("viewBox") or "").replace(',', ' ').split()
+        if len(view_box) == 4:
+            return float(view_box[2]) / BASE_DPI, float(view_box[3]) / BASE_DPI
+        return None
+    return None
+
+
+def _scan_box(path, pattern):
+    """在文件头部和尾部查找页面框 (单位为点)，多个页面时取最大的一个"""
+    with open(path, 'rb') as f:
+        data = f.read(HEADER_SCAN_BYTES)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        if size > HEADER_SCAN_BYTES:
+            f.seek(max(HEADER_SCAN_BYTES, size - HEADER_SCAN_BYTES))
+            data += f.read()
+    boxes = []
+    for match in pattern.finditer(data):
+        x0, y0, x1, y1 = (float(value) for value in match.groups())
+        boxes.append((abs(x1 - x0) / 72, abs(y1 - y0) / 72))
+    return max(boxes, key=lambda box: box[0] * box[1]) if boxes else None
+
+
+def _emf_size(path):
+    """EMF文件头中的rclFrame，单位为0.01毫米"""
+    with open(path, 'rb') as f:
+        header = f.read(40)
+    left, top, right, bottom = struct.unpack_from("<iiii", header, 24)
+    return abs(right - left) / 2540, abs(bottom - top) / 2540
+
+
+def _bitmap_size(path):
+    """位图按Inkscape导入时的96 DPI换算为英寸"""
+    if Image is not None:
+        with Image.open(path) as image:
+            width, height = image.size
+    else:
+        with open(path, 'rb') as f:
+            header = f.read(24)
+        if header[:8] != b"\x89PNG\r\n\x1a\n":
+            return None
+        width, height = struct.unpack(">II", header[16:24])
+    return width / BASE_DPI, height / BASE_DPI
+
+
+class MemoryEstimator:
+    """
+    估计任务执行时的内存峰值
+
+    位图导出按 页面尺寸 × DPI 计算像素数，矢量导出只计算文档本身。
+    实测的峰值内存用于校正：实测值持续高于估计值时，后续估计按比例放大。
+    """
+
+    def __init__(self):
+        self.factor = 1.0
+        self._lock = threading.Lock()
+        self._page_sizes = {}
+
+    def page_size(self, path):
+        key = str(path)
+        with self._lock:
+            if key in self._page_sizes:
+                return self._page_sizes[key]
+        size = page_size_inches(path) or DEFAULT_PAGE_INCHES
+        with self._lock:
+            self._page_sizes[key] = size
+        return size
+
+    def estimate(self, task):
+        """估计单个任务的内存峰值（字节）"""
+        document_bytes = task.input_size() * DOCUMENT_EXPANSION
+        render_bytes = 0
+        if task.export_size is not None:
+            # 分块渲染的一块只渲染这一部分
+            render_bytes = task.export_size[0] * task.export_size[1] * BYTES_PER_PIXEL
+        elif task.is_raster:
+            width, height = self.page_size(task.source_file)
+            render_bytes = int(width * task.dpi) * int(height * task.dpi) * BYTES_PER_PIXEL
+        return int((INKSCAPE_BASE_BYTES + document_bytes + render_bytes) * self.factor)
+
+    def calibrate(self, estimated, measured):
+        """用实测峰值校正估计：按 实测/估计 的比例平滑调整放大倍数"""
+        if not estimated or not measured:
+            return
+        ratio = measured / estimated
+        if ratio > 1.5:
+            logger.warning(f"内存估计偏低: 估计 {estimated // MB} MB，实测 {measured // MB} MB")
+        with self._lock:
+            target = min(4.0, max(0.5, self.factor * ratio))
+            self.factor = 0.7 * self.factor + 0.3 * target
+
+
+class MemoryBudget:
+    """
+    内存预算：任务开始前申请估计的内存，结束后归还
+
+    try_acquire不等待，预算不足时调用方可以先执行其他能放下的任务；
+    acquire等待预算，等待期间为其保留所需的内存，后来的小任务不会一直抢在前面。
+    单个任务超过全部预算时，等其他任务都结束后单独执行。
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._reserved = 0
+        self._condition = threading.Condition()
+
+    def try_acquire(self, amount):
+        """预算足够（且不占用等待中任务保留的内存）时申请并返回True，否则返回False"""
+        with self._condition:
+            if self.used + self._reserved + amount > self.limit and (self.used or self._reserved):
+                return False
+            self.used += amount
+            return True
+
+    def acquire(self, amount, cancel_event=None):
+        """申请内存，预算不足时等待；等待期间被取消时返回False"""
+        with self._condition:
+            if self.used and self.used + amount > self.limit:
+                logger.info(f"等待内存预算: 需要 {amount // MB} MB，已用 {self.used // MB}/{self.limit // MB} MB")
+                self._reserved += amount
+                try:
+                    while self.used and self.used + amount > self.limit:
+                        if cancel_event is not None and cancel_event.is_set():
+                            return False
+                        self._condition.wait(timeout=0.5)
+                finally:
+                    self._reserved -= amount
+            self.used += amount
+            return True
+
+    def release(self, amount):
+        with self._condition:
+            self.used = max(0, self.used - amount)
+            self._condition.notify_all()
+
+
+def reset_peak_rss(pid):
+    """重置进程的峰值内存记录（仅Linux支持），之后读取的峰值只反映这之后的内存占用"""
+    if sys.platform.startswith("linux"):
+        try:
+            with open(f"/proc/{pid}/clear_refs", 'w') as f:
+                f.write("5")
+        except OSError:
+            pass
+
+
+def read_peak_rss(pid):
+    """读取进程的峰值常驻内存（字节），不支持的平台或进程已退出时返回0"""
+    if sys.platform.startswith("linux"):
+        try:
+            with open(f"/proc/{pid}/status", 'r') as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        return 0
+    if os.name == 'nt':  # Windows
+        return _windows_peak_working_set(pid)
+    return 0
+
+
+def _windows_peak_working_set(pid):
+    import ctypes
+    from ctypes import wintypes
+
+    class Counters(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    # PROCESS_QUERY_LIMITED_INFORMATION | PROCESS_VM_READ
+    handle = ctypes.windll.kernel32.OpenProcess(0x1000 | 0x0010, False, pid)
+    if not handle:
+        return 0
+    try:
+        counters = Counters()
+        counters.cb = ctypes.sizeof(counters)
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+        return 0
+    finally:
+        ctypes.windll.kernel32.CloseHandle(handle)
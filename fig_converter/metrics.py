@@ -0,0 +1,167 @@
+import json
+import math
+import os
+import time
+from collections import Counter
+from pathlib import Path
+
+
+# 每批转换结束后写出的报告文件名
+METRICS_JSON_NAME = "fig_converter_metrics.json"
+METRICS_PROM_NAME = "fig_converter_metrics.prom"
+
+# 分阶段统计的耗时字段
+TIMING_STAGES = ("queue_wait", "preflight", "process_start", "parse", "render", "compress")
+
+# Prometheus摘要中输出的分位数
+QUANTILES = (0.5, 0.95)
+
+
+def percentile(values, fraction):
+    """最近秩法计算分位数，values为空时返回0"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+class BatchMetrics:
+    """
+    一批转换任务的统计
+
+    由每个任务的TaskTiming汇总出吞吐量、各输出格式的耗时分位数和各阶段的总耗时，
+    可以写为JSON报告或Prometheus文本格式 (node_exporter textfile collector)。
+    """
+
+    def __init__(self, results, wall_seconds, finished_at=None):
+        self.results = list(results)
+        self.wall_seconds = wall_seconds
+        self.finished_at = finished_at if finished_at is not None else time.time()
+
+    @property
+    def tasks_per_second(self):
+        return len(self.results) / self.wall_seconds if self.wall_seconds > 0 else 0.0
+
+    def format_latencies(self):
+        """按输出格式分组的任务总耗时列表"""
+        latencies = {}
+        for result in self.results:
+            latencies.setdefault(result.task.format_name, []).append(result.timing.wall)
+        return latencies
+
+    def summary(self):
+        """汇总统计，不包含每个任务的明细"""
+        statuses = Counter(result.status for result in self.results)
+        formats = {}
+        for format_name, values in sorted(self.format_latencies().items()):
+            formats[format_name] = {
+                "tasks": len(values),
+                "failed": sum(1 for result in self.results
+                              if result.task.format_name == format_name and not result.success),
+                "p50_seconds": round(percentile(values, 0.5), 4),
+                "p95_seconds": round(percentile(values, 0.95), 4),
+            }
+        return {
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.finished_at)),
+            "wall_seconds": round(self.wall_seconds, 4),
+            "tasks": len(self.results),
+            "tasks_per_second": round(self.tasks_per_second, 3),
+            "statuses": dict(statuses),
+            "backends": dict(Counter(result.backend for result in self.results)),
+            "input_bytes": sum(result.timing.input_bytes for result in self.results),
+            "output_bytes": sum(result.timing.output_bytes for result in self.results),
+            "preflight_saved_bytes": sum(result.timing.preflight_saved_bytes for result in self.results),
+            "compressed_saved_bytes": sum(result.timing.compressed_saved_bytes for result in self.results),
+            "stage_seconds": {
+                stage: round(sum(getattr(result.timing, stage) for result in self.results), 4)
+                for stage in TIMING_STAGES
+            },
+            "formats": formats,
+            "memory": self.memory_summary(),
+        }
+
+    def memory_summary(self):
+        """实测峰值内存与执行前估计的比较，只统计两者都有的任务"""
+        ratios = [result.timing.peak_rss_bytes / result.timing.estimated_bytes for result in self.results
+                  if result.timing.peak_rss_bytes and result.timing.estimated_bytes]
+        return {
+            "measured_tasks": len(ratios),
+            "peak_rss_bytes": max((result.timing.peak_rss_bytes for result in self.results), default=0),
+            "estimate_ratio_p50": round(percentile(ratios, 0.5), 3),
+            "estimate_ratio_max": round(max(ratios, default=0.0), 3),
+        }
+
+    def to_dict(self):
+        """JSON报告：汇总统计加每个任务的明细"""
+        report = self.summary()
+        report["results"] = [result.to_dict() for result in self.results]
+        return report
+
+    def to_prometheus(self):
+        """Prometheus文本格式"""
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{_escape_label(val)}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        metric("fig_converter_batch_finished_timestamp_seconds", "gauge", "Time the last batch finished.",
+               [({}, round(self.finished_at, 3))])
+        metric("fig_converter_batch_duration_seconds", "gauge", "Wall time of the last batch.",
+               [({}, summary["wall_seconds"])])
+        metric("fig_converter_batch_tasks_per_second", "gauge", "Throughput of the last batch.",
+               [({}, summary["tasks_per_second"])])
+        metric("fig_converter_batch_tasks", "gauge", "Tasks in the last batch by status.",
+               [({"status": status}, count) for status, count in sorted(summary["statuses"].items())])
+        metric("fig_converter_batch_backend_tasks", "gauge", "Tasks in the last batch by backend.",
+               [({"backend": backend}, count) for backend, count in sorted(summary["backends"].items())])
+        metric("fig_converter_batch_bytes", "gauge", "Input and output bytes of the last batch.",
+               [({"direction": "input"}, summary["input_bytes"]),
+                ({"direction": "output"}, summary["output_bytes"])])
+        metric("fig_converter_batch_stage_seconds", "gauge", "Time spent in each stage, summed over tasks.",
+               [({"stage": stage}, seconds) for stage, seconds in summary["stage_seconds"].items()])
+        metric("fig_converter_batch_peak_rss_bytes", "gauge", "Largest Inkscape peak resident memory in the last batch.",
+               [({}, summary["memory"]["peak_rss_bytes"])])
+        metric("fig_converter_batch_memory_estimate_ratio", "gauge",
+               "Measured peak memory divided by the estimate, over tasks in the last batch.",
+               [({"quantile": 0.5}, summary["memory"]["estimate_ratio_p50"]),
+                ({"quantile": 1.0}, summary["memory"]["estimate_ratio_max"])])
+
+        samples = []
+        for format_name, values in sorted(self.format_latencies().items()):
+            for quantile in QUANTILES:
+                samples.append(({"format": format_name, "quantile": quantile},
+                                round(percentile(values, quantile), 4)))
+        name = "fig_converter_task_duration_seconds"
+        metric(name, "summary", "Task wall time by output format.", samples)
+        for format_name, values in sorted(self.format_latencies().items()):
+            lines.append(f'{name}_sum{{format="{_escape_label(format_name)}"}} {round(sum(values), 4)}')
+            lines.append(f'{name}_count{{format="{_escape_label(format_name)}"}} {len(values)}')
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, directory):
+        """把JSON报告和Prometheus文件写入directory，返回两个文件的路径"""
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        json_path = directory / METRICS_JSON_NAME
+        prom_path = directory / METRICS_PROM_NAME
+        _write_atomic(json_path, json.dumps(self.to_dict(), ensure_ascii=False, indent=2) + "\n")
+        _write_atomic(prom_path, self.to_prometheus())
+        return json_path, prom_path
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path, text):
+    """先写临时文件再替换，采集程序不会读到写了一半的文件"""
+    tmp_path = path.with_name(f".{path.name}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
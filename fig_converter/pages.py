@@ -0,0 +1,93 @@
+"""
+读取多页文档（PDF/PS）的页数，不渲染文档
+"""
+import mmap
+import os
+import re
+import zlib
+
+
+# PS文件中查找页数注释时读取的字节数（文件开头和结尾各一段）
+HEADER_SCAN_BYTES = 1024 * 1024
+# 对象流解压后的大小上限，异常的流不会占用过多内存
+MAX_OBJECT_STREAM_BYTES = 16 * 1024 * 1024
+
+# 按页拆分的输入格式
+MULTI_PAGE_FORMATS = ('.pdf', '.ps')
+
+# 页树节点 (/Type /Pages) 中的页数，键的顺序不固定
+_PAGES_COUNT_RE = re.compile(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b")
+_PAGE_RE = re.compile(rb"/Type\s*/Page\b")
+_OBJECT_STREAM_RE = re.compile(rb"/Type\s*/ObjStm\b")
+_STREAM_RE = re.compile(rb"stream\r?\n")
+_DSC_PAGES_RE = re.compile(rb"^%%Pages:\s*(\d+)", re.MULTILINE)
+_DSC_PAGES_ATEND_RE = re.compile(rb"^%%Pages:\s*\(atend\)", re.MULTILINE)
+
+
+def page_count(path):
+    """
+    文档的页数，不是多页格式或无法识别时返回None
+
+    PDF在文件中查找页树根节点的 /Count（PDF 1.5以后的对象流先解压），
+    找不到页树时统计页面对象的个数；PS读取DSC注释 %%Pages。
+    """
+    suffix = os.path.splitext(str(path))[1].lower()
+    try:
+        if suffix == ".pdf":
+            return _pdf_page_count(path)
+        if suffix == ".ps":
+            return _ps_page_count(path)
+    except (OSError, ValueError):
+        return None
+    return None
+
+
+def _pdf_page_count(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        # 用mmap按需读取，大文件不必整个读入内存
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            sections = [data] + list(_object_streams(data))
+            counts = [int(first or second) for section in sections
+                      for first, second in _PAGES_COUNT_RE.findall(section)]
+            if counts:
+                # 根节点的页数最多（增量更新的文件中旧版本的页树也在其中，取最大值）
+                return max(counts)
+            pages = sum(len(_PAGE_RE.findall(section)) for section in sections)
+    return pages or None
+
+
+def _object_streams(data):
+    """逐个解压PDF中的对象流，无法解压的（加密或其他压缩方式）跳过"""
+    for match in _OBJECT_STREAM_RE.finditer(data):
+        stream = _STREAM_RE.search(data, match.end())
+        if stream is None:
+            return
+        try:
+            with memoryview(data) as view:
+                content = zlib.decompressobj().decompress(view[stream.end():], MAX_OBJECT_STREAM_BYTES)
+        except zlib.error:
+            continue
+        yield content
+
+
+def _ps_page_count(path):
+    with open(path, 'rb') as f:
+        head = f.read(HEADER_SCAN_BYTES)
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        tail = b""
+        if size > HEADER_SCAN_BYTES:
+            f.seek(max(HEADER_SCAN_BYTES, size - HEADER_SCAN_BYTES))
+            tail = f.read()
+    # 只看文件头注释（到 %%EndComments 为止），之后可能是内嵌EPS自己的注释
+    end = head.find(b"%%EndComments")
+    comments = head if end < 0 else head[:end]
+    matches = _DSC_PAGES_RE.findall(comments)
+    if not matches and _DSC_PAGES_ATEND_RE.search(comments):
+        # 文件头中为 "%%Pages: (atend)" 时，页数写在文件末尾的注释中
+        matches = _DSC_PAGES_RE.findall(tail or head)[-1:]
+    if not matches:
+        return None
+    return int(matches[0]) or None
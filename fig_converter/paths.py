@@ -0,0 +1,28 @@
+import os
+from pathlib import Path
+
+
+APP_NAME = "fig_converter"
+
+
+def user_cache_dir():
+    """当前用户的缓存目录"""
+    if os.name == 'nt':  # Windows
+        base = os.environ.get("LOCALAPPDATA") or Path.home() / "AppData" / "Local"
+    else:  # Linux/Mac
+        base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / APP_NAME
+
+
+def metrics_report_dir():
+    """图形界面默认写出每批转换统计报告的目录"""
+    return user_cache_dir() / "metrics"
+
+
+def user_config_dir():
+    """当前用户的配置目录"""
+    if os.name == 'nt':  # Windows
+        base = os.environ.get("APPDATA") or Path.home() / "AppData" / "Roaming"
+    else:  # Linux/Mac
+        base = os.environ.get("XDG_CONFIG_HOME") or Path.home() / ".config"
+    return Path(base) / APP_NAME
@@ -0,0 +1,158 @@
+import logging
+import os
+import struct
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow是可选依赖，没有时"max"模式只重新压缩图像数据
+    Image = None
+
+
+logger = logging.getLogger("FigConverter.pngcompress")
+
+# 压缩模式：fast 只用最高级别重新压缩图像数据（不解码像素，内存占用固定）；
+# max 另外用Pillow重新编码（逐行选择过滤器，去掉全不透明的alpha通道），取较小的结果
+COMPRESSION_MODES = ("fast", "max")
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# 写出的每个IDAT块的最大长度
+IDAT_CHUNK_BYTES = 1024 * 1024
+# 读取图像数据的块大小
+READ_BYTES = 256 * 1024
+
+# 可以删除的辅助块：文本注释和修改时间，不影响显示
+DROPPED_CHUNKS = {b"tEXt", b"zTXt", b"iTXt", b"tIME"}
+
+
+@dataclass
+class CompressionReport:
+    """一个PNG文件重新压缩的结果"""
+    path: Path
+    original_bytes: int
+    compressed_bytes: int
+    seconds: float
+
+    @property
+    def saved_bytes(self):
+        return self.original_bytes - self.compressed_bytes
+
+    def describe(self):
+        ratio = self.saved_bytes / self.original_bytes * 100 if self.original_bytes else 0.0
+        return (f"{self.path.name}: PNG压缩 {self.original_bytes / 1024:.1f} KB -> "
+                f"{self.compressed_bytes / 1024:.1f} KB (-{ratio:.0f}%)，耗时 {self.seconds:.3f} 秒")
+
+
+def compress_png(path, mode="fast"):
+    """
+    重新压缩PNG文件，返回CompressionReport
+
+    先写入同目录下的临时文件，比原文件小时才替换，读取输出的程序不会看到不完整的文件。
+    文件不是有效的PNG时抛出ValueError。
+    """
+    if mode not in COMPRESSION_MODES:
+        raise ValueError(f"未知的压缩模式: {mode}")
+    started = time.perf_counter()
+    path = Path(path)
+    original_bytes = path.stat().st_size
+    candidates = [path.with_name(f".{path.stem}.compress{path.suffix}")]
+    try:
+        _recompress_stream(path, candidates[0])
+        if mode == "max" and Image is not None:
+            candidates.append(path.with_name(f".{path.stem}.compress-max{path.suffix}"))
+            _reencode(path, candidates[1])
+        best = min(candidates, key=lambda candidate: candidate.stat().st_size)
+        compressed_bytes = best.stat().st_size
+        if compressed_bytes < original_bytes:
+            os.replace(best, path)
+        else:
+            compressed_bytes = original_bytes
+    finally:
+        for candidate in candidates:
+            try:
+                candidate.unlink()
+            except FileNotFoundError:
+                pass
+    return CompressionReport(path, original_bytes, compressed_bytes, time.perf_counter() - started)
+
+
+def read_chunks(f):
+    """逐个返回 (类型, 数据) ，图像数据很大时也只读取一个块"""
+    if f.read(len(PNG_SIGNATURE)) != PNG_SIGNATURE:
+        raise ValueError("不是PNG文件")
+    while True:
+        header = f.read(8)
+        if not header:
+            return
+        if len(header) < 8:
+            raise ValueError("PNG文件不完整")
+        length, chunk_type = struct.unpack(">I4s", header)
+        data = f.read(length)
+        if len(data) < length or len(f.read(4)) < 4:
+            raise ValueError("PNG文件不完整")
+        yield chunk_type, data
+        if chunk_type == b"IEND":
+            return
+
+
+def write_chunk(f, chunk_type, data):
+    f.write(struct.pack(">I", len(data)))
+    f.write(chunk_type)
+    f.write(data)
+    f.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+
+def _recompress_stream(source, target):
+    """解压图像数据 (IDAT) 后以最高级别重新压缩，逐块处理，删除文本注释等辅助块"""
+    with open(source, 'rb') as src, open(target, 'wb') as dst:
+        dst.write(PNG_SIGNATURE)
+        decompressor = None
+        compressor = None
+        pending = bytearray()
+
+        def flush_idat(final=False):
+            nonlocal pending
+            if final:
+                pending += compressor.flush()
+            while len(pending) >= IDAT_CHUNK_BYTES or (final and pending):
+                write_chunk(dst, b"IDAT", bytes(pending[:IDAT_CHUNK_BYTES]))
+                del pending[:IDAT_CHUNK_BYTES]
+
+        for chunk_type, data in read_chunks(src):
+            if chunk_type == b"IDAT":
+                if decompressor is None:
+                    decompressor = zlib.decompressobj()
+                    compressor = zlib.compressobj(9, zlib.DEFLATED, 15, 9)
+                # 分段解压，避免压缩率很高的数据一次展开占用大量内存
+                buffer = data
+                while buffer:
+                    raw = decompressor.decompress(buffer, READ_BYTES)
+                    buffer = decompressor.unconsumed_tail
+                    pending += compressor.compress(raw)
+                    flush_idat()
+                continue
+            if decompressor is not None:
+                # 图像数据结束
+                pending += compressor.compress(decompressor.flush())
+                flush_idat(final=True)
+                decompressor = None
+            if chunk_type in DROPPED_CHUNKS:
+                continue
+            write_chunk(dst, chunk_type, data)
+
+
+def _reencode(source, target):
+    """用Pillow重新编码：全不透明时去掉alpha通道，保留分辨率和色彩配置"""
+    with Image.open(source) as image:
+        image.load()
+        options = {"optimize": True}
+        for key in ("dpi", "icc_profile", "transparency"):
+            if key in image.info:
+                options[key] = image.info[key]
+        if image.mode == "RGBA" and image.getchannel("A").getextrema() == (255, 255):
+            image = image.convert("RGB")
+        image.save(target, format="PNG", **options)
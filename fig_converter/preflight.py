@@ -0,0 +1,379 @@
+import base64
+import binascii
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import xml.sax
+import xml.sax.handler
+from dataclasses import dataclass
+from pathlib import Path
+from urllib.parse import unquote, urlsplit
+from xml.sax.saxutils import XMLGenerator
+
+
+logger = logging.getLogger("FigConverter.preflight")
+
+# 超过该大小的内嵌base64位图写为单独的文件，Inkscape直接读取图片而不必解码属性
+EXTERNALIZE_MIN_BYTES = 64 * 1024
+
+# 可以写为单独文件的内嵌图片类型
+IMAGE_EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/jpg": ".jpg", "image/gif": ".gif",
+                    "image/bmp": ".bmp", "image/webp": ".webp"}
+
+# 文档中出现这些元素时可能在运行时引用任意id，不删除未使用的定义
+DYNAMIC_ELEMENTS = {"script", "animate", "set", "animateTransform", "animateMotion", "animateColor"}
+
+_ID_REFERENCE_RE = re.compile(r"#([A-Za-z_][\w.:-]*)")
+_DATA_URI_RE = re.compile(r"^\s*data:([\w/+.-]+);base64,", re.IGNORECASE)
+_TRANSFORM_RE = re.compile(r"(\w+)\s*\(([^)]*)\)")
+_SCHEME_RE = re.compile(r"^[A-Za-z][\w+.-]*:")
+
+# 各变换函数为恒等变换时的参数
+_IDENTITY_ARGUMENTS = {
+    "translate": ((0.0,), (0.0, 0.0)),
+    "scale": ((1.0,), (1.0, 1.0)),
+    "rotate": ((0.0,), (0.0, 0.0, 0.0)),
+    "skewX": ((0.0,),),
+    "skewY": ((0.0,),),
+    "matrix": ((1.0, 0.0, 0.0, 1.0, 0.0, 0.0),),
+}
+
+
+def _local_name(qname):
+    return qname.rsplit(':', 1)[-1]
+
+
+def is_identity_transform(value):
+    """transform属性是否只包含恒等变换（例如 translate(0,0)、scale(1)），可以直接删除"""
+    if not value.strip():
+        return True
+    position = 0
+    for match in _TRANSFORM_RE.finditer(value):
+        if value[position:match.start()].strip(" ,\t\r\n"):
+            return False
+        position = match.end()
+        try:
+            arguments = tuple(float(item) for item in re.split(r"[\s,]+", match.group(2).strip()) if item)
+        except ValueError:
+            return False
+        if arguments not in _IDENTITY_ARGUMENTS.get(match.group(1), ()):
+            return False
+    return not value[position:].strip(" ,\t\r\n")
+
+
+@dataclass
+class PreflightReport:
+    """一个SVG文档预处理的结果"""
+    source: Path
+    optimized: Path
+    original_bytes: int
+    optimized_bytes: int
+    seconds: float
+    removed_elements: int = 0
+    removed_transforms: int = 0
+    externalized_images: int = 0
+    # 使用预处理后的文档时Inkscape解析文档的耗时，用于估计节省的时间
+    parse_seconds: float = 0.0
+    # 预处理的耗时和减少的字节数已记在某个任务的TaskTiming上
+    recorded: bool = False
+
+    @property
+    def saved_bytes(self):
+        return self.original_bytes - self.optimized_bytes
+
+    def estimated_saved_seconds(self):
+        """
+        估计节省的时间：解析耗时大致与文档大小成正比，按大小比例推算原文档的解析耗时，
+        减去实际解析耗时和预处理本身的耗时
+        """
+        if not self.optimized_bytes or not self.parse_seconds:
+            return -self.seconds
+        original_parse = self.parse_seconds * self.original_bytes / self.optimized_bytes
+        return original_parse - self.parse_seconds - self.seconds
+
+    def describe(self):
+        ratio = self.saved_bytes / self.original_bytes * 100 if self.original_bytes else 0.0
+        return (f"{self.source.name}: 预处理减少 {self.saved_bytes / 1024:.1f} KB ({ratio:.0f}%)，"
+                f"删除 {self.removed_elements} 个元素、{self.removed_transforms} 个冗余变换，"
+                f"提取 {self.externalized_images} 个内嵌图片，耗时 {self.seconds:.3f} 秒，"
+                f"估计节省 {self.estimated_saved_seconds():.3f} 秒")
+
+
+class _ReferenceCollector(xml.sax.handler.ContentHandler):
+    """第一遍：收集文档中引用的全部id"""
+
+    def __init__(self):
+        super().__init__()
+        self.references = set()
+        self.dynamic = False
+        self._in_style = 0
+
+    def startElement(self, name, attrs):
+        local = _local_name(name)
+        if local in DYNAMIC_ELEMENTS:
+            self.dynamic = True
+        if local == "style":
+            self._in_style += 1
+        for value in attrs.values():
+            # 内嵌图片的数据不会引用id，跳过以免在大段base64中查找
+            if "#" in value and not _DATA_URI_RE.match(value):
+                self.references.update(_ID_REFERENCE_RE.findall(value))
+
+    def endElement(self, name):
+        if _local_name(name) == "style":
+            self._in_style -= 1
+
+    def characters(self, content):
+        if self._in_style:
+            self.references.update(_ID_REFERENCE_RE.findall(content))
+
+
+class _OptimizingWriter(xml.sax.handler.ContentHandler):
+    """
+    第二遍：边解析边写出清理后的文档
+
+    删除 <metadata>、未被引用的 <defs> 子元素和恒等变换，较大的内嵌图片写为单独的文件，
+    相对路径的外部引用改为绝对路径（文档被写到临时目录中）。注释随解析丢弃。
+    """
+
+    def __init__(self, output, references, prune_defs, source_dir, image_dir):
+        super().__init__()
+        self.output = XMLGenerator(output, encoding="utf-8", short_empty_elements=True)
+        self.references = references
+        self.prune_defs = prune_defs
+        self.source_dir = source_dir
+        self.image_dir = image_dir
+        self.removed_elements = 0
+        self.removed_transforms = 0
+        self.externalized_images = 0
+        self._stack = []
+        self._skip_depth = 0
+
+    def startDocument(self):
+        self.output.startDocument()
+
+    def endDocument(self):
+        self.output.endDocument()
+
+    def processingInstruction(self, target, data):
+        if not self._skip_depth:
+            self.output.processingInstruction(target, data)
+
+    def startElement(self, name, attrs):
+        local = _local_name(name)
+        parent = self._stack[-1] if self._stack else None
+        self._stack.append(local)
+        if self._skip_depth:
+            self._skip_depth += 1
+            return
+        unused_definition = (self.prune_defs and parent == "defs"
+                             and attrs.get("id") is not None and attrs.get("id") not in self.references)
+        if local == "metadata" or unused_definition:
+            self._skip_depth = 1
+            self.removed_elements += 1
+            return
+        self.output.startElement(name, self._clean_attributes(attrs))
+
+    def endElement(self, name):
+        self._stack.pop()
+        if self._skip_depth:
+            self._skip_depth -= 1
+            return
+        self.output.endElement(name)
+
+    def characters(self, content):
+        if not self._skip_depth:
+            self.output.characters(content)
+
+    def ignorableWhitespace(self, content):
+        self.characters(content)
+
+    def _clean_attributes(self, attrs):
+        cleaned = {}
+        for key, value in attrs.items():
+            if _local_name(key) == "transform" and is_identity_transform(value):
+                self.removed_transforms += 1
+                continue
+            if _local_name(key) == "href":
+                value = self._rewrite_href(value)
+            cleaned[key] = value
+        return cleaned
+
+    def _rewrite_href(self, value):
+        match = _DATA_URI_RE.match(value)
+        if match:
+            extension = IMAGE_EXTENSIONS.get(match.group(1).lower())
+            if extension is None or len(value) < EXTERNALIZE_MIN_BYTES:
+                return value
+            try:
+                data = base64.b64decode("".join(value[match.end():].split()), validate=True)
+            except (binascii.Error, ValueError):
+                return value
+            self.externalized_images += 1
+            image_path = Path(self.image_dir) / f"image{self.externalized_images}{extension}"
+            image_path.write_bytes(data)
+            return image_path.as_uri()
+        stripped = value.strip()
+        if not stripped or stripped.startswith("#") or _SCHEME_RE.match(stripped) or os.path.isabs(stripped):
+            return value
+        # 相对引用是URI引用：路径中的%xx需要先解码，#片段原样保留（as_uri会重新编码路径）
+        parts = urlsplit(stripped)
+        if not parts.path:
+            return value
+        uri = (Path(self.source_dir) / unquote(parts.path)).resolve().as_uri()
+        if parts.query:
+            uri += f"?{parts.query}"
+        if parts.fragment:
+            uri += f"#{parts.fragment}"
+        return uri
+
+
+def optimize_svg(source, work_dir):
+    """
+    预处理一个SVG文档，结果写入work_dir，返回PreflightReport
+
+    使用SAX解析两遍（第一遍收集引用的id，第二遍写出），内存占用与文档大小无关。
+    文档无法解析时抛出xml.sax.SAXException。
+    """
+    started = time.perf_counter()
+    source = Path(source)
+    collector = _ReferenceCollector()
+    _parse(source, collector)
+
+    optimized = Path(work_dir) / f"{source.stem}.svg"
+    with open(optimized, 'wb') as output:
+        writer = _OptimizingWriter(output, collector.references, not collector.dynamic,
+                                   source.parent, work_dir)
+        _parse(source, writer)
+
+    return PreflightReport(
+        source=source,
+        optimized=optimized,
+        original_bytes=source.stat().st_size,
+        optimized_bytes=optimized.stat().st_size,
+        seconds=time.perf_counter() - started,
+        removed_elements=writer.removed_elements,
+        removed_transforms=writer.removed_transforms,
+        externalized_images=writer.externalized_images,
+    )
+
+
+def _parse(path, handler):
+    parser = xml.sax.make_parser()
+    # 保留原始的限定名和xmlns属性，写出时不必重新分配命名空间前缀
+    parser.setFeature(xml.sax.handler.feature_namespaces, False)
+    # 不加载外部DTD和实体
+    parser.setFeature(xml.sax.handler.feature_external_ges, False)
+    parser.setContentHandler(handler)
+    parser.parse(str(path))
+
+
+class SvgPreflight:
+    """
+    转换前的SVG预处理
+
+    作为上下文管理器使用，退出时删除临时文件：
+
+        with SvgPreflight(path) as report:
+            # report为None时（不是SVG、无法解析或没有可以清理的内容）使用原文档
+            ...
+    """
+
+    def __init__(self, source):
+        self.source = Path(source)
+        self.report = None
+        self._work_dir = None
+
+    def __enter__(self):
+        if self.source.suffix.lower() != ".svg":
+            return None
+        self._work_dir = tempfile.TemporaryDirectory(prefix="fig_preflight_")
+        try:
+            self.report = optimize_svg(self.source, self._work_dir.name)
+        except (xml.sax.SAXException, OSError, ValueError) as e:
+            logger.warning(f"{self.source.name}: 预处理失败，使用原文档: {e}")
+            self.report = None
+        if self.report is not None and self.report.saved_bytes <= 0:
+            # 没有可以清理的内容，直接使用原文档
+            self.report = None
+        return self.report
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._work_dir is not None:
+            self._work_dir.cleanup()
+            self._work_dir = None
+
+
+class PreflightCache:
+    """
+    一批转换中预处理后的SVG文档，同一文档（task.document_key）只预处理一次
+
+    文档的任务可能分在多个工作单元中执行（按任务拆分、分块渲染、内存不足暂缓），
+    工作单元入队前用expect登记任务数，任务完成时release，文档的全部任务完成后才删除临时文件。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def expect(self, tasks):
+        """登记之后会使用预处理结果的任务"""
+        with self._lock:
+            for task in tasks:
+                entry = self._entries.setdefault(task.document_key, {"count": 0, "lock": threading.Lock(),
+                                                                     "preflight": None, "report": None})
+                entry["count"] += 1
+
+    def acquire(self, task):
+        """返回任务所在文档的预处理结果（第一次调用时预处理），没有可用的结果时返回None"""
+        with self._lock:
+            entry = self._entries.get(task.document_key)
+        if entry is None:
+            return None
+        with entry["lock"]:
+            if entry["preflight"] is None:
+                entry["preflight"] = SvgPreflight(task.source_file)
+                entry["report"] = entry["preflight"].__enter__()
+            return entry["report"]
+
+    def record(self, report, timing):
+        """预处理的耗时和减少的字节数只记在文档的一个任务上，解析耗时累加到report"""
+        with self._lock:
+            report.parse_seconds += timing.parse
+            if report.recorded:
+                return
+            report.recorded = True
+        timing.preflight = report.seconds
+        timing.preflight_saved_bytes = report.saved_bytes
+
+    def release(self, task):
+        """任务完成，文档没有未完成的任务时记录预处理的效果并删除临时文件"""
+        with self._lock:
+            entry = self._entries.get(task.document_key)
+            if entry is None:
+                return
+            entry["count"] -= 1
+            if entry["count"] > 0:
+                return
+            del self._entries[task.document_key]
+        self._close(entry)
+
+    def close(self):
+        """删除全部临时文件（转换结束或中止时）"""
+        with self._lock:
+            entries, self._entries = list(self._entries.values()), {}
+        for entry in entries:
+            self._close(entry)
+
+    @staticmethod
+    def _close(entry):
+        with entry["lock"]:
+            if entry["preflight"] is None:
+                return
+            if entry["report"] is not None:
+                logger.info(entry["report"].describe())
+            entry["preflight"].__exit__(None, None, None)
+            entry["preflight"] = None
@@ -0,0 +1,80 @@
+import os
+import signal
+import subprocess
+
+
+# 请求子进程退出后等待的时间，超过后强制结束
+TERMINATE_GRACE_SECONDS = 3
+
+# 后台任务（例如生成缩略图）使用的nice值
+BACKGROUND_NICE = 19
+
+
+def process_group_options():
+    """
+    Popen的额外参数：子进程放在新的进程组中
+
+    Inkscape导入EPS/PS时会再启动Ghostscript等子进程，超时或取消时要连同它们一起结束。
+    """
+    if os.name == 'nt':  # Windows
+        return {"creationflags": subprocess.CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+def low_priority_options():
+    """
+    Popen的额外参数：在process_group_options的基础上，Windows中子进程以最低优先级运行
+
+    POSIX上在进程启动后调用lower_priority。
+    """
+    options = process_group_options()
+    if os.name == 'nt':  # Windows
+        options["creationflags"] |= subprocess.IDLE_PRIORITY_CLASS
+    return options
+
+
+def lower_priority(pid):
+    """把进程的调度优先级降到最低（nice 19），平台不支持或没有权限时忽略"""
+    if not hasattr(os, "setpriority"):
+        return
+    try:
+        os.setpriority(os.PRIO_PROCESS, pid, BACKGROUND_NICE)
+    except OSError:
+        pass
+
+
+def kill_process_tree(process, grace=TERMINATE_GRACE_SECONDS):
+    """先请求进程树退出，grace秒后仍未退出则强制结束"""
+    if process.poll() is not None:
+        return
+    if os.name == 'nt':  # Windows
+        subprocess.run(["taskkill", "/T", "/PID", str(process.pid)], capture_output=True)
+    else:
+        _signal_group(process, signal.SIGTERM)
+    try:
+        process.wait(timeout=grace)
+        return
+    except subprocess.TimeoutExpired:
+        pass
+
+    if os.name == 'nt':
+        subprocess.run(["taskkill", "/F", "/T", "/PID", str(process.pid)], capture_output=True)
+    else:
+        _signal_group(process, signal.SIGKILL)
+    try:
+        process.wait(timeout=grace)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def _signal_group(process, signum):
+    try:
+        # 只向自己单独一组的子进程发送组信号，避免误伤本进程所在的进程组
+        if os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, signum)
+        else:
+            process.send_signal(signum)
+    except OSError:
+        # 进程已经退出
+        pass
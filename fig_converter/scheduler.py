@@ -0,0 +1,808 @@
+import logging
+import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, replace
+
+from .archives import ArchiveError, ScratchArea
+from .inkscape import run_export
+from .memory import MB, MemoryBudget, MemoryEstimator
+from .pngcompress import compress_png
+from .preflight import PreflightCache
+from .shell import InkscapeShell, ShellError
+from .tasks import ERROR_CANCELLED, ERROR_CRASH, TaskResult, TaskTiming, cancelled_result
+from .tiles import PngStitcher, can_verify, compare_images, plan_tiles
+
+
+logger = logging.getLogger("FigConverter.scheduler")
+
+
+# 单个任务的默认超时（秒）
+DEFAULT_TASK_TIMEOUT = 300
+
+# 有暂缓执行的工作单元时，等待新单元期间重新检查内存预算的间隔（秒）
+ADMISSION_POLL_SECONDS = 0.2
+
+
+def default_worker_count():
+    """默认并发数，等于CPU核心数"""
+    return os.cpu_count() or 1
+
+
+@dataclass
+class RetryPolicy:
+    """
+    失败任务的重试策略
+
+    只重试error_kind在retry_on中的失败（进程崩溃、超时等偶发问题），
+    Inkscape明确报错的任务重试也不会成功。第n次重试前等待 backoff * 2^(n-1) 秒。
+    """
+    max_attempts: int = 2
+    backoff: float = 1.0
+    retry_on: tuple = (ERROR_CRASH,)
+
+    def should_retry(self, result, attempt):
+        return not result.success and result.error_kind in self.retry_on and attempt < self.max_attempts
+
+    def delay(self, attempt):
+        """第attempt次执行前的等待时间"""
+        return self.backoff * 2 ** max(0, attempt - 2)
+
+
+class ConversionScheduler:
+    """
+    并发转换调度器
+
+    把 (文件, 格式) 任务分配给多个工作线程，每个线程持有自己的Inkscape交互进程。
+    同一文档的任务默认放在一起，只加载一次；文档数少于并发数时按任务拆分，
+    以便占满所有工作线程。结果按任务提交顺序回调和返回，日志顺序保持稳定。
+    多页文档按页拆分的任务（task.page）每页为一个工作单元，各页并行执行
+    （交互模式打开文档时无法选择页面，这些任务逐个启动Inkscape）。
+    Inkscape任务超过timeout秒时结束其进程树；cancel_event被设置后，
+    排队中的任务不再执行，正在运行的Inkscape进程被结束，这些任务记为已取消。
+    设置memory_budget（字节）时，Inkscape任务按估计的内存峰值申请预算，
+    预算不足的工作单元暂缓执行，工作线程先执行后面能放下的小任务。
+    preflight为True时，SVG文档交给Inkscape之前先清理（见preflight模块），Inkscape打开清理后的临时文件；
+    同一文档的任务分在多个工作单元中时也只清理一次，文档的全部任务完成后删除临时文件。
+    传入shell_pool (ShellPool) 时从池中借用常驻的Inkscape进程，转换结束后不关闭，
+    memory_budget也可以是多个调度器共享的MemoryBudget。
+    png_compression为 "fast" 或 "max" 时，PNG输出在单独的线程池中重新压缩，
+    与后续任务的渲染同时进行，压缩完成后才交付结果。
+    传入history (DurationHistory) 时按预测耗时从长到短执行工作单元，长任务不会落在最后拖长总耗时：
+    任务列表整体排序，迭代器则在队列中等待的单元之间排序。结果仍按提交顺序交付。
+    来自压缩包的任务（task.member）在工作单元开始执行时才解压到临时目录，任务全部完成后删除。
+    设置tile_threshold（像素）时，超过该像素数的SVG到PNG导出按水平条带分块，由单独的线程池
+    并行启动多个Inkscape进程渲染（每块单独申请内存预算，与工作线程合计不超过workers个进程），按顺序拼接为最终输出；
+    verify_tiles为True时另外整幅渲染一次（同样占用内存预算）逐段比较，不一致时使用整幅渲染的结果；
+    要求校验但没有Pillow时不分块。
+    """
+
+    def __init__(self, inkscape_path, workers=None, use_shell=True, cache=None, force_rebuild=False,
+                 backends=None, timeout=DEFAULT_TASK_TIMEOUT, retry=None, cancel_event=None,
+                 memory_budget=None, preflight=False, shell_pool=None, png_compression=None, history=None,
+                 tile_threshold=None, verify_tiles=False):
+        self.inkscape_path = inkscape_path
+        self.workers = max(1, workers or default_worker_count())
+        self.use_shell = use_shell
+        self.cache = cache
+        self.force_rebuild = force_rebuild
+        self.backends = backends
+        self.timeout = timeout
+        self.retry = retry if retry is not None else RetryPolicy()
+        self.cancel_event = cancel_event if cancel_event is not None else threading.Event()
+        if isinstance(memory_budget, MemoryBudget):
+            self.memory = memory_budget
+        else:
+            self.memory = MemoryBudget(memory_budget) if memory_budget else None
+        self.estimator = MemoryEstimator()
+        self.preflight = preflight
+        self.shell_pool = shell_pool
+        # 工作线程借用交互进程的池：传入的shell_pool，分块渲染时为本次转换单独创建的池
+        self._pool = shell_pool
+        self.png_compression = png_compression
+        self._compressor = None
+        self.history = history
+        self._scratch = None
+        self.tile_threshold = tile_threshold
+        self.verify_tiles = verify_tiles
+        if tile_threshold and verify_tiles and not can_verify():
+            # 未经校验的拼接结果可能与整幅渲染不同，宁可不分块
+            logger.warning("校验分块渲染的结果需要Pillow，未安装Pillow，将不分块渲染")
+            self.tile_threshold = None
+        self._tile_pool = None
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def run(self, tasks, on_result=None, on_progress=None, on_complete=None):
+        """
+        执行全部任务并返回按提交顺序排列的TaskResult列表
+
+        tasks可以是列表，也可以是逐个产生任务的迭代器：迭代器的任务边产生边执行，
+        不必等全部任务列出。on_result(result) 按任务顺序调用；
+        on_progress(completed, total) 在每个任务完成时调用，迭代器尚未耗尽时total为目前已知的任务数；
+        on_complete(index) 在on_progress之前调用，index为刚完成的任务的序号（按完成顺序，而不是提交顺序）。
+        回调在工作线程中执行，但不会并发调用。
+        """
+        streaming = not isinstance(tasks, (list, tuple))
+        if streaming:
+            units = self._stream_units(tasks)
+            worker_count = self.workers
+            logger.info(f"使用 {worker_count} 个并发工作线程执行任务")
+        else:
+            if not tasks:
+                return []
+            units = self._plan_units(tasks)
+            worker_count = min(self.workers, len(units))
+            logger.info(f"使用 {worker_count} 个并发工作线程执行 {len(tasks)} 个任务")
+
+        # 队列中的单元按优先级（预测耗时从长到短）取出，优先级相同时按入队顺序
+        unit_queue = queue.PriorityQueue(maxsize=worker_count * 4)
+        results = {}
+        state = {"completed": 0, "next_index": 0, "total": 0 if streaming else len(tasks)}
+        lock = threading.Lock()
+
+        def deliver(index, result):
+            with lock:
+                # 每个任务只交付一次（工作单元出错后补交的失败结果不会覆盖已交付的结果）
+                if index in results:
+                    return
+                results[index] = result
+                state["completed"] += 1
+                _call(on_complete, index)
+                _call(on_progress, state["completed"], state["total"])
+                # 只回调前面任务都已完成的结果，保证顺序稳定
+                while state["next_index"] in results:
+                    _call(on_result, results[state["next_index"]])
+                    state["next_index"] += 1
+
+        self._scratch = ScratchArea()
+        self._handed_off = set()
+        self._preflights = PreflightCache() if self.preflight else None
+        if self._preflights is not None and not streaming:
+            # 列表中同一文档的任务可能分在多个单元中，全部登记后才开始执行，临时文件不会被提前删除
+            for unit in units:
+                self._preflights.expect(task for _, task in unit)
+        if self.png_compression:
+            self._compressor = ThreadPoolExecutor(max_workers=max(1, worker_count // 2),
+                                                  thread_name_prefix="png-compress")
+        if self.tile_threshold:
+            # 条带与工作线程占用同一个进程池的名额，Inkscape进程总数不超过workers
+            if self.shell_pool is None:
+                self._pool = ShellPool(self.inkscape_path, self.workers, self.use_shell)
+            self._tile_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tile")
+        threads = [
+            threading.Thread(target=self._worker_loop, args=(unit_queue, deliver), daemon=True)
+            for _ in range(worker_count)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # 在当前线程中分发工作单元，队列有上限，迭代器按工作线程的处理速度被消耗
+        sequence = 0
+        try:
+            for sequence, unit in enumerate(units):
+                # 取消后不再从迭代器中取任务；列表中的任务仍然分发，由工作线程直接记为已取消
+                if streaming and self.cancelled:
+                    break
+                if streaming:
+                    with lock:
+                        state["total"] += len(unit)
+                    if self._preflights is not None:
+                        self._preflights.expect(task for _, task in unit)
+                # 任务列表已整体排序，迭代器的单元在入队时计算优先级
+                priority = self._unit_priority(unit) if streaming else 0
+                # 记录入队时间，用于统计任务的排队等待时间
+                unit_queue.put((priority, sequence, time.perf_counter(), unit))
+        finally:
+            for offset in range(len(threads)):
+                unit_queue.put((math.inf, sequence + 1 + offset, None, None))
+            for thread in threads:
+                thread.join()
+            if self._tile_pool is not None:
+                self._tile_pool.shutdown(wait=True)
+                self._tile_pool = None
+            if self._pool is not self.shell_pool:
+                self._pool.close()
+                self._pool = self.shell_pool
+            if self._compressor is not None:
+                # 等待全部压缩完成（结果在压缩完成后才交付）
+                self._compressor.shutdown(wait=True)
+                self._compressor = None
+            if self._preflights is not None:
+                self._preflights.close()
+                self._preflights = None
+            self._scratch.close()
+
+        if self.cache is not None:
+            try:
+                self.cache.save()
+            except OSError as e:
+                logger.warning(f"无法保存缓存清单: {e}")
+        return [results[index] for index in range(state["total"])]
+
+    def _plan_units(self, tasks):
+        """把任务划分为工作单元：每个单元是同一输入文件（多页文档为同一页）的 [(序号, 任务)] 列表"""
+        documents = {}
+        for index, task in enumerate(tasks):
+            documents.setdefault(task.document_key, []).append((index, task))
+        units = list(documents.values())
+        if len(units) < self.workers:
+            units = [[item] for unit in units for item in unit]
+        if self.history is not None:
+            units.sort(key=self._unit_priority)
+        return units
+
+    def _unit_priority(self, unit):
+        """工作单元的优先级：预测耗时越长越靠前，没有耗时记录时按入队顺序"""
+        if self.history is None:
+            return 0
+        return -sum(self.history.predict(task)[0] for _, task in unit)
+
+    def _stream_units(self, tasks):
+        """从任务迭代器中逐个产生工作单元，相邻的同一输入文件（多页文档为同一页）的任务放在一个单元中"""
+        unit = []
+        for index, task in enumerate(tasks):
+            if unit and unit[-1][1].document_key != task.document_key:
+                yield unit
+                unit = []
+            unit.append((index, task))
+        if unit:
+            yield unit
+
+    def _worker_loop(self, unit_queue, deliver):
+        """
+        工作线程：不断取出工作单元并执行
+
+        内存预算不足的单元暂缓执行（每个线程最多暂缓一个），线程继续执行后面的单元，
+        预算足够时优先执行暂缓的单元；再遇到放不下的单元或队列结束时，等待预算执行暂缓的单元。
+        """
+        if self._pool is not None:
+            shell = _PooledShell(self._pool, self.timeout, self.cancel_event)
+        else:
+            shell = _WorkerShell(self.inkscape_path, self.use_shell, self.timeout, self.cancel_event)
+        deferred = None
+        try:
+            while True:
+                if deferred is not None and self.memory.try_acquire(deferred[2]):
+                    self._run_deferred(deferred, shell, deliver, wait=False)
+                    deferred = None
+                    continue
+                try:
+                    item = unit_queue.get(timeout=ADMISSION_POLL_SECONDS if deferred is not None else None)
+                except queue.Empty:
+                    continue
+                _, _, enqueued, unit = item
+                if unit is None:
+                    break
+                try:
+                    admitted = self._prepare_unit(unit, enqueued, shell, deliver)
+                except Exception as e:
+                    self._fail_unit(unit, enqueued, deliver, e)
+                    continue
+                if admitted is None:
+                    continue
+                if deferred is not None:
+                    self._run_deferred(deferred, shell, deliver)
+                pending, _, amount = admitted
+                logger.info(f"{pending[0][1].input_path.name}: 内存预算不足 (需要 {amount // MB} MB)，暂缓执行")
+                deferred = admitted
+            if deferred is not None:
+                self._run_deferred(deferred, shell, deliver)
+        finally:
+            shell.close()
+
+    def _prepare_unit(self, unit, enqueued, shell, deliver):
+        """
+        执行一个工作单元中能立即执行的任务
+
+        内存预算不足时返回需要暂缓的 (pending, enqueued, amount)，否则返回None。
+        """
+        unit = self._extract(unit, enqueued, deliver)
+        pending = self._run_local(unit, enqueued, deliver)
+        if self._tile_pool is not None:
+            pending = self._run_tiled(pending, enqueued, deliver)
+        if not pending:
+            return None
+        if self.memory is None:
+            self._run_pending(pending, enqueued, shell, deliver)
+            return None
+        amount = self._estimate(pending)
+        if self.memory.try_acquire(amount):
+            self._run_admitted(pending, enqueued, amount, shell, deliver)
+            return None
+        return pending, enqueued, amount
+
+    def _run_deferred(self, deferred, shell, deliver, wait=True):
+        """执行暂缓的工作单元，wait为True时先等待预算（已申请时为False）"""
+        pending, enqueued, _ = deferred
+        try:
+            self._run_admitted(*deferred, shell, deliver, wait=wait)
+        except Exception as e:
+            self._fail_unit(pending, enqueued, deliver, e)
+
+    def _fail_unit(self, unit, enqueued, deliver, error):
+        """
+        工作单元执行中出现意外错误：尚未交出的任务记为失败
+
+        工作线程继续处理后面的单元，不会因一个单元出错而退出，每个任务都有结果。
+        """
+        logger.exception(f"处理 {unit[0][1].input_path.name} 时出错: {error}")
+        started = time.perf_counter()
+        for index, task in unit:
+            if index in self._handed_off:
+                continue
+            result = TaskResult(task, False, f"内部错误: {error}")
+            result.timing.queue_wait = started - enqueued
+            if self._preflights is not None:
+                self._preflights.release(task)
+            deliver(index, result)
+
+    def _extract(self, unit, enqueued, deliver):
+        """压缩包中的成员解压到临时目录，返回使用解压后文件的工作单元；解压失败的任务记为失败"""
+        member = unit[0][1].member
+        if member is None or self.cancelled:
+            return unit
+        started = time.perf_counter()
+        try:
+            # 输出写在压缩包旁的同名目录中，目录可能还不存在
+            for _, task in unit:
+                task.output_path.parent.mkdir(parents=True, exist_ok=True)
+            source = self._scratch.acquire(member, count=len(unit))
+        except (OSError, ArchiveError) as e:
+            logger.error(f"{member.path.name}: 无法从压缩包中解压: {e}")
+            for index, task in unit:
+                self._finish(index, TaskResult(task, False, f"无法从压缩包中解压: {e}"), deliver, enqueued, started)
+            return []
+        return [(index, replace(task, source_path=source)) for index, task in unit]
+
+    def _run_local(self, unit, enqueued, deliver):
+        """
+        完成工作单元中不需要Inkscape的任务，返回需要Inkscape的 [(序号, 任务)]
+
+        命中缓存的任务直接返回，注册表中有进程内后端的任务交给该后端。
+        """
+        pending = []
+        for index, task in unit:
+            started = time.perf_counter()
+            if self.cancelled:
+                self._finish(index, cancelled_result(task), deliver, enqueued, started)
+                continue
+            backend = self.backends.select(task) if self.backends is not None else None
+            cache_hit = self._fetch_cached(task, backend.name if backend is not None else None)
+            if cache_hit:
+                self._finish(index, TaskResult(task, True, cache_hit=cache_hit, backend="cache"),
+                             deliver, enqueued, started)
+                continue
+            if backend is None:
+                pending.append((index, task))
+                continue
+            try:
+                result = backend.convert(task)
+            except Exception as e:
+                result = TaskResult(task, False, str(e), backend=backend.name)
+            self._finish(index, result, deliver, enqueued, started)
+        return pending
+
+    def _run_tiled(self, pending, enqueued, deliver):
+        """分块渲染需要分块的大幅位图任务，返回其余的 [(序号, 任务)]"""
+        rest = []
+        for index, task in pending:
+            plan = plan_tiles(task, self.tile_threshold, self.workers)
+            if plan is None:
+                rest.append((index, task))
+                continue
+            started = time.perf_counter()
+            if self.cancelled:
+                self._finish(index, cancelled_result(task), deliver, enqueued, started)
+                continue
+            logger.info(f"{task.input_path.name}: 分块渲染 {plan.describe()}")
+            report = self._preflights.acquire(task) if self._preflights is not None else None
+            tiled = replace(task, load_path=report.optimized) if report is not None else task
+            result = self._render_tiles(tiled, plan)
+            result.task = task
+            if report is not None:
+                self._preflights.record(report, result.timing)
+            self._finish(index, result, deliver, enqueued, started)
+        return rest
+
+    def _render_tiles(self, task, plan):
+        """并行渲染全部条带并按顺序拼接，每个条带完成后立即写入输出并删除"""
+        started = time.perf_counter()
+        directory = tempfile.mkdtemp(prefix="fig_tiles_")
+        futures = [self._tile_pool.submit(self._export_admitted, tile) for tile in plan.tile_tasks(task, directory)]
+        timing = TaskTiming()
+        stitcher = None
+        try:
+            stitcher = PngStitcher(task.output_path, plan, task.dpi)
+            for number, future in enumerate(futures):
+                tile_result = future.result()
+                timing.peak_rss_bytes = max(timing.peak_rss_bytes, tile_result.timing.peak_rss_bytes)
+                timing.estimated_bytes = max(timing.estimated_bytes, tile_result.timing.estimated_bytes)
+                if not tile_result.success:
+                    error = f"第 {number + 1}/{len(futures)} 块渲染失败: {tile_result.error}"
+                    result = TaskResult(task, False, error, error_kind=tile_result.error_kind,
+                                        attempts=tile_result.attempts)
+                    break
+                stitcher.add(tile_result.task.output_path)
+                os.unlink(tile_result.task.output_path)
+            else:
+                stitcher.close()
+                stitcher = None
+                result = TaskResult(task, True, backend="inkscape-tiled")
+        except (OSError, ValueError) as e:
+            result = TaskResult(task, False, f"拼接分块渲染的结果失败: {e}")
+        finally:
+            for future in futures:
+                future.cancel()
+            if stitcher is not None:
+                stitcher.abort()
+            # 等待仍在运行的条带结束后再删除临时目录
+            for future in futures:
+                if not future.cancelled():
+                    future.exception()
+            shutil.rmtree(directory, ignore_errors=True)
+        timing.render = time.perf_counter() - started
+        result.timing = timing
+        if result.success:
+            logger.info(f"{task.output_path.name}: {len(futures)} 块分块渲染完成，耗时 {timing.render:.2f} 秒")
+            if self.verify_tiles:
+                self._verify_tiles(task)
+        return result
+
+    def _export_admitted(self, task):
+        """
+        在内存预算内用单独的Inkscape进程导出一个条带（或校验用的整幅渲染），偶发的失败按重试策略重试
+
+        该进程也占用进程池的名额，与工作线程合计不超过Inkscape进程数的上限。
+        """
+        amount = self.estimator.estimate(task)
+        if self.memory is not None and not self.memory.acquire(amount, self.cancel_event):
+            return cancelled_result(task)
+        if self._pool is not None and not self._pool.acquire_slot(self.cancel_event):
+            if self.memory is not None:
+                self.memory.release(amount)
+            return cancelled_result(task)
+        try:
+            attempt = 1
+            while True:
+                result = run_export(self.inkscape_path, task, self.timeout, self.cancel_event)
+                result.attempts = attempt
+                result.timing.estimated_bytes = amount
+                if not self.retry.should_retry(result, attempt) or self.cancelled:
+                    return result
+                attempt += 1
+                if self.cancel_event.wait(self.retry.delay(attempt)):
+                    return cancelled_result(task)
+        finally:
+            if self._pool is not None:
+                self._pool.release_slot()
+            if self.memory is not None:
+                self.memory.release(amount)
+
+    def _verify_tiles(self, task):
+        """整幅渲染一次，与拼接结果逐段逐像素比较，不一致时改用整幅渲染的结果"""
+        output_path = task.output_path
+        reference = output_path.with_name(f".{output_path.stem}.reference{output_path.suffix}")
+        result = self._export_admitted(replace(task, output_path=reference))
+        try:
+            if not result.success:
+                logger.warning(f"{output_path.name}: 无法整幅渲染以校验分块结果: {result.error}")
+                return
+            difference = compare_images(output_path, reference)
+            if difference is None:
+                logger.info(f"{output_path.name}: 分块渲染结果与整幅渲染逐像素一致")
+                return
+            logger.warning(f"{output_path.name}: 分块渲染结果与整幅渲染不一致（{difference}），使用整幅渲染的结果")
+            os.replace(reference, output_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"{output_path.name}: 校验分块渲染结果失败: {e}")
+        finally:
+            try:
+                reference.unlink()
+            except OSError:
+                pass
+
+    def _estimate(self, pending):
+        """同一文档的任务在一个Inkscape进程中依次执行，内存峰值取其中最大的任务"""
+        return max(self.estimator.estimate(task) for _, task in pending)
+
+    def _run_admitted(self, pending, enqueued, amount, shell, deliver, wait=False):
+        """在内存预算内执行Inkscape任务，wait为True时先等待预算（已申请时为False），结束后归还"""
+        if wait and not self.memory.acquire(amount, self.cancel_event):
+            started = time.perf_counter()
+            for index, task in pending:
+                self._finish(index, cancelled_result(task), deliver, enqueued, started)
+            return
+        try:
+            self._run_pending(pending, enqueued, shell, deliver)
+        finally:
+            self.memory.release(amount)
+
+    def _run_pending(self, pending, enqueued, shell, deliver):
+        """用Inkscape执行同一文档的任务，按重试策略重试偶发的失败"""
+        document = pending[0][1].source_file
+        with shell.lease():
+            report = self._preflights.acquire(pending[0][1]) if self._preflights is not None else None
+            if report is not None:
+                pending = [(index, replace(task, load_path=report.optimized)) for index, task in pending]
+            attempt = 1
+            while pending:
+                retry = self._run_inkscape(pending, attempt, shell, deliver, enqueued, report)
+                if not retry:
+                    break
+                attempt += 1
+                delay = self.retry.delay(attempt)
+                logger.warning(f"{document.name}: {len(retry)} 个任务将在 {delay:g} 秒后重试 "
+                               f"(第 {attempt} 次执行)")
+                if self.cancel_event.wait(delay):
+                    started = time.perf_counter()
+                    for index, task in retry:
+                        self._finish(index, cancelled_result(task), deliver, enqueued, started)
+                    break
+                pending = retry
+
+    def _run_inkscape(self, pending, attempt, shell, deliver, enqueued, preflight=None):
+        """用Inkscape执行同一文档的任务，返回需要重试的 [(序号, 任务)]"""
+        indices = [index for index, _ in pending]
+        pending_tasks = [task for _, task in pending]
+        started = time.perf_counter()
+        # 交互模式打开文档时无法选择页面，多页文档的页面逐个任务调用Inkscape
+        inkscape_shell = shell.get() if pending_tasks[0].page is None else None
+        if inkscape_shell is not None:
+            results = inkscape_shell.convert_document(pending_tasks[0].document_path, pending_tasks)
+        else:
+            results = (run_export(self.inkscape_path, task, self.timeout, self.cancel_event)
+                       for task in pending_tasks)
+
+        retry = []
+        delivered = 0
+        try:
+            for result in results:
+                index = indices[delivered]
+                result.attempts = attempt
+                result.timing.estimated_bytes = self.estimator.estimate(result.task)
+                if result.success:
+                    # 用实测的峰值内存校正之后的估计
+                    self.estimator.calibrate(result.timing.estimated_bytes, result.timing.peak_rss_bytes)
+                if self.retry.should_retry(result, attempt) and not self.cancelled:
+                    logger.warning(f"转换 {result.task.input_path.name} 到 {result.task.format_name} "
+                                   f"失败，准备重试: {result.error}")
+                    retry.append((index, result.task))
+                    delivered += 1
+                else:
+                    if preflight is not None:
+                        self._preflights.record(preflight, result.timing)
+                    self._finish(index, result, deliver, enqueued, started)
+                    # 交出结果后才计为已交付，_finish出错时该任务在下面记为失败
+                    delivered += 1
+                started = time.perf_counter()
+        except Exception as e:
+            logger.error(f"转换 {pending_tasks[0].input_path.name} 时出错: {e}")
+            for index, task in pending[delivered:]:
+                self._finish(index, TaskResult(task, False, str(e), attempts=attempt), deliver, enqueued, started)
+        return retry
+
+    def _finish(self, index, result, deliver, enqueued, started):
+        """记录耗时和文件大小，转换成功的结果存入缓存，然后交付；需要压缩的PNG交给压缩线程池"""
+        result.timing.queue_wait = started - enqueued
+        result.timing.input_bytes = result.task.input_size()
+        if (self._compressor is not None and result.success and result.task.export_type == "png"
+                and result.backend != "cache"):
+            self._compressor.submit(self._compress, index, result, deliver, started)
+        else:
+            self._complete(index, result, deliver, started)
+        self._handed_off.add(index)
+
+    def _compress(self, index, result, deliver, started):
+        """压缩线程：重新压缩PNG输出，然后交付结果；压缩失败时保留原输出"""
+        try:
+            report = compress_png(result.task.output_path, self.png_compression)
+            result.timing.compress = report.seconds
+            result.timing.compressed_saved_bytes = report.saved_bytes
+            logger.info(report.describe())
+        except Exception as e:
+            logger.warning(f"压缩 {result.task.output_path.name} 失败，保留原文件: {e}")
+        self._complete(index, result, deliver, started)
+
+    def _complete(self, index, result, deliver, started):
+        timing = result.timing
+        timing.wall = time.perf_counter() - started
+        try:
+            if self._preflights is not None:
+                self._preflights.release(result.task)
+            if result.success:
+                timing.output_bytes = _file_size(result.task.output_path)
+                if self.cache is not None:
+                    # Inkscape（包括分块渲染）的输出在缓存键中不区分后端
+                    backend = None if result.backend.startswith("inkscape") else result.backend
+                    self.cache.store(result.task, **self._cache_variant(result.task, backend))
+            if result.task.source_path is not None:
+                self._scratch.release(result.task.source_path)
+        except Exception as e:
+            # 输出已经写好，缓存或临时文件出错不影响结果，仍然交付
+            logger.exception(f"{result.task.output_path.name}: 完成任务时出错: {e}")
+        deliver(index, result)
+
+    def _cache_variant(self, task, backend):
+        """
+        缓存键中影响输出内容的设置：进程内后端的名称（Inkscape为None）、PNG输出的压缩模式，
+        以及Inkscape转换的SVG文档是否经过预处理
+        """
+        preflight = self.preflight and backend is None and task.input_path.suffix.lower() == ".svg"
+        return {"backend": backend, "compression": self.png_compression if task.export_type == "png" else None,
+                "preflight": preflight}
+
+    def _fetch_cached(self, task, backend=None):
+        """查询缓存，未启用缓存、要求强制重新转换或查询失败时返回None"""
+        if self.cache is None or self.force_rebuild:
+            return None
+        try:
+            return self.cache.fetch(task, **self._cache_variant(task, backend))
+        except OSError as e:
+            logger.warning(f"查询缓存失败 {task.input_path.name}: {e}")
+            return None
+
+
+def _call(callback, *args):
+    """调用回调，回调出错时只记录日志，不影响其他任务的交付"""
+    if callback is None:
+        return
+    try:
+        callback(*args)
+    except Exception as e:
+        logger.exception(f"回调 {getattr(callback, '__name__', callback)} 出错: {e}")
+
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return 0
+
+
+class _WorkerShell:
+    """工作线程持有的Inkscape交互进程，第一次需要时才启动"""
+
+    def __init__(self, inkscape_path, enabled, timeout=None, cancel_event=None):
+        self.inkscape_path = inkscape_path
+        self.enabled = enabled
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.shell = None
+
+    def bind(self, timeout, cancel_event):
+        """交给另一批转换使用时更新超时和取消请求"""
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        if self.shell is not None:
+            self.shell.timeout = timeout
+            self.shell.cancel_event = cancel_event
+
+    def lease(self):
+        """执行一个工作单元期间占用交互进程；线程自己持有的进程不需要借还"""
+        return nullcontext(self)
+
+    def get(self):
+        """返回交互进程，不支持交互模式时返回None（改为逐个任务调用）"""
+        if self.enabled and self.shell is None:
+            shell = InkscapeShell(self.inkscape_path, self.timeout, self.cancel_event)
+            try:
+                shell.start()
+                self.shell = shell
+            except ShellError as e:
+                if e.kind == ERROR_CANCELLED:
+                    return None
+                logger.warning(f"无法使用Inkscape交互模式，改为逐个任务调用: {e}")
+                self.enabled = False
+        return self.shell
+
+    def close(self):
+        if self.shell is not None:
+            self.shell.close()
+            self.shell = None
+
+
+class ShellPool:
+    """
+    跨多批转换复用的Inkscape交互进程池（转换服务使用）
+
+    最多同时借出size个进程，同时也限制了所有批次合计的Inkscape进程数：
+    分块渲染的条带用单独的Inkscape进程，也要先占用一个名额 (acquire_slot)，
+    并结束多出的空闲进程，空闲、借出的进程和单独的进程合计不超过size个。
+    归还的进程保持运行，下一批转换不必再启动Inkscape。
+    """
+
+    def __init__(self, inkscape_path, size, use_shell=True):
+        self.inkscape_path = inkscape_path
+        self.size = max(1, size)
+        self.use_shell = use_shell
+        self._idle = []
+        self._shells = 0
+        self._standalone = 0
+        self._slots = threading.Semaphore(self.size)
+        self._lock = threading.Lock()
+
+    def _wait_slot(self, cancel_event):
+        while not self._slots.acquire(timeout=ADMISSION_POLL_SECONDS):
+            if cancel_event.is_set():
+                return False
+        return True
+
+    def acquire_slot(self, cancel_event):
+        """为一个单独的Inkscape进程占用名额，全部占用时等待；等待期间被取消时返回False"""
+        if not self._wait_slot(cancel_event):
+            return False
+        with self._lock:
+            self._standalone += 1
+            surplus = []
+            while self._idle and self._shells + self._standalone > self.size:
+                surplus.append(self._idle.pop(0))
+                self._shells -= 1
+        for shell in surplus:
+            shell.close()
+        return True
+
+    def release_slot(self):
+        with self._lock:
+            self._standalone -= 1
+        self._slots.release()
+
+    def acquire(self, timeout, cancel_event):
+        """借出一个进程，全部借出时等待；等待期间被取消时返回None"""
+        if not self._wait_slot(cancel_event):
+            return None
+        with self._lock:
+            if self._idle:
+                shell = self._idle.pop()
+            else:
+                shell = _WorkerShell(self.inkscape_path, self.use_shell)
+                self._shells += 1
+        shell.bind(timeout, cancel_event)
+        return shell
+
+    def release(self, shell):
+        with self._lock:
+            self._idle.append(shell)
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self._shells -= len(idle)
+        for shell in idle:
+            shell.close()
+
+
+class _PooledShell:
+    """工作线程从ShellPool借用的交互进程，只在执行工作单元期间占用"""
+
+    def __init__(self, pool, timeout, cancel_event):
+        self.pool = pool
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.current = None
+
+    @contextmanager
+    def lease(self):
+        self.current = self.pool.acquire(self.timeout, self.cancel_event)
+        try:
+            yield self
+        finally:
+            if self.current is not None:
+                self.pool.release(self.current)
+            self.current = None
+
+    def get(self):
+        return self.current.get() if self.current is not None else None
+
+    def close(self):
+        # 进程归池所有，由ShellPool.close结束
+        pass
@@ -0,0 +1,325 @@
+import logging
+import os
+import queue
+import subprocess
+import threading
+import time
+from pathlib import Path
+
+from .inkscape import CANCEL_POLL_SECONDS, decode_output, run_export
+from .memory import read_peak_rss, reset_peak_rss
+from .process import kill_process_tree, process_group_options
+from .tasks import ERROR_CANCELLED, ERROR_CRASH, ERROR_TIMEOUT, TaskResult, TaskTiming, cancelled_result
+
+
+logger = logging.getLogger("FigConverter.shell")
+
+# Inkscape交互模式的提示符
+PROMPT = b"> "
+
+# 动作参数中不能出现的字符（动作以分号分隔、以换行结束）
+UNSAFE_PATH_CHARS = (';', '\n', '\r')
+
+# 结束进程后等待输出读取线程退出的时间（秒），超过后不再等待，由线程自己关闭管道
+READER_JOIN_SECONDS = 2
+
+
+class ShellError(Exception):
+    """Inkscape交互进程启动失败或异常退出"""
+    kind = ERROR_CRASH
+
+
+class ShellTimeout(ShellError):
+    """动作超时未完成"""
+    kind = ERROR_TIMEOUT
+
+
+class ShellCancelled(ShellError):
+    """等待动作完成时收到取消请求"""
+    kind = ERROR_CANCELLED
+
+
+class InkscapeShell:
+    """
+    常驻的Inkscape交互进程 (inkscape --shell)
+
+    通过标准输入发送 file-open / export-do / file-close 等动作，
+    一个进程可以连续处理多个文档，避免每个任务都冷启动Inkscape。
+    进程崩溃时当前文档的任务记为失败，下一个文档会自动重启进程。
+    单个动作超过timeout秒或cancel_event被设置时结束整个进程树。
+    """
+
+    def __init__(self, inkscape_path, timeout=None, cancel_event=None):
+        self.inkscape_path = inkscape_path
+        self.timeout = timeout
+        self.cancel_event = cancel_event
+        self.process = None
+        self.crashes = 0
+        # 最近一次启动进程的耗时，记在启动后的第一个任务上
+        self._start_seconds = 0.0
+        self._stdout_queue = queue.Queue()
+        self._stderr_lines = []
+        self._stderr_lock = threading.Lock()
+        self._readers = []
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def running(self):
+        """交互进程是否仍在运行"""
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        """启动交互进程并等待第一个提示符"""
+        self.close()
+        started = time.perf_counter()
+        # 每个进程使用新的队列和错误输出列表，作为参数交给读取线程，
+        # 旧进程的读取线程不会把输出（或结束标记）放进新进程的队列
+        self._stdout_queue = queue.Queue()
+        with self._stderr_lock:
+            self._stderr_lines = []
+
+        try:
+            self.process = subprocess.Popen(
+                [self.inkscape_path, "--shell"],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                **process_group_options()
+            )
+        except OSError as e:
+            self.process = None
+            raise ShellError(f"无法启动Inkscape交互模式: {e}") from e
+
+        self._readers = [
+            threading.Thread(target=self._read_stdout, args=(self.process.stdout, self._stdout_queue), daemon=True),
+            threading.Thread(target=self._read_stderr, args=(self.process.stderr, self._stderr_lines), daemon=True),
+        ]
+        for reader in self._readers:
+            reader.start()
+
+        try:
+            self._wait_prompt()
+        except ShellError:
+            self.close(force=True)
+            raise
+        self._start_seconds = time.perf_counter() - started
+        logger.info(f"Inkscape交互进程已启动 (PID {self.process.pid})")
+
+    def close(self, force=False):
+        """结束交互进程，force为True时不等待进程自行退出（进程已无响应）"""
+        process, self.process = self.process, None
+        if process is None:
+            return
+        try:
+            if force:
+                kill_process_tree(process)
+            elif process.poll() is None:
+                try:
+                    process.stdin.write(b"quit\n")
+                    process.stdin.flush()
+                except OSError:
+                    pass
+                try:
+                    process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    kill_process_tree(process)
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+            # 标准输出和错误输出由读取线程在读到结尾后关闭，不在线程可能仍阻塞于读取时关闭；
+            # 子进程（例如Ghostscript）仍占用管道时不再等待，线程随管道关闭而退出
+            readers, self._readers = self._readers, []
+            for reader in readers:
+                reader.join(timeout=READER_JOIN_SECONDS)
+
+    def convert_document(self, input_path, tasks):
+        """
+        打开一个文档并依次完成它的全部导出任务，逐个返回TaskResult
+
+        路径无法在交互模式中表示时，改为单次调用Inkscape。
+        """
+        tasks = list(tasks)
+        if not self._is_shell_safe(input_path, tasks):
+            logger.debug(f"路径包含特殊字符，改用单次调用: {input_path}")
+            for task in tasks:
+                yield run_export(self.inkscape_path, task, self.timeout, self.cancel_event)
+            return
+
+        pending = list(tasks)
+        document_open = False
+        try:
+            self._ensure_running()
+            process_start, self._start_seconds = self._start_seconds, 0.0
+            opened = time.perf_counter()
+            open_errors = self._run_action(f"file-open:{Path(input_path)}")
+            parse_seconds = time.perf_counter() - opened
+            document_open = True
+            while pending:
+                task = pending[0]
+                self._check_cancelled()
+                result = self._export(task, open_errors)
+                # 启动进程和打开文档的耗时只记在文档的第一个任务上
+                result.timing.process_start, process_start = process_start, 0.0
+                result.timing.parse, parse_seconds = parse_seconds, 0.0
+                yield result
+                pending.pop(0)
+            document_open = False
+            self._run_action("file-close")
+        except ShellError as e:
+            opened, document_open = document_open, False
+            process = self.process
+            if e.kind == ERROR_CANCELLED:
+                logger.info("已取消，结束Inkscape交互进程")
+            else:
+                logger.error(f"Inkscape交互进程出错: {e}")
+                if e.kind == ERROR_CRASH:
+                    self.crashes += 1
+            # 超时或取消时进程可能已无响应，直接结束
+            self.close(force=e.kind != ERROR_CRASH)
+            exit_code = process.returncode if process is not None else None
+            for position, task in enumerate(pending):
+                if e.kind == ERROR_CANCELLED:
+                    result = cancelled_result(task)
+                elif e.kind == ERROR_TIMEOUT and (position == 0 or not opened):
+                    # 打开文档时超时，文档的全部任务都记为超时
+                    result = TaskResult(task, False, f"{e}，已结束Inkscape进程", error_kind=ERROR_TIMEOUT)
+                elif e.kind == ERROR_TIMEOUT:
+                    result = TaskResult(task, False, "同一文档的前一个任务超时，Inkscape进程已结束",
+                                        error_kind=ERROR_CRASH)
+                else:
+                    result = TaskResult(task, False, str(e), error_kind=ERROR_CRASH)
+                result.timing.exit_code = exit_code
+                yield result
+        finally:
+            # 调用方提前停止迭代时也要关闭文档，避免文档在进程中堆积
+            if document_open and self.running:
+                try:
+                    self._run_action("file-close")
+                except ShellError:
+                    self.close()
+
+    def _is_shell_safe(self, input_path, tasks):
+        """检查路径能否作为动作参数传递"""
+        paths = [str(input_path)] + [str(task.output_path) for task in tasks]
+        return not any(ch in path for path in paths for ch in UNSAFE_PATH_CHARS)
+
+    def _ensure_running(self):
+        """进程不存在或已退出时重新启动"""
+        if self.running:
+            return
+        if self.crashes:
+            logger.warning(f"重新启动Inkscape交互进程 (已崩溃 {self.crashes} 次)")
+        self.start()
+
+    def _export(self, task, open_errors=""):
+        """在当前打开的文档上执行一次导出"""
+        output_path = Path(task.output_path)
+        # 先导出到临时文件，再替换目标文件，既能确认导出成功，也避免留下不完整的输出
+        partial_path = output_path.with_name(f".{output_path.stem}.partial{output_path.suffix}")
+        try:
+            partial_path.unlink()
+        except FileNotFoundError:
+            pass
+
+        actions = [
+            f"export-filename:{partial_path}",
+            f"export-type:{task.export_type}",
+            # 导出选项在进程内会保留，矢量导出时恢复默认的96 DPI
+            f"export-dpi:{task.dpi if task.is_raster else 96}",
+            "export-do",
+        ]
+        pid = self.process.pid
+        # 进程会处理多个任务，导出前重置峰值内存记录，使峰值只反映本次导出
+        reset_peak_rss(pid)
+        started = time.perf_counter()
+        stderr = self._run_action("; ".join(actions))
+        timing = TaskTiming(render=time.perf_counter() - started, peak_rss_bytes=read_peak_rss(pid))
+
+        if not partial_path.is_file():
+            return TaskResult(task, False, stderr or open_errors or "Inkscape未生成输出文件", timing=timing)
+        try:
+            os.replace(partial_path, output_path)
+        except OSError as e:
+            return TaskResult(task, False, f"无法写入输出文件: {e}", timing=timing)
+        return TaskResult(task, True, timing=timing)
+
+    def _check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise ShellCancelled("已取消")
+
+    def _run_action(self, line):
+        """发送一行动作并等待提示符，返回期间产生的错误输出"""
+        with self._stderr_lock:
+            self._stderr_lines.clear()
+        logger.debug(f"发送动作: {line}")
+        try:
+            self.process.stdin.write(line.encode('utf-8') + b"\n")
+            self.process.stdin.flush()
+        except OSError as e:
+            raise ShellError(f"Inkscape进程异常退出: {e}") from e
+        self._wait_prompt(self.timeout)
+        with self._stderr_lock:
+            return "".join(self._stderr_lines).strip()
+
+    def _wait_prompt(self, timeout=None):
+        """读取标准输出直到出现提示符，超过timeout秒时抛出ShellTimeout"""
+        deadline = time.perf_counter() + timeout if timeout else None
+        buffer = b""
+        while not buffer.endswith(PROMPT):
+            try:
+                chunk = self._stdout_queue.get(timeout=self._poll_interval(deadline))
+            except queue.Empty:
+                self._check_cancelled()
+                if deadline is not None and time.perf_counter() >= deadline:
+                    raise ShellTimeout(f"超过 {timeout:g} 秒未完成")
+                continue
+            if chunk is None:
+                self.process.wait()
+                with self._stderr_lock:
+                    stderr = "".join(self._stderr_lines).strip()
+                raise ShellError(
+                    f"Inkscape进程异常退出 (返回码 {self.process.returncode}): {stderr}"
+                )
+            buffer += chunk
+
+    def _poll_interval(self, deadline):
+        """等待输出的时长：需要检查取消或超时时定期醒来，否则一直等待"""
+        wait = CANCEL_POLL_SECONDS if self.cancel_event is not None else None
+        if deadline is not None:
+            remaining = max(0.0, deadline - time.perf_counter())
+            wait = remaining if wait is None else min(wait, remaining)
+        return wait
+
+    @staticmethod
+    def _read_stdout(stream, output_queue):
+        """后台线程：把一个进程的标准输出转发到它的队列，结束时放入None并关闭管道"""
+        try:
+            while True:
+                chunk = os.read(stream.fileno(), 4096)
+                if not chunk:
+                    break
+                output_queue.put(chunk)
+        except (OSError, ValueError):
+            pass
+        finally:
+            output_queue.put(None)
+            stream.close()
+
+    def _read_stderr(self, stream, lines):
+        """后台线程：把一个进程的错误输出收集到它的列表中，结束时关闭管道"""
+        try:
+            for line in iter(stream.readline, b""):
+                with self._stderr_lock:
+                    lines.append(decode_output(line))
+        except (OSError, ValueError):
+            pass
+        finally:
+            stream.close()
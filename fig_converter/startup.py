@@ -0,0 +1,69 @@
+"""
+进程启动时间，用于测量启动耗时
+
+在导入程序包时使用，只依赖标准库中已加载的模块，不增加启动时间。
+"""
+import os
+import sys
+import time
+
+
+def process_started_at():
+    """
+    程序启动的时间 (time.time())
+
+    PyInstaller单文件版由引导进程先把依赖解压到临时目录，再启动运行Python的子进程，
+    这时返回引导进程的启动时间，测量的启动耗时包括解压。无法读取时返回当前时间。
+    """
+    pid = os.getppid() if _is_onefile_child() else os.getpid()
+    started = None
+    if sys.platform.startswith("linux"):
+        started = _linux_start_time(pid)
+    elif os.name == 'nt':  # Windows
+        started = _windows_start_time(pid)
+    now = time.time()
+    if started is None or started > now:
+        return now
+    return started
+
+
+def _is_onefile_child():
+    """是否为单文件版解压后启动的子进程：依赖解压在临时目录而不是可执行文件旁"""
+    bundle = getattr(sys, '_MEIPASS', None)
+    if not getattr(sys, 'frozen', False) or bundle is None:
+        return False
+    exe_dir = os.path.dirname(os.path.abspath(sys.executable))
+    try:
+        return os.path.commonpath([exe_dir, os.path.abspath(bundle)]) != exe_dir
+    except ValueError:  # 不在同一个驱动器上
+        return True
+
+
+def _linux_start_time(pid):
+    try:
+        with open(f"/proc/{pid}/stat", 'r') as f:
+            # 进程名可能包含空格和括号，从最后一个右括号之后按字段拆分，启动时间是第22个字段
+            fields = f.read().rsplit(')', 1)[1].split()
+        # 启动时间是开机以来的时钟周期数；/proc/stat中的开机时间只精确到秒，改用开机以来的时间换算
+        since_start = time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+        return time.time() - since_start
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def _windows_start_time(pid):
+    import ctypes
+
+    # PROCESS_QUERY_LIMITED_INFORMATION
+    handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+    if not handle:
+        return None
+    try:
+        creation, exit_time, kernel, user = (ctypes.c_ulonglong() for _ in range(4))
+        if not ctypes.windll.kernel32.GetProcessTimes(handle, ctypes.byref(creation), ctypes.byref(exit_time),
+                                                      ctypes.byref(kernel), ctypes.byref(user)):
+            return None
+        # FILETIME: 自1601-01-01起的100纳秒数
+        return (creation.value - 116444736000000000) / 10_000_000
+    finally:
+        ctypes.windll.kernel32.CloseHandle(handle)
@@ -0,0 +1,312 @@
+import os
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from .archives import ArchiveMember
+from .pages import MULTI_PAGE_FORMATS, page_count
+
+
+# 需要设置DPI的位图导出类型
+RASTER_EXPORT_TYPES = ('png', 'tiff')
+
+# 位图输出文件名模板，可用字段：{stem} 源文件名（不含扩展名）、{ext} 输出扩展名、
+# {format} 输出格式名（小写）、{dpi} 导出DPI、{scale} 相对于96 DPI的倍数（例如 2、1.5）、
+# {page} 多页文档的页码（按总页数补零，例如 01）
+DEFAULT_NAME_TEMPLATE = "{stem}.{ext}"
+# 同时导出多个DPI且没有指定模板时使用
+MULTI_DPI_NAME_TEMPLATE = "{stem}_{dpi}dpi.{ext}"
+# 多页文档按页导出且模板中没有 {page} 时，加在文件名（扩展名之前）末尾
+PAGE_NAME_SUFFIX = "_p{page}"
+
+# {scale} 为1倍时对应的DPI
+BASE_DPI = 96
+
+
+@dataclass
+class ConversionTask:
+    """
+    单个转换任务 - 将一个输入文件导出为一种格式
+    """
+    input_path: Path
+    output_path: Path
+    format_name: str
+    export_type: str
+    dpi: int = 300
+    # Inkscape实际打开的文件（例如预处理后的临时文件），为None时为source_file
+    load_path: Path = None
+    # 输入来自压缩包时为其中的成员 (ArchiveMember)，input_path为显示用的路径，
+    # 转换时成员才解压到临时文件source_path
+    member: ArchiveMember = None
+    source_path: Path = None
+    # 输出写入输出压缩包时为其中的成员 (ArchiveMember)，output_path为转换时的临时文件
+    output_member: ArchiveMember = None
+    # 分块渲染的一块：只导出页面中 export_area (x0, y0, x1, y1，文档px，原点在页面左上角) 的部分，
+    # 输出为 export_size (宽, 高) 像素
+    export_area: tuple = None
+    export_size: tuple = None
+    # 多页文档（PDF/PS）按页拆分的任务：只导入第page页（从1开始），page_count为文档的总页数
+    page: int = None
+    page_count: int = None
+
+    @property
+    def is_raster(self):
+        """是否为需要DPI设置的位图导出"""
+        return self.export_type in RASTER_EXPORT_TYPES
+
+    @property
+    def source_file(self):
+        """输入内容所在的文件"""
+        return self.source_path or self.input_path
+
+    @property
+    def document_path(self):
+        """交给Inkscape打开的文件"""
+        return self.load_path or self.source_file
+
+    @property
+    def document_key(self):
+        """在一次文档加载中完成的任务的分组：同一输入文件，多页文档中还要是同一页"""
+        return self.input_path, self.page
+
+    def input_size(self):
+        """
+        输入文件的大小（字节），无法读取时为0
+
+        压缩包中的成员总是使用压缩包中记录的大小：不必解压，解压出的临时文件删除后也不变，
+        预测耗时和记录耗时时的分类一致。多页文档中的一页按平均每页的大小计算。
+        """
+        if self.member is not None:
+            return self.member.size
+        try:
+            size = os.path.getsize(self.source_file)
+        except OSError:
+            return 0
+        return size // self.page_count if self.page_count else size
+
+
+# TaskResult.error_kind 的取值
+ERROR_TIMEOUT = "timeout"
+ERROR_CRASH = "crash"
+ERROR_CANCELLED = "cancelled"
+
+
+@dataclass
+class TaskTiming:
+    """
+    单个任务的耗时记录（秒）和输入输出大小
+
+    parse为Inkscape打开文档的耗时（同一文档的多个任务只记在第一个任务上），
+    render为导出（渲染并写入文件）的耗时，wall为任务从开始执行到完成的总耗时。
+    preflight为SVG预处理的耗时，preflight_saved_bytes为预处理减少的字节数（同样只记在第一个任务上）。
+    compress为PNG输出重新压缩的耗时，compressed_saved_bytes为压缩减少的字节数。
+    estimated_bytes为执行前估计的内存峰值，peak_rss_bytes为实测的Inkscape进程峰值常驻内存
+    （平台不支持或未使用Inkscape时为0）。
+    """
+    queue_wait: float = 0.0
+    preflight: float = 0.0
+    process_start: float = 0.0
+    parse: float = 0.0
+    render: float = 0.0
+    compress: float = 0.0
+    wall: float = 0.0
+    exit_code: int = None
+    input_bytes: int = 0
+    output_bytes: int = 0
+    estimated_bytes: int = 0
+    peak_rss_bytes: int = 0
+    preflight_saved_bytes: int = 0
+    compressed_saved_bytes: int = 0
+
+
+@dataclass
+class TaskResult:
+    """
+    单个转换任务的结果
+    """
+    task: ConversionTask
+    success: bool
+    error: str = ""
+    # 命中缓存时为 "fresh"（输出已是最新）或 "restored"（从缓存目录复制）
+    cache_hit: str = ""
+    # 完成任务的后端，例如 "inkscape"、"pillow"、"cache"
+    backend: str = "inkscape"
+    timing: TaskTiming = field(default_factory=TaskTiming)
+    # 失败的类型："timeout"（超时）、"crash"（进程崩溃或被终止）、"cancelled"（已取消），
+    # 前两种可能是偶发的，可以按重试策略重试
+    error_kind: str = ""
+    # 执行的次数，重试后大于1
+    attempts: int = 1
+
+    @property
+    def status(self):
+        """结果状态：converted / fresh / restored / failed / cancelled"""
+        if not self.success:
+            return "cancelled" if self.error_kind == ERROR_CANCELLED else "failed"
+        return self.cache_hit or "converted"
+
+    def to_dict(self):
+        """转换为可序列化为JSON的字典，多页文档按页拆分的任务另有page（页码）"""
+        data = {
+            "input": str(self.task.input_path),
+            "output": str(self.task.output_path),
+            "format": self.task.format_name,
+            "status": self.status,
+            "backend": self.backend,
+            "error": self.error,
+            "error_kind": self.error_kind,
+            "attempts": self.attempts,
+            "timing": {key: round(value, 6) if isinstance(value, float) else value
+                       for key, value in asdict(self.timing).items()},
+        }
+        if self.task.page is not None:
+            data["page"] = self.task.page
+        return data
+
+    @classmethod
+    def from_dict(cls, task, data):
+        """由to_dict的结果还原（例如从转换服务收到的结果），task为对应的任务"""
+        status = data.get("status", "failed")
+        timing_fields = TaskTiming.__dataclass_fields__
+        return cls(
+            task,
+            success=status not in ("failed", "cancelled"),
+            error=data.get("error", ""),
+            cache_hit=status if status in ("fresh", "restored") else "",
+            backend=data.get("backend", "inkscape"),
+            timing=TaskTiming(**{key: value for key, value in data.get("timing", {}).items()
+                                 if key in timing_fields}),
+            error_kind=data.get("error_kind") or (ERROR_CANCELLED if status == "cancelled" else ""),
+            attempts=data.get("attempts", 1),
+        )
+
+
+def cancelled_result(task):
+    """任务因取消而未执行的结果"""
+    return TaskResult(task, False, "已取消", error_kind=ERROR_CANCELLED)
+
+
+def parse_dpi_list(value):
+    """解析DPI列表，可以是整数、逗号分隔的字符串或整数列表，保持顺序并去重"""
+    if isinstance(value, int):
+        value = [value]
+    elif isinstance(value, str):
+        value = [item for item in value.replace('，', ',').split(',') if item.strip()]
+    dpis = []
+    for item in value:
+        try:
+            dpi = int(str(item).strip())
+        except ValueError:
+            raise ValueError(f"无效的DPI: {item}") from None
+        if dpi <= 0:
+            raise ValueError(f"无效的DPI: {item}")
+        if dpi not in dpis:
+            dpis.append(dpi)
+    if not dpis:
+        raise ValueError("至少需要一个DPI")
+    return dpis
+
+
+def resolve_name_template(template, dpis):
+    """
+    确定位图输出文件名模板并检查其有效性，无效时抛出ValueError
+
+    没有指定模板时，单个DPI使用源文件名，多个DPI在文件名中加上DPI。
+    """
+    if not template:
+        return DEFAULT_NAME_TEMPLATE if len(dpis) == 1 else MULTI_DPI_NAME_TEMPLATE
+    try:
+        names = {format_output_name(template, "a", "png", "PNG", dpi) for dpi in dpis}
+    except (KeyError, IndexError, ValueError) as e:
+        raise ValueError(f"无效的文件名模板 {template}: {e}") from None
+    if len(names) < len(dpis):
+        raise ValueError(f"文件名模板 {template} 中没有 {{dpi}} 或 {{scale}}，多个DPI的输出会互相覆盖")
+    if any(sep in name for name in names for sep in ('/', '\\')):
+        raise ValueError(f"文件名模板 {template} 不能包含目录")
+    return template
+
+
+def format_output_name(template, stem, extension, format_name, dpi, page="1"):
+    """按模板生成输出文件名，page为已补零的页码字符串"""
+    return template.format(stem=stem, ext=extension, format=format_name.lower(), dpi=dpi,
+                           scale=f"{dpi / BASE_DPI:g}", page=page)
+
+
+def page_name_template(template):
+    """多页文档按页导出时使用的模板：模板中没有 {page} 时在扩展名之前加上页码"""
+    if "{page" in template:
+        return template
+    root, dot, extension = template.rpartition('.')
+    if not dot:
+        return template + PAGE_NAME_SUFFIX
+    return f"{root}{PAGE_NAME_SUFFIX}.{extension}"
+
+
+def document_pages(input_file):
+    """
+    按页拆分时文档每一页的页码（从1开始）
+
+    只读取文件中的页数信息，不渲染文档；单页、不是多页格式或无法识别页数时返回 [None]，整个文档作为一个输入。
+    """
+    count = page_count(input_file) if Path(input_file).suffix.lower() in MULTI_PAGE_FORMATS else None
+    if not count or count < 2:
+        return [None]
+    return list(range(1, count + 1))
+
+
+def iter_tasks(files, formats, file_types, dpi, on_skip=None, name_template=None):
+    """
+    为每个文件和每种输出格式逐个产生转换任务
+
+    dpi可以是一个DPI或DPI列表，位图格式为每个DPI各产生一个任务，文件名按name_template生成；
+    矢量格式只产生一个任务。files中也可以有压缩包成员 (ArchiveMember)，输出写在压缩包旁的同名目录中。
+    多页的PDF/PS文档每一页各产生一组任务，文件名中加上页码（见page_name_template）；
+    压缩包中的成员不拆分页面。
+    同一文件（同一页）的任务连续产生，调度器可以在一次文档加载中完成它们。
+    与源文件格式相同的组合不生成任务，而是调用 on_skip(file_path, format_name)。
+    """
+    dpis = parse_dpi_list(dpi)
+    template = resolve_name_template(name_template, dpis)
+    for file_path in files:
+        member = file_path if isinstance(file_path, ArchiveMember) else None
+        input_file = member.path if member is not None else Path(file_path)
+        targets = []
+        for format_name in formats:
+            format_extension = file_types[format_name]
+            if input_file.suffix.lower() == f".{format_extension}":
+                if on_skip is not None:
+                    on_skip(file_path, format_name)
+                continue
+            targets.append((format_name, format_extension))
+        if not targets:
+            continue
+        pages = document_pages(input_file) if member is None else [None]
+        total_pages = len(pages) if pages[0] is not None else None
+        for page in pages:
+            label = "1" if page is None else f"{page:0{len(str(total_pages))}d}"
+            raster_template = template if page is None else page_name_template(template)
+            vector_template = DEFAULT_NAME_TEMPLATE if page is None else page_name_template(DEFAULT_NAME_TEMPLATE)
+            for format_name, format_extension in targets:
+                if format_extension not in RASTER_EXPORT_TYPES:
+                    name = format_output_name(vector_template, input_file.stem, format_extension, format_name,
+                                              dpis[0], label)
+                    yield ConversionTask(input_file, input_file.parent / name, format_name, format_extension, dpis[0],
+                                         member=member, page=page, page_count=total_pages)
+                    continue
+                for task_dpi in dpis:
+                    name = format_output_name(raster_template, input_file.stem, format_extension, format_name,
+                                              task_dpi, label)
+                    yield ConversionTask(input_file, input_file.parent / name, format_name, format_extension,
+                                         task_dpi, member=member, page=page, page_count=total_pages)
+
+
+def build_tasks(files, formats, file_types, dpi, name_template=None):
+    """
+    为每个文件和每种输出格式构建转换任务
+
+    返回 (tasks, skipped)，与源文件格式相同的组合放入skipped，不生成任务。
+    """
+    skipped = []
+    tasks = list(iter_tasks(files, formats, file_types, dpi,
+                            on_skip=lambda file_path, format_name: skipped.append((file_path, format_name)),
+                            name_template=name_template))
+    return tasks, skipped
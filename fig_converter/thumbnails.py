@@ -0,0 +1,288 @@
+import io
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+
+from .cache import hash_file
+from .formats import BITMAP_FORMATS
+from .paths import user_cache_dir
+from .process import kill_process_tree, low_priority_options, lower_priority
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow是可选依赖，没有时位图也交给Inkscape生成缩略图
+    Image = None
+
+
+logger = logging.getLogger("FigConverter.thumbnails")
+
+# 缩略图的最大边长（像素）
+THUMBNAIL_SIZE = 32
+# 内存中最多保留的缩略图数
+MEMORY_ITEMS = 512
+# 磁盘缓存的容量上限
+MAX_DISK_BYTES = 64 * 1024 * 1024
+# 用Inkscape生成一个缩略图的最长时间（秒）
+RENDER_TIMEOUT = 30
+
+
+def thumbnail_cache_dir():
+    """默认的缩略图缓存目录"""
+    return user_cache_dir() / "thumbnails"
+
+
+class ThumbnailCache:
+    """
+    缩略图缓存：内存中按最近使用淘汰的LRU，以及磁盘上按文件内容哈希保存的PNG
+
+    内容相同的文件共用一个缩略图，文件改名或移动后不必重新生成；
+    磁盘缓存超过容量上限时按最近使用时间删除。
+    """
+
+    def __init__(self, cache_dir=None, size=THUMBNAIL_SIZE, max_items=MEMORY_ITEMS, max_disk_bytes=MAX_DISK_BYTES):
+        self.cache_dir = Path(cache_dir) if cache_dir else thumbnail_cache_dir()
+        self.size = size
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+
+    def _path(self, digest):
+        return self.cache_dir / digest[:2] / f"{digest}_{self.size}.png"
+
+    def _remember(self, digest, data):
+        with self._lock:
+            self._memory[digest] = data
+            self._memory.move_to_end(digest)
+            while len(self._memory) > self.max_items:
+                self._memory.popitem(last=False)
+
+    def get(self, digest):
+        """按内容哈希查找缩略图的PNG数据，没有时返回None"""
+        with self._lock:
+            data = self._memory.get(digest)
+            if data is not None:
+                self._memory.move_to_end(digest)
+                return data
+        path = self._path(digest)
+        try:
+            data = path.read_bytes()
+            # 更新修改时间，淘汰时按最近使用排序
+            os.utime(path)
+        except OSError:
+            return None
+        self._remember(digest, data)
+        return data
+
+    def put(self, digest, data):
+        """保存缩略图，磁盘写入失败时只保留在内存中"""
+        self._remember(digest, data)
+        path = self._path(digest)
+        temp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            temp_path.write_bytes(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.debug(f"无法写入缩略图缓存 {path}: {e}")
+
+    def prune(self):
+        """磁盘缓存超过容量上限时删除最久未使用的缩略图"""
+        files = []
+        for path in self.cache_dir.glob("*/*.png"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                path.unlink()
+            except OSError:
+                continue
+            total -= size
+
+
+class ThumbnailService:
+    """
+    在后台生成文件列表的缩略图
+
+    界面调用request告知当前可见的文件，只处理最近一次请求中的文件，滚动过去的行不再生成。
+    一个低优先级的工作线程依次处理：先按内容哈希查缓存，没有时位图用Pillow缩小，
+    其他格式用Inkscape导出小尺寸PNG（进程以最低优先级运行）。
+    pause后（例如转换进行中）只返回缓存中已有的缩略图，不再生成新的，resume后由界面重新请求。
+    生成的PNG数据通过 on_ready(path, data) 交给调用者，在工作线程中调用；无法生成时不调用。
+    """
+
+    def __init__(self, on_ready, inkscape_path=None, cache=None):
+        self.on_ready = on_ready
+        # 界面找到Inkscape后更新
+        self.inkscape_path = inkscape_path
+        self.cache = cache or ThumbnailCache()
+        self.size = self.cache.size
+        self._condition = threading.Condition()
+        self._wanted = deque()
+        self._stopped = False
+        self._thread = None
+        self._process = None
+        self._paused = False
+        # 路径 -> ((修改时间, 大小), 内容哈希)，文件未改动时不重新计算哈希
+        self._digests = {}
+        # 无法生成缩略图的文件 (路径, (修改时间, 大小))，文件改动前不再尝试
+        self._failed = set()
+
+    def request(self, paths):
+        """替换待生成的文件列表（按显示顺序），第一次调用时启动工作线程"""
+        with self._condition:
+            self._wanted = deque(paths)
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="thumbnails", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+
+    def pause(self):
+        self._paused = True
+
+    def resume(self):
+        self._paused = False
+
+    def stop(self):
+        """停止工作线程并结束正在运行的Inkscape进程"""
+        with self._condition:
+            self._stopped = True
+            self._wanted.clear()
+            process = self._process
+            self._condition.notify()
+        if process is not None:
+            kill_process_tree(process)
+
+    def _run(self):
+        if sys.platform.startswith("linux"):
+            # Linux的nice值按线程设置，只降低本线程的优先级，界面线程不受影响
+            lower_priority(threading.get_native_id())
+        self.cache.prune()
+        while True:
+            with self._condition:
+                while not self._wanted and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                path = self._wanted.popleft()
+            data = self._thumbnail(path)
+            if data is not None:
+                self.on_ready(path, data)
+
+    def _digest(self, path):
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        known = self._digests.get(path)
+        if known is not None and known[0] == signature:
+            return known
+        known = (signature, hash_file(path))
+        self._digests[path] = known
+        return known
+
+    def _thumbnail(self, path):
+        try:
+            signature, digest = self._digest(path)
+        except OSError:
+            return None
+        if (path, signature) in self._failed:
+            return None
+        data = self.cache.get(digest)
+        if data is not None:
+            return data
+        if self._paused or (not self._uses_pillow(path) and not self.inkscape_path):
+            # 暂停期间或还没有找到Inkscape时跳过，界面之后再次请求时生成
+            return None
+        data = self._render(path)
+        if data is None:
+            self._failed.add((path, signature))
+            return None
+        self.cache.put(digest, data)
+        return data
+
+    @staticmethod
+    def _uses_pillow(path):
+        return Image is not None and Path(path).suffix.lower() in BITMAP_FORMATS
+
+    def _render(self, path):
+        if self._uses_pillow(path):
+            try:
+                with Image.open(path) as image:
+                    # JPEG可以在解码时直接缩小，大照片不必完整解码
+                    image.draft("RGB", (self.size, self.size))
+                    return self._encode(image)
+            except (OSError, ValueError, Image.DecompressionBombError) as e:
+                logger.debug(f"无法生成缩略图 {path}: {e}")
+                return None
+        return self._render_inkscape(path)
+
+    def _render_inkscape(self, path):
+        """用Inkscape按缩略图宽度导出PNG，返回PNG数据"""
+        fd, temp_path = tempfile.mkstemp(prefix="fig_thumb_", suffix=".png")
+        os.close(fd)
+        cmd = [self.inkscape_path, str(path), "--export-type=png", f"--export-filename={temp_path}",
+               f"--export-width={self.size}"]
+        try:
+            try:
+                process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                                           **low_priority_options())
+            except OSError as e:
+                logger.debug(f"无法启动Inkscape生成缩略图: {e}")
+                return None
+            lower_priority(process.pid)
+            with self._condition:
+                self._process = process
+                stopped = self._stopped
+            try:
+                if stopped:
+                    kill_process_tree(process)
+                process.wait(timeout=RENDER_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                logger.debug(f"生成缩略图超时: {path}")
+                kill_process_tree(process)
+                return None
+            finally:
+                with self._condition:
+                    self._process = None
+            if process.returncode != 0:
+                return None
+            data = Path(temp_path).read_bytes()
+        except OSError as e:
+            logger.debug(f"无法生成缩略图 {path}: {e}")
+            return None
+        finally:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+        if not data:
+            return None
+        if Image is None:
+            return data
+        # 很高的图按宽度导出后仍然超出缩略图大小，再按边长缩小
+        try:
+            with Image.open(io.BytesIO(data)) as image:
+                if max(image.size) <= self.size:
+                    return data
+                return self._encode(image)
+        except (OSError, ValueError) as e:
+            logger.debug(f"无法生成缩略图 {path}: {e}")
+            return None
+
+    def _encode(self, image):
+        image.seek(0)
+        image = image.convert("RGBA")
+        image.thumbnail((self.size, self.size))
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        return output.getvalue()
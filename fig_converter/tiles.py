@@ -0,0 +1,352 @@
+import math
+import os
+import struct
+import xml.etree.ElementTree as ET
+import zlib
+from dataclasses import dataclass, replace
+from pathlib import Path
+
+from .memory import page_size_inches
+from .pngcompress import IDAT_CHUNK_BYTES, PNG_SIGNATURE, READ_BYTES, read_chunks, write_chunk
+from .tasks import BASE_DPI
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow是可选依赖，只用于校验拼接结果
+    Image = None
+
+
+# 拼接PNG时图像数据的压缩级别
+STITCH_COMPRESSION_LEVEL = 6
+
+# PNG颜色类型对应的通道数（调色板图像各条带的调色板可能不同，不能拼接）
+PNG_CHANNELS = {0: 1, 2: 3, 4: 2, 6: 4}
+# 逐段校验时 (颜色类型, 位深) 对应的Pillow模式
+PNG_MODES = {(0, 8): "L", (2, 8): "RGB", (4, 8): "LA", (6, 8): "RGBA"}
+# 逐段校验时每段原始像素的大小
+COMPARE_BAND_BYTES = 8 * 1024 * 1024
+
+
+def can_verify():
+    """是否能逐像素校验拼接结果（需要Pillow）"""
+    return Image is not None
+
+
+def page_geometry(path):
+    """
+    SVG页面的尺寸 (宽, 高，单位英寸) 和页面在用户单位中的范围 (x, y, 宽, 高)，无法识别时返回None
+
+    没有viewBox时用户单位即为像素（96每英寸）。
+    """
+    size = page_size_inches(path)
+    if size is None:
+        return None
+    try:
+        for _, element in ET.iterparse(str(path), events=("start",)):
+            view_box = (element.get("viewBox") or "").replace(',', ' ').split()
+            break
+        else:
+            return None
+        box = tuple(float(value) for value in view_box) if len(view_box) == 4 else None
+    except (OSError, ValueError, ET.ParseError):
+        return None
+    if box is None:
+        box = (0.0, 0.0, size[0] * BASE_DPI, size[1] * BASE_DPI)
+    if box[2] <= 0 or box[3] <= 0:
+        return None
+    return size, box
+
+
+@dataclass
+class TilePlan:
+    """
+    大幅位图导出的分块方案：整页宽度的水平条带
+
+    width/height为整幅输出的像素尺寸（与不分块时Inkscape的计算方式相同），
+    box为页面在SVG用户单位中的范围 (viewBox)，page为页面的文档尺寸 (宽, 高，单位为px即1/96英寸)，
+    strips为每个条带的 (起始行, 结束行)；条带按像素行对齐，与整幅渲染使用相同的缩放比例。
+    """
+    width: int
+    height: int
+    box: tuple
+    page: tuple
+    strips: list
+
+    def to_document(self, x, y):
+        """把SVG用户单位中的坐标按viewBox到页面尺寸的缩放换算为文档px，原点在页面左上角"""
+        box_x, box_y, box_width, box_height = self.box
+        return ((x - box_x) * self.page[0] / box_width, (y - box_y) * self.page[1] / box_height)
+
+    def area(self, strip):
+        """条带的导出范围 (x0, y0, x1, y1)，单位为Inkscape --export-area 使用的文档px"""
+        x, y, width, height = self.box
+        first, last = strip
+        return (self.to_document(x, y + height * first / self.height)
+                + self.to_document(x + width, y + height * last / self.height))
+
+    def tile_tasks(self, task, directory):
+        """每个条带的导出任务"""
+        return [replace(task, output_path=Path(directory) / f"tile_{number:04d}.png", export_area=self.area(strip), export_size=(self.width, strip[1] - strip[0]))
+                for number, strip in enumerate(self.strips)]
+
+    def describe(self):
+        return f"{self.width}×{self.height} 像素，分为 {len(self.strips)} 块"
+
+
+def plan_tiles(task, threshold, parallelism):
+    """
+    为超过threshold像素的位图导出任务划分条带，不需要或不能分块时返回None
+
+    条带数至少为parallelism（占满并发），且每块不超过threshold像素。
+    只支持SVG输入：其他格式导入后的坐标无法从文件头得知。
+    只支持PNG输出：位图输出格式中只有PNG（没有TIFF输出）。
+    """
+    if not threshold or task.export_type != "png" or task.export_area is not None:
+        return None
+    if task.input_path.suffix.lower() != ".svg":
+        return None
+    geometry = page_geometry(task.source_file)
+    if geometry is None:
+        return None
+    (width_inches, height_inches), box = geometry
+    width = int(width_inches * task.dpi + 0.5)
+    height = int(height_inches * task.dpi + 0.5)
+    if width * height <= threshold or height < 2:
+        return None
+    count = min(height, max(parallelism, math.ceil(width * height / threshold)))
+    rows = math.ceil(height / count)
+    strips = [(first, min(height, first + rows)) for first in range(0, height, rows)]
+    page = (width_inches * BASE_DPI, height_inches * BASE_DPI)
+    return TilePlan(width, height, box, page, strips)
+
+
+def _partial_path(output_path):
+    output_path = Path(output_path)
+    return output_path.with_name(f".{output_path.stem}.partial{output_path.suffix}")
+
+
+def _unfilter_first_row(row, bytes_per_pixel):
+    """
+    把条带第一行改写为不引用上一行的过滤方式
+
+    条带中第一行的上一行按全零处理；拼接后上一行变为前一个条带的最后一行，
+    引用上一行的过滤方式 (Up/Average/Paeth) 会解码出不同的像素。
+    """
+    kind = row[0]
+    if kind in (0, 1):
+        return row
+    if kind == 2:
+        # Up：上一行为零时过滤后的数据就是原始数据
+        return b"\x00" + row[1:]
+    if kind == 4:
+        # Paeth：上一行为零时预测值总是左侧像素，与Sub相同
+        return b"\x01" + row[1:]
+    if kind == 3:
+        raw = bytearray(row[1:])
+        for i in range(bytes_per_pixel, len(raw)):
+            raw[i] = (raw[i] + (raw[i - bytes_per_pixel] >> 1)) & 0xFF
+        return b"\x00" + bytes(raw)
+    raise ValueError(f"未知的PNG过滤方式: {kind}")
+
+
+class PngStitcher:
+    """
+    把按顺序渲染的PNG条带拼接为一个PNG
+
+    条带逐块解压后直接重新压缩，不解码像素，内存中只有一小段图像数据。
+    条带中除第一行以外的每一行引用的上一行与整幅图像中相同，过滤后的数据可以原样使用，
+    只有每个条带的第一行需要改写，拼接结果与各条带的像素完全相同。
+    """
+
+    def __init__(self, output_path, plan, dpi):
+        self.output_path = Path(output_path)
+        self.partial_path = _partial_path(self.output_path)
+        self.plan = plan
+        self.dpi = dpi
+        self.rows = 0
+        self._added = 0
+        self._header = None
+        self._file = open(self.partial_path, 'wb')
+        self._file.write(PNG_SIGNATURE)
+        self._compressor = zlib.compressobj(STITCH_COMPRESSION_LEVEL)
+        self._pending = bytearray()
+
+    def _emit(self, data):
+        self._pending += self._compressor.compress(data)
+        while len(self._pending) >= IDAT_CHUNK_BYTES:
+            write_chunk(self._file, b"IDAT", bytes(self._pending[:IDAT_CHUNK_BYTES]))
+            del self._pending[:IDAT_CHUNK_BYTES]
+
+    def _start(self, header, ancillary):
+        """按第一个条带的格式写出文件头，高度改为整幅图像的高度"""
+        self._header = header
+        write_chunk(self._file, b"IHDR", struct.pack(">II", self.plan.width, self.plan.height) + header[8:])
+        for chunk_type, data in ancillary:
+            write_chunk(self._file, chunk_type, data)
+        pixels_per_meter = round(self.dpi / 0.0254)
+        write_chunk(self._file, b"pHYs", struct.pack(">IIB", pixels_per_meter, pixels_per_meter, 1))
+
+    def add(self, tile_path):
+        """追加下一个条带"""
+        first, last = self.plan.strips[self._added]
+        expected_rows = last - first
+        with open(tile_path, 'rb') as f:
+            ancillary = []
+            header = decompressor = None
+            head = bytearray()
+            row_bytes = bytes_per_pixel = 0
+            received = 0
+            for chunk_type, data in read_chunks(f):
+                if chunk_type == b"IHDR":
+                    width, height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", data)
+                    if width != self.plan.width or height != expected_rows:
+                        raise ValueError(f"条带尺寸为 {width}×{height}，应为 {self.plan.width}×{expected_rows}")
+                    if color not in PNG_CHANNELS or interlace:
+                        raise ValueError("条带是调色板或隔行扫描PNG，无法拼接")
+                    if self._header is not None and data[8:] != self._header[8:]:
+                        raise ValueError("条带的颜色格式不一致")
+                    channels = PNG_CHANNELS[color]
+                    bytes_per_pixel = max(1, channels * depth // 8)
+                    row_bytes = 1 + (width * channels * depth + 7) // 8
+                    header = data
+                elif chunk_type == b"IDAT":
+                    if header is None:
+                        raise ValueError("条带缺少文件头")
+                    if decompressor is None:
+                        if self._header is None:
+                            self._start(header, ancillary)
+                        decompressor = zlib.decompressobj()
+                    buffer = data
+                    while buffer:
+                        raw = decompressor.decompress(buffer, READ_BYTES)
+                        buffer = decompressor.unconsumed_tail
+                        received += len(raw)
+                        if head is None:
+                            self._emit(raw)
+                            continue
+                        head += raw
+                        if len(head) >= row_bytes:
+                            self._emit(_unfilter_first_row(bytes(head[:row_bytes]), bytes_per_pixel))
+                            self._emit(bytes(head[row_bytes:]))
+                            head = None
+                elif decompressor is None and chunk_type not in (b"pHYs", b"IEND"):
+                    # 第一个条带的其他辅助块（色彩空间、gamma等）保留在输出中
+                    ancillary.append((chunk_type, data))
+            if decompressor is None:
+                raise ValueError("条带中没有图像数据")
+            tail = decompressor.flush()
+            received += len(tail)
+            self._emit(tail)
+        if head is not None or received != row_bytes * expected_rows:
+            raise ValueError("条带的图像数据不完整")
+        self._added += 1
+        self.rows += expected_rows
+
+    def close(self):
+        """写完文件并替换为最终输出"""
+        if self.rows != self.plan.height:
+            raise ValueError(f"只拼接了 {self.rows}/{self.plan.height} 行")
+        self._pending += self._compressor.flush()
+        for offset in range(0, len(self._pending), IDAT_CHUNK_BYTES):
+            write_chunk(self._file, b"IDAT", bytes(self._pending[offset:offset + IDAT_CHUNK_BYTES]))
+        write_chunk(self._file, b"IEND", b"")
+        self._file.close()
+        os.replace(self.partial_path, self.output_path)
+
+    def abort(self):
+        self._file.close()
+        try:
+            self.partial_path.unlink()
+        except OSError:
+            pass
+
+
+class _PngBands:
+    """
+    按行段解码PNG（需要Pillow），内存中只有一段行的像素
+
+    每段的过滤数据交给Pillow的PNG解码器；段的第一行可能引用上一行，
+    解码时在段前加上上一段最后一行的原始像素（过滤方式None），解码后去掉。
+    只支持每通道8位的非隔行扫描PNG（Inkscape的默认输出）。
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._chunks = read_chunks(self._file)
+        chunk_type, data = next(self._chunks, (None, b""))
+        if chunk_type != b"IHDR":
+            self.close()
+            raise ValueError(f"{Path(path).name} 缺少PNG文件头")
+        self.width, self.height, depth, color, _, _, interlace = struct.unpack(">IIBBBBB", data)
+        self.mode = PNG_MODES.get((color, depth))
+        if self.mode is None or interlace:
+            self.close()
+            raise ValueError(f"无法逐段校验该格式的PNG（颜色类型 {color}，{depth} 位）")
+        self.stride = self.width * len(self.mode)
+
+    def bands(self, rows):
+        """逐段返回原始像素 (bytes)，每段rows行（最后一段可能更少）"""
+        row_bytes = self.stride + 1
+        band_bytes = row_bytes * rows
+        decompressor = zlib.decompressobj()
+        pending = bytearray()
+        previous = None
+        for chunk_type, data in self._chunks:
+            if chunk_type != b"IDAT":
+                continue
+            while data:
+                pending += decompressor.decompress(data, READ_BYTES)
+                data = decompressor.unconsumed_tail
+                while len(pending) >= band_bytes:
+                    band = self._decode(bytes(pending[:band_bytes]), previous)
+                    del pending[:band_bytes]
+                    previous = band[-self.stride:]
+                    yield band
+        pending += decompressor.flush()
+        if pending:
+            if len(pending) % row_bytes:
+                raise ValueError("PNG图像数据不完整")
+            yield self._decode(bytes(pending), previous)
+
+    def _decode(self, filtered, previous):
+        rows = len(filtered) // (self.stride + 1)
+        if previous is not None:
+            filtered = b"\x00" + previous + filtered
+            rows += 1
+        image = Image.frombytes(self.mode, (self.width, rows), zlib.compress(filtered, 1), "zip", self.mode)
+        pixels = image.tobytes()
+        return pixels[self.stride:] if previous is not None else pixels
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def compare_images(first, second):
+    """
+    逐像素比较两个PNG文件（需要Pillow），相同时返回None，否则返回差异的说明
+
+    按行段解码比较，不会把整幅图像读入内存。
+    """
+    with _PngBands(first) as a, _PngBands(second) as b:
+        if (a.width, a.height) != (b.width, b.height):
+            return f"尺寸不同: {a.width}×{a.height} / {b.width}×{b.height}"
+        if a.mode != b.mode:
+            return f"颜色格式不同: {a.mode} / {b.mode}"
+        rows = max(1, COMPARE_BAND_BYTES // a.stride)
+        row = 0
+        for band_a, band_b in zip(a.bands(rows), b.bands(rows)):
+            if len(band_a) != len(band_b):
+                return "图像数据的行数不同"
+            if band_a != band_b:
+                offset = next(i for i, (x, y) in enumerate(zip(band_a, band_b)) if x != y)
+                return f"像素不同，从第 {row + offset // a.stride + 1} 行开始"
+            row += len(band_a) // a.stride
+        if row != a.height:
+            return f"图像数据只有 {row}/{a.height} 行"
+    return None
@@ -0,0 +1,50 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from benchmarks.run import make_stub_launcher  # noqa: E402
+from fig_converter.tasks import ConversionTask  # noqa: E402
+
+SVG = '<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"><rect width="10" height="10"/></svg>\n'
+
+STUB_VARIABLES = ("STUB_INKSCAPE_STARTUP", "STUB_INKSCAPE_OPEN", "STUB_INKSCAPE_RENDER",
+                  "STUB_INKSCAPE_RENDER_PER_MB", "STUB_INKSCAPE_CRASH")
+
+
+@pytest.fixture(autouse=True)
+def user_dirs(tmp_path, monkeypatch):
+    """耗时记录、缓存和转换服务信息写在临时目录中，不影响当前用户的文件"""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "user-cache"))
+    monkeypatch.setenv("XDG_CONFIG_HOME", str(tmp_path / "user-config"))
+
+
+@pytest.fixture
+def stub_inkscape(tmp_path, monkeypatch):
+    """模拟的Inkscape可执行文件（benchmarks/stub_inkscape.py），延迟和崩溃通过环境变量设置"""
+    for name in STUB_VARIABLES:
+        monkeypatch.delenv(name, raising=False)
+    directory = tmp_path / "bin"
+    directory.mkdir()
+    return make_stub_launcher(directory)
+
+
+@pytest.fixture
+def make_document(tmp_path):
+    """在临时目录中生成SVG文档，返回其路径"""
+    def make(name):
+        path = tmp_path / name
+        path.write_text(SVG, encoding='utf-8')
+        return path
+    return make
+
+
+def make_task(input_path, export_type="png", dpi=96, suffix=""):
+    """输入文件旁的导出任务"""
+    input_path = Path(input_path)
+    output_path = input_path.with_name(f"{input_path.stem}{suffix}.{export_type}")
+    return ConversionTask(input_path, output_path, export_type.upper(), export_type, dpi)
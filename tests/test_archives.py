@@ -0,0 +1,58 @@
+import json
+import zipfile
+from dataclasses import replace
+
+from conftest import SVG, make_task
+from fig_converter.archives import ArchiveMember, output_member_name
+from fig_converter.engine import ConversionEngine
+
+
+def test_member_names_keep_subdirectories(tmp_path):
+    member = ArchiveMember(str(tmp_path / "figs.zip"), "sub/a.svg")
+    task = replace(make_task(member.path), member=member)
+    assert output_member_name(task) == "figs/sub/a.png"
+
+    document = tmp_path / "input" / "sub" / "b.svg"
+    assert output_member_name(make_task(document), [tmp_path / "input"]) == "sub/b.png"
+    # 不在输入目录中的文件只用文件名
+    assert output_member_name(make_task(document)) == "b.png"
+
+
+def test_archive_output_collisions_fail(stub_inkscape, tmp_path):
+    files = []
+    for root in ("first", "second"):
+        for name in ("sub/a.svg", "b.svg"):
+            path = tmp_path / root / name
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(SVG, encoding='utf-8')
+            files.append(path)
+    archive = tmp_path / "out.zip"
+    engine = ConversionEngine(stub_inkscape, workers=2, use_cache=False, timeout=30,
+                              output_archive=archive, input_roots=[tmp_path / "first", tmp_path / "second"])
+    tasks, _ = engine.build_tasks(files, ["PNG"], 96)
+    results = engine.run(tasks)
+    with zipfile.ZipFile(archive) as f:
+        assert sorted(f.namelist()) == ["b.png", "sub/a.png"]
+    # 两个输入目录中同名的输出只有先完成的写入压缩包，另一个记为失败
+    assert sum(result.success for result in results) == 2
+    failed = [result for result in results if not result.success]
+    assert len(failed) == 2 and all("同名" in result.error for result in failed)
+    assert {str(result.task.output_path) for result in results} == {f"{archive}!b.png", f"{archive}!sub/a.png"}
+
+
+def test_archive_outputs_are_cached_under_member_names(stub_inkscape, tmp_path, make_document):
+    archive = tmp_path / "out.zip"
+    cache_dir = tmp_path / "cache"
+    files = [make_document("a.svg")]
+
+    def run():
+        engine = ConversionEngine(stub_inkscape, workers=1, cache_dir=cache_dir, timeout=30, output_archive=archive)
+        return engine.run(engine.build_tasks(files, ["PNG"], 96)[0])
+
+    assert [result.status for result in run()] == ["converted"]
+    # 第二次从缓存恢复到新的临时目录，再写入新的压缩包
+    assert [result.status for result in run()] == ["restored"]
+    with zipfile.ZipFile(archive) as f:
+        assert f.namelist() == ["a.png"]
+    manifest = json.loads((cache_dir / "manifest.json").read_text(encoding='utf-8'))
+    assert list(manifest["outputs"]) == [f"{archive}!a.png"]
@@ -0,0 +1,57 @@
+import pytest
+
+from conftest import make_task
+from fig_converter.backends import PillowBackend, default_registry
+from fig_converter.engine import ConversionEngine
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _bitmap(path, size=(100, 50), **params):
+    Image.new("RGB", size, (200, 10, 10)).save(path, **params)
+    return path
+
+
+@pytest.mark.parametrize("name, export_type, supported", [
+    ("a.jpg", "png", True), ("a.gif", "tiff", True), ("a.png", "png", True),
+    ("a.jpg", "pdf", False), ("a.svg", "png", False)])
+def test_supports_bitmap_to_bitmap(tmp_path, name, export_type, supported):
+    assert PillowBackend().supports(make_task(tmp_path / name, export_type)) is supported
+    assert (default_registry().select(make_task(tmp_path / name, export_type)) is not None) is supported
+
+
+def test_output_is_scaled_like_inkscape(tmp_path):
+    source = _bitmap(tmp_path / "photo.jpg", dpi=(72, 72))
+    task = make_task(source, "png", dpi=96)
+    result = PillowBackend().convert(task)
+    assert result.success and result.backend == "pillow"
+    with Image.open(task.output_path) as image:
+        # 按 导出DPI / 图片DPI 缩放，输出为RGBA并记录导出DPI
+        assert image.size == (133, 67)
+        assert image.mode == "RGBA"
+        assert round(image.info["dpi"][0]) == 96
+
+
+def test_bitmap_without_dpi_uses_inkscape_default(tmp_path):
+    source = _bitmap(tmp_path / "icon.bmp")
+    task = make_task(source, "tiff", dpi=192)
+    assert PillowBackend().convert(task).success
+    with Image.open(task.output_path) as image:
+        assert image.size == (200, 100)
+
+
+def test_unreadable_bitmap_fails_without_partial_output(tmp_path):
+    source = tmp_path / "broken.png"
+    source.write_bytes(b"not a png")
+    task = make_task(source, "png", suffix="_out")
+    result = PillowBackend().convert(task)
+    assert not result.success and result.error
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["broken.png"]
+
+
+def test_engine_converts_bitmaps_without_inkscape(tmp_path):
+    task = make_task(_bitmap(tmp_path / "photo.gif"), "png")
+    # Inkscape路径不存在，任务只能由Pillow完成
+    results = ConversionEngine(str(tmp_path / "missing-inkscape"), workers=1, use_cache=False).run([task])
+    assert [(result.success, result.backend) for result in results] == [(True, "pillow")]
+    assert task.output_path.exists()
@@ -0,0 +1,65 @@
+import json
+
+from conftest import make_task
+from fig_converter.cache import ConversionCache
+from fig_converter.scheduler import ConversionScheduler
+
+
+def test_compression_mode_is_part_of_the_key(tmp_path, make_document):
+    task = make_task(make_document("figure.svg"))
+    cache = ConversionCache(tmp_path / "cache")
+    assert cache.task_key(task) == cache.task_key(task, None, None)
+    assert cache.task_key(task, compression="max") != cache.task_key(task)
+    assert cache.task_key(task, backend="pillow") != cache.task_key(task)
+
+
+def test_cached_output_is_not_reused_with_other_compression(stub_inkscape, tmp_path, make_document):
+    task = make_task(make_document("figure.svg"))
+    cache_dir = tmp_path / "cache"
+
+    def run(compression):
+        cache = ConversionCache(cache_dir)
+        return ConversionScheduler(stub_inkscape, workers=1, cache=cache, png_compression=compression).run([task])[0]
+
+    assert run(None).status == "converted"
+    assert run(None).status == "fresh"
+    assert run("fast").status == "converted"
+    assert run("fast").status == "fresh"
+
+
+def test_cached_output_is_not_reused_with_other_preflight(stub_inkscape, tmp_path, make_document):
+    task = make_task(make_document("figure.svg"))
+    cache = ConversionCache(tmp_path / "cache")
+    assert cache.task_key(task, preflight=True) != cache.task_key(task)
+
+    def run(preflight):
+        cache = ConversionCache(tmp_path / "cache")
+        return ConversionScheduler(stub_inkscape, workers=1, cache=cache, preflight=preflight).run([task])[0]
+
+    assert run(False).status == "converted"
+    assert run(True).status == "converted"
+    assert run(True).status == "fresh"
+
+
+def test_save_prunes_dead_records(tmp_path, make_document):
+    cache = ConversionCache(tmp_path / "cache")
+    tasks = []
+    for name in ("kept", "deleted", "evicted"):
+        document = make_document(f"{name}.svg")
+        document.write_text(f"<svg><!-- {name} --></svg>", encoding='utf-8')
+        task = make_task(document)
+        task.output_path.write_bytes(name.encode() * 100)
+        cache.store(task)
+        tasks.append(task)
+    kept, deleted, evicted = tasks
+    deleted.output_path.unlink()
+    deleted.input_path.unlink()
+    # 容量只够放下最近使用的两个结果
+    cache.max_bytes = 800
+    cache._touch(cache.task_key(kept))
+    cache.evict()
+    cache.save()
+
+    manifest = json.loads(cache.manifest_path.read_text(encoding='utf-8'))
+    assert set(manifest["outputs"]) == {str(kept.output_path)}
+    assert set(manifest["inputs"]) == {str(kept.input_path), str(evicted.input_path)}
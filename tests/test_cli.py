@@ -0,0 +1,78 @@
+import io
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+from fig_converter import cli
+
+
+def _run_batch(argv, monkeypatch, until=None):
+    """在后台线程中执行批处理；until(记录列表) 为True时取消转换（相当于Ctrl+C），返回 (退出码, 输出记录)"""
+    engines = []
+    records = []
+    monkeypatch.setattr(cli, "install_cancel_handlers", engines.append)
+    emit = cli.BatchRunner.emit
+    monkeypatch.setattr(cli.BatchRunner, "emit", lambda runner, record: (records.append(record), emit(runner, record)))
+    outcome = []
+    thread = threading.Thread(target=lambda: outcome.append(cli.run_batch(cli.build_parser().parse_args(argv))))
+    thread.start()
+    deadline = time.monotonic() + 30
+    while until is not None and thread.is_alive() and time.monotonic() < deadline:
+        if engines and until(records):
+            engines[0].cancel()
+            break
+        time.sleep(0.05)
+    thread.join(30)
+    return outcome[0], records
+
+
+def _watch_args(folder, stub_inkscape):
+    return [str(folder), "--batch", "--watch", "--formats", "PNG", "--inkscape", str(stub_inkscape),
+            "--no-daemon", "--no-cache", "--interval", "0.05", "--retries", "0", "--quiet"]
+
+
+def test_watch_returns_failure_after_failed_conversion(stub_inkscape, tmp_path, monkeypatch):
+    folder = tmp_path / "figures"
+    folder.mkdir()
+    (folder / "a.svg").write_text('<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>\n')
+    monkeypatch.setenv("STUB_INKSCAPE_CRASH", "crashing_doc")
+
+    def add_crashing_document(records):
+        # 初始转换完成后再添加会崩溃的文档，失败发生在监视期间
+        if records and not (folder / "crashing_doc.svg").exists():
+            (folder / "crashing_doc.svg").write_text('<svg xmlns="http://www.w3.org/2000/svg"/>\n')
+        return any(record["status"] == "failed" for record in records)
+
+    code, records = _run_batch(_watch_args(folder, stub_inkscape), monkeypatch, until=add_crashing_document)
+    assert [record["status"] for record in records] == ["converted", "failed"]
+    assert code == cli.EXIT_TASK_FAILED
+
+
+def test_watch_returns_ok_without_failures(stub_inkscape, tmp_path, monkeypatch):
+    folder = tmp_path / "figures"
+    folder.mkdir()
+    (folder / "a.svg").write_text('<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10"/>\n')
+    code, records = _run_batch(_watch_args(folder, stub_inkscape), monkeypatch, until=bool)
+    assert [record["status"] for record in records] == ["converted"]
+    assert code == cli.EXIT_OK
+
+
+@pytest.mark.parametrize("line", ['{"input": 3, "formats": ["PNG"]}', '{"input": ["a.svg"]}',
+                                  '{"input": ""}', '{"formats": ["PNG"]}', '{"input": "a.svg", "dpi": "x"}'])
+def test_malformed_job_lines_are_usage_errors(line):
+    errors = []
+    jobs = list(cli.read_jobs(io.StringIO(f"{line}\nb.svg\n"), ["PNG"], [96], lambda *error: errors.append(error)))
+    assert [error[0] for error in errors] == [line]
+    assert [job[0] for job in jobs] == [["b.svg"]]
+
+
+def test_batch_exits_with_usage_error_for_bad_job(stub_inkscape, make_document, monkeypatch):
+    document = make_document("a.svg")
+    monkeypatch.setattr(sys, "stdin", io.StringIO(f'{{"input": 1}}\n{json.dumps({"input": str(document)})}\n'))
+    code, records = _run_batch(["-", "--batch", "--formats", "PNG", "--inkscape", str(stub_inkscape),
+                                "--no-daemon", "--no-cache", "--quiet"], monkeypatch)
+    assert [record["status"] for record in records] == ["failed", "converted"]
+    assert code == cli.EXIT_USAGE
@@ -0,0 +1,94 @@
+import json
+import socketserver
+import threading
+
+import pytest
+
+from conftest import make_task
+from fig_converter import daemon as daemon_module
+from fig_converter import scheduler as scheduler_module
+from fig_converter.daemon import ConversionDaemon, DaemonClient
+from fig_converter.memory import MemoryBudget
+from fig_converter.scheduler import ConversionScheduler, ShellPool
+from fig_converter.tasks import TaskResult
+
+
+class _RejectingHandler(socketserver.StreamRequestHandler):
+    """接受两个任务后返回错误的转换服务"""
+
+    def handle(self):
+        self.rfile.readline()
+        for _ in range(2):
+            self.rfile.readline()
+        self.wfile.write(json.dumps({"type": "error", "error": "服务出错"}).encode('utf-8') + b"\n")
+
+
+@pytest.fixture
+def rejecting_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _RejectingHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def test_error_message_returns_unfinished_tasks(rejecting_server, tmp_path):
+    tasks = [make_task(tmp_path / f"{number}.svg") for number in range(4)]
+    results, unfinished = DaemonClient(rejecting_server, "token").run(tasks, {})
+    assert results == []
+    # 已发送和尚未发送的任务都交还给调用方在进程内转换
+    assert list(unfinished) == tasks
+
+
+def test_unreachable_daemon_returns_all_tasks(tmp_path):
+    with socketserver.TCPServer(("127.0.0.1", 0), socketserver.BaseRequestHandler) as server:
+        port = server.server_address[1]
+    tasks = [make_task(tmp_path / "a.svg")]
+    results, unfinished = DaemonClient(port, "token").run(tasks, {})
+    assert results == [] and list(unfinished) == tasks
+
+
+def test_tiles_share_the_pool_concurrency_limit(tmp_path, monkeypatch):
+    running = []
+    peak = []
+    lock = threading.Lock()
+
+    def fake_export(inkscape_path, task, timeout, cancel_event):
+        with lock:
+            running.append(task)
+            peak.append(len(running))
+        cancel_event.wait(0.05)
+        with lock:
+            running.remove(task)
+        return TaskResult(task, True)
+
+    monkeypatch.setattr(scheduler_module, "run_export", fake_export)
+    pool = ShellPool("inkscape", 2)
+    scheduler = ConversionScheduler("inkscape", workers=4, shell_pool=pool)
+    tiles = [make_task(tmp_path / "big.svg", suffix=f"_{number}") for number in range(8)]
+    threads = [threading.Thread(target=scheduler._export_admitted, args=(tile,)) for tile in tiles]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(peak) == len(tiles)
+    assert max(peak) <= pool.size
+
+
+def test_jobs_share_one_memory_budget(tmp_path, monkeypatch):
+    budgets = []
+
+    class RecordingScheduler:
+        def __init__(self, inkscape_path, **options):
+            budgets.append(options["memory_budget"])
+
+        def run(self, tasks, **callbacks):
+            return []
+
+    monkeypatch.setattr(daemon_module, "ConversionScheduler", RecordingScheduler)
+    daemon = ConversionDaemon("inkscape", workers=2, memory_budget=1024, info_file=tmp_path / "daemon.json")
+    for _ in range(2):
+        daemon.run_job({}, iter([]), threading.Event(), on_result=None, on_progress=None)
+    assert isinstance(budgets[0], MemoryBudget) and budgets[0].limit == 1024
+    assert budgets[1] is budgets[0]
@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+from fig_converter import discovery
+from fig_converter.config import load_config
+
+
+@pytest.fixture
+def inkscape(tmp_path, monkeypatch):
+    """假的Inkscape可执行文件；记录查找和查询版本的次数"""
+    path = tmp_path / "bin" / "inkscape"
+    path.parent.mkdir()
+    path.write_text("#!/bin/sh\n")
+    calls = {"find": 0, "version": 0}
+
+    def find():
+        calls["find"] += 1
+        return str(path)
+
+    def version(inkscape_path):
+        calls["version"] += 1
+        return "Inkscape 1.3 (0e150ed, 2023-07-21)"
+
+    monkeypatch.setattr(discovery, "find_inkscape", find)
+    monkeypatch.setattr(discovery, "get_inkscape_version", version)
+    return path, calls
+
+
+def test_discovery_result_is_saved_and_reused(inkscape, tmp_path):
+    path, calls = inkscape
+    config_file = tmp_path / "settings.json"
+    first = discovery.resolve_inkscape(config_file=config_file)
+    assert (first.path, first.from_config) == (str(path), False)
+    assert load_config(config_file)["inkscape"]["version"] == first.version
+
+    second = discovery.resolve_inkscape(config_file=config_file)
+    assert (second.path, second.version, second.from_config) == (str(path), first.version, True)
+    # 第二次启动不查找也不启动Inkscape
+    assert calls == {"find": 1, "version": 1}
+
+
+def test_changed_binary_is_checked_again(inkscape, tmp_path):
+    path, calls = inkscape
+    config_file = tmp_path / "settings.json"
+    discovery.resolve_inkscape(config_file=config_file)
+    # 升级Inkscape：修改时间变化
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert discovery.load_saved_inkscape(config_file) is None
+    assert not discovery.resolve_inkscape(config_file=config_file).from_config
+    assert calls == {"find": 2, "version": 2}
+    assert discovery.resolve_inkscape(config_file=config_file).from_config
+
+
+def test_removed_binary_is_not_used(inkscape, tmp_path, monkeypatch):
+    path, calls = inkscape
+    config_file = tmp_path / "settings.json"
+    discovery.resolve_inkscape(config_file=config_file)
+    path.unlink()
+    monkeypatch.setattr(discovery, "find_inkscape", lambda: None)
+    assert discovery.resolve_inkscape(config_file=config_file) is None
+
+
+def test_preferred_path_reuses_saved_version(inkscape, tmp_path):
+    path, calls = inkscape
+    config_file = tmp_path / "settings.json"
+    discovery.resolve_inkscape(config_file=config_file)
+    info = discovery.resolve_inkscape(str(path), config_file=config_file)
+    assert info.from_config and calls["version"] == 1
+    other = tmp_path / "inkscape-dev"
+    other.write_text("")
+    info = discovery.resolve_inkscape(str(other), config_file=config_file)
+    assert (info.path, info.from_config) == (str(other), False)
+    assert calls == {"find": 1, "version": 2}
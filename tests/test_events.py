@@ -0,0 +1,47 @@
+import threading
+
+from conftest import make_task
+from fig_converter.engine import ConversionEngine
+from fig_converter.events import EventBus
+
+
+def test_drain_returns_events_in_order_up_to_limit():
+    bus = EventBus()
+    for number in range(5):
+        bus.publish("progress", completed=number)
+    assert [event.data["completed"] for event in bus.drain(3)] == [0, 1, 2]
+    assert [event.data["completed"] for event in bus.drain()] == [3, 4]
+    assert bus.drain() == []
+
+
+def test_publish_from_many_threads():
+    bus = EventBus()
+
+    def publish(thread):
+        for number in range(200):
+            bus.publish("result", thread=thread, number=number)
+
+    threads = [threading.Thread(target=publish, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    events = bus.drain()
+    assert len(events) == 800
+    # 同一线程发布的事件保持顺序
+    for thread in range(4):
+        assert [event.data["number"] for event in events if event.data["thread"] == thread] == list(range(200))
+
+
+def test_engine_publishes_results_and_progress(stub_inkscape, make_document):
+    tasks = [make_task(make_document(f"{number}.svg")) for number in range(3)]
+    bus = EventBus()
+    engine = ConversionEngine(stub_inkscape, workers=2, use_cache=False, timeout=30)
+    results = engine.run(tasks, events=bus)
+    events = bus.drain()
+    published = [event.data["result"] for event in events if event.kind == "result"]
+    assert sorted(id(result) for result in published) == sorted(id(result) for result in results)
+    progress = [event.data for event in events if event.kind == "progress"]
+    assert [data["completed"] for data in progress] == [1, 2, 3]
+    assert all(data["total"] == 3 for data in progress)
+    assert progress[-1]["fraction"] == 1.0
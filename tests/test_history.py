@@ -0,0 +1,120 @@
+import zipfile
+
+import pytest
+
+from conftest import SVG, make_task
+from fig_converter import history as history_module
+from fig_converter.archives import list_members
+from fig_converter.engine import ConversionEngine
+from fig_converter.history import (BatchPlan, DurationHistory, ProgressTracker, estimate_makespan,
+                                   format_seconds)
+from fig_converter.tasks import TaskResult, TaskTiming
+
+
+def test_archive_member_history_matches_prediction(stub_inkscape, tmp_path):
+    archive = tmp_path / "figs.zip"
+    with zipfile.ZipFile(archive, 'w') as f:
+        f.writestr("sub/a.svg", SVG * 2000)
+    history = DurationHistory(tmp_path / "history.json")
+    engine = ConversionEngine(stub_inkscape, workers=1, use_cache=False, timeout=30, history=history)
+    tasks, _ = engine.build_tasks(list(list_members(archive)), ["PNG"], 96)
+    assert not history.predict(tasks[0])[1]
+    results = engine.run(tasks)
+    assert results[0].success, results[0].error
+    # 解压出的临时文件已删除，记录的大小仍与预测时相同
+    assert results[0].task.input_size() == tasks[0].input_size() == len(SVG) * 2000
+    assert history.predict(tasks[0])[1]
+
+
+def _document(tmp_path, name, size):
+    path = tmp_path / name
+    path.write_bytes(b" " * size)
+    return path
+
+
+def _done(task, seconds, **kwargs):
+    return TaskResult(task, True, timing=TaskTiming(wall=seconds), **kwargs)
+
+
+def test_makespan_and_formatting():
+    # 最长优先：4 | 3+3 → 6、4+2 → 6
+    assert estimate_makespan([3, 2, 4, 3], 2) == 6
+    assert estimate_makespan([5, 1], 8) == 5
+    assert estimate_makespan([], 4) == 0.0
+    assert [format_seconds(value) for value in (0.4, 59.6, 200, 3900)] == ["0秒", "1分0秒", "3分20秒", "1小时5分"]
+
+
+def test_predictions_from_history(tmp_path):
+    history = DurationHistory(tmp_path / "history.json")
+    small = make_task(_document(tmp_path, "small.svg", 1000), dpi=96)
+    assert history.predict(small) == (pytest.approx(1.0 + 1000 / (2 * 1024 * 1024)), False)
+
+    history.record(_done(small, 2.0))
+    history.record(_done(small, 4.0))
+    # 平滑平均
+    assert history.predict(small) == (pytest.approx(0.7 * 2.0 + 0.3 * 4.0), True)
+    # 缓存命中和失败的任务不计
+    history.record(_done(small, 100.0, backend="cache"))
+    history.record(TaskResult(small, False, timing=TaskTiming(wall=100.0)))
+    assert history.predict(small)[0] == pytest.approx(2.6)
+
+    # 没有相同分类时按最接近的记录换算：DPI按比例，大小每翻一倍乘以√2
+    assert history.predict(make_task(small.input_path, dpi=192, suffix="_2x"))[0] == pytest.approx(5.2)
+    large = make_task(_document(tmp_path, "large.svg", 4000), dpi=96)
+    assert history.predict(large)[0] == pytest.approx(2.6 * 2)
+    # 其他格式组合没有记录
+    assert not history.predict(make_task(small.input_path, "pdf"))[1]
+
+
+def test_save_merges_with_other_processes(tmp_path):
+    path = tmp_path / "history.json"
+    first, second = DurationHistory(path), DurationHistory(path)
+    png = make_task(_document(tmp_path, "a.svg", 1000))
+    pdf = make_task(png.input_path, "pdf")
+    first.record(_done(png, 3.0))
+    second.record(_done(pdf, 5.0))
+    first.save()
+    second.save()
+    merged = DurationHistory(path)
+    assert merged.predict(png) == (3.0, True)
+    assert merged.predict(pdf) == (5.0, True)
+
+
+class FixedHistory:
+    """按文件名给出固定预测耗时的历史记录"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def predict(self, task):
+        return self.seconds[task.output_path.name], True
+
+
+def test_plan_groups_tasks_of_one_document(tmp_path):
+    a_png, a_pdf = make_task(tmp_path / "a.svg"), make_task(tmp_path / "a.svg", "pdf")
+    b_png, c_png = make_task(tmp_path / "b.svg"), make_task(tmp_path / "c.svg")
+    history = FixedHistory({"a.png": 1.0, "a.pdf": 2.0, "b.png": 4.0, "c.png": 2.5})
+    plan = BatchPlan([a_png, b_png, a_pdf, c_png], history, workers=2)
+    # 同一文档的任务在一个工作单元中，单元按预测耗时从长到短排列
+    assert [[item.task for item in unit] for unit in plan.units] == [[b_png], [a_png, a_pdf], [c_png]]
+    assert plan.total_seconds == 9.5
+    assert plan.estimated_seconds == 5.5
+    assert "共 4 个任务（3 个文档）" in plan.describe()
+
+
+def test_progress_is_weighted_by_prediction(tmp_path, monkeypatch):
+    tasks = [make_task(tmp_path / "big.svg"), make_task(tmp_path / "small.svg")]
+    clock = [100.0]
+    monkeypatch.setattr(history_module.time, "perf_counter", lambda: clock[0])
+    progress = ProgressTracker(FixedHistory({"big.png": 9.0, "small.png": 1.0}), workers=2)
+    assert list(progress.track(tasks)) == tasks
+    assert progress.fraction == 0.0
+    # 还没有任务完成时按计划的总耗时除以并发数
+    assert progress.remaining_seconds() == 5.0
+    clock[0] += 2.0
+    progress.complete(1)
+    assert progress.fraction == pytest.approx(0.1)
+    # 按实际速度换算：2秒完成了1秒的预测耗时
+    assert progress.remaining_seconds() == pytest.approx(18.0)
+    progress.complete(0)
+    assert progress.fraction == 1.0 and progress.remaining_seconds() == 0.0
@@ -0,0 +1,61 @@
+import os
+
+from fig_converter.ingest import FolderWatcher, walk_files
+
+
+def _touch(path, content="<svg/>", mtime=None):
+    path.write_text(content, encoding='utf-8')
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+    return str(path)
+
+
+def test_walk_files_skips_hidden_and_unsupported(tmp_path):
+    (tmp_path / "b").mkdir()
+    (tmp_path / ".git").mkdir()
+    names = ["b/2.svg", "a.svg", "notes.txt", ".a.svg.partial.svg", ".git/x.svg", "b/1.PDF"]
+    for name in names:
+        _touch(tmp_path / name)
+    found = [os.path.relpath(path, tmp_path) for path in walk_files(tmp_path)]
+    assert found == ["a.svg", os.path.join("b", "1.PDF"), os.path.join("b", "2.svg")]
+
+
+def test_watcher_reports_existing_files_only_after_changes(tmp_path):
+    old = _touch(tmp_path / "old.svg", mtime=1_000_000_000)
+    watcher = FolderWatcher([tmp_path])
+    watcher.prime()
+    assert watcher.poll() == []
+    # 新文件在连续两次轮询中不变才报告
+    new = _touch(tmp_path / "new.svg", mtime=1_000_000_000)
+    assert watcher.poll() == []
+    assert watcher.poll() == [new]
+    assert watcher.poll() == []
+    # 修改已有文件也会报告
+    _touch(tmp_path / "old.svg", "<svg></svg>", mtime=2_000_000_000)
+    assert watcher.poll() == []
+    assert watcher.poll() == [old]
+
+
+def test_watcher_waits_while_file_is_being_written(tmp_path):
+    watcher = FolderWatcher([tmp_path])
+    watcher.prime()
+    path = _touch(tmp_path / "big.svg", "<svg>", mtime=1_000_000_000)
+    assert watcher.poll() == []
+    _touch(tmp_path / "big.svg", "<svg><g/>", mtime=1_000_000_001)
+    assert watcher.poll() == []
+    assert watcher.poll() == [path]
+
+
+def test_watcher_ignores_outputs_and_forgets_deleted_files(tmp_path):
+    watcher = FolderWatcher([tmp_path])
+    watcher.prime()
+    output = _touch(tmp_path / "figure.pdf", mtime=1_000_000_000)
+    watcher.ignore([output])
+    assert watcher.poll() == []
+    assert watcher.poll() == []
+    # 删除后重新出现的文件当作新文件
+    os.remove(output)
+    assert watcher.poll() == []
+    _touch(tmp_path / "figure.pdf", mtime=1_000_000_000)
+    assert watcher.poll() == []
+    assert watcher.poll() == [output]
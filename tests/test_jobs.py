@@ -0,0 +1,54 @@
+import os
+
+from fig_converter.archives import ArchiveMember
+from fig_converter.jobs import CANCELLED, DONE, FAILED, PENDING, RUNNING, JobStore
+
+
+def test_add_deduplicates_spellings_of_the_same_file(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = JobStore()
+    added = store.add(["a.svg", str(tmp_path / "a.svg"), os.path.join("sub", "..", "a.svg"), "b.PNG"])
+    assert [job.path for job in added] == ["a.svg", "b.PNG"]
+    assert store.add(["b.PNG", "c.pdf"])[0].path == "c.pdf"
+    assert len(store) == 3 and "./b.PNG" in store
+    assert [job.index for job in store] == [0, 1, 2]
+    assert store.at(2).path == "c.pdf"
+    assert store.extension_counts == {".svg": 1, ".png": 1, ".pdf": 1}
+    assert store.state_counts[PENDING] == 3
+
+
+def test_archive_members_keep_their_member(tmp_path):
+    member = ArchiveMember(str(tmp_path / "figs.zip"), "sub/a.svg")
+    store = JobStore()
+    store.add([member, member.path])
+    assert len(store) == 1
+    assert store.paths() == [member]
+
+
+def test_state_follows_results_of_all_tasks(tmp_path):
+    store = JobStore()
+    a, b, c, same = store.add(["a.svg", "b.svg", "c.svg", "d.png"])
+    changed = store.begin(["a.svg", "b.svg", "c.svg", "d.png"], {"a.svg": 2, "b.svg": 2, "c.svg": 1})
+    assert [job.state for job in changed] == [RUNNING, RUNNING, RUNNING, DONE]
+
+    assert store.record_result("a.svg", True) is None
+    assert store.record_result("a.svg", True).state == DONE
+    store.record_result("b.svg", False, "崩溃")
+    assert store.record_result("b.svg", True) is b
+    assert (b.state, b.error) == (FAILED, "崩溃")
+    assert store.record_result("c.svg", False, "已取消", cancelled=True).state == CANCELLED
+    assert store.state_counts == {PENDING: 0, RUNNING: 0, DONE: 2, FAILED: 1, CANCELLED: 1}
+
+    # 再次转换时清除上一次的错误
+    store.begin(["b.svg"], {"b.svg": 1})
+    assert (b.state, b.error) == (RUNNING, "")
+    assert store.record_result("b.svg", True).state == DONE
+    assert store.record_result("unknown.svg", True) is None
+
+
+def test_clear(tmp_path):
+    store = JobStore()
+    store.add(["a.svg"])
+    store.clear()
+    assert len(store) == 0 and "a.svg" not in store
+    assert not store.state_counts and not store.extension_counts
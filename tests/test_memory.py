@@ -0,0 +1,112 @@
+import struct
+import threading
+import time
+
+import pytest
+
+from conftest import make_task
+from fig_converter.memory import MB, MemoryBudget, MemoryEstimator, page_size_inches
+from fig_converter.scheduler import ConversionScheduler
+
+
+def test_page_sizes_without_rendering(tmp_path):
+    svg = tmp_path / "a.svg"
+    svg.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="254mm" height="5in"/>')
+    view_box = tmp_path / "b.svg"
+    view_box.write_text('<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 192 96"/>')
+    pdf = tmp_path / "c.pdf"
+    pdf.write_bytes(b"%PDF-1.4\n1 0 obj << /MediaBox [0 0 612 792] >>\n2 0 obj << /MediaBox [0 0 72 72] >>\n")
+    eps = tmp_path / "d.eps"
+    eps.write_bytes(b"%!PS-Adobe-3.0 EPSF-3.0\n%%BoundingBox: 10 10 154 82\n")
+    emf = tmp_path / "e.emf"
+    emf.write_bytes(b"\0" * 24 + struct.pack("<iiii", 0, 0, 5080, 2540) + b"\0" * 8)
+    assert page_size_inches(svg) == pytest.approx((10, 5))
+    assert page_size_inches(view_box) == pytest.approx((2, 1))
+    assert page_size_inches(pdf) == pytest.approx((8.5, 11))
+    assert page_size_inches(eps) == pytest.approx((2, 1))
+    assert page_size_inches(emf) == pytest.approx((2, 1))
+    assert page_size_inches(tmp_path / "missing.svg") is None
+
+
+def test_estimate_grows_with_dpi_and_calibration(tmp_path):
+    document = tmp_path / "a.svg"
+    document.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="10in" height="10in"/>')
+    estimator = MemoryEstimator()
+    low, high = estimator.estimate(make_task(document, dpi=96)), estimator.estimate(make_task(document, dpi=300))
+    vector = estimator.estimate(make_task(document, "pdf"))
+    assert vector < low < high
+    # 300 DPI的10×10英寸RGBA渲染表面及其副本
+    assert high - vector == 3000 * 3000 * 12
+    # 实测一直是估计的两倍时估计逐步放大，但有上限
+    for _ in range(50):
+        estimator.calibrate(high, high * 2)
+    assert 1.5 < estimator.factor <= 4.0
+
+
+def test_budget_admission():
+    budget = MemoryBudget(100)
+    assert budget.try_acquire(60)
+    assert not budget.try_acquire(50)
+    assert budget.try_acquire(40)
+    budget.release(100)
+    # 超过全部预算的任务在没有其他任务时也可以执行
+    assert budget.try_acquire(500)
+    budget.release(500)
+
+
+def test_waiting_task_is_not_starved():
+    budget = MemoryBudget(100)
+    budget.acquire(80)
+    admitted = threading.Event()
+    waiter = threading.Thread(target=lambda: budget.acquire(60) and admitted.set())
+    waiter.start()
+    time.sleep(0.1)
+    # 等待中的任务保留了内存，小任务不能抢在前面
+    assert not budget.try_acquire(20)
+    budget.release(80)
+    assert admitted.wait(5)
+    waiter.join()
+    assert budget.used == 60
+
+
+def test_acquire_returns_false_when_cancelled():
+    budget = MemoryBudget(100)
+    budget.acquire(100)
+    cancel = threading.Event()
+    cancel.set()
+    assert not budget.acquire(10, cancel)
+    assert budget.used == 100
+
+
+class RecordingBudget(MemoryBudget):
+    """记录同时占用的最大内存"""
+
+    def __init__(self, limit):
+        super().__init__(limit)
+        self.peak = 0
+
+    def _record(self):
+        self.peak = max(self.peak, self.used)
+
+    def try_acquire(self, amount):
+        admitted = super().try_acquire(amount)
+        self._record()
+        return admitted
+
+    def acquire(self, amount, cancel_event=None):
+        admitted = super().acquire(amount, cancel_event)
+        self._record()
+        return admitted
+
+
+@pytest.mark.parametrize("limit", [450 * MB, 100 * MB])
+def test_scheduler_stays_within_budget(stub_inkscape, make_document, monkeypatch, limit):
+    monkeypatch.setenv("STUB_INKSCAPE_RENDER", "0.05")
+    tasks = [make_task(make_document(f"{number}.svg"), "pdf") for number in range(6)]
+    budget = RecordingBudget(limit)
+    results = ConversionScheduler(stub_inkscape, workers=4, timeout=30, memory_budget=budget).run(tasks)
+    assert all(result.success for result in results), [result.error for result in results]
+    estimate = results[0].timing.estimated_bytes
+    # 每个任务约200 MB：450 MB时最多同时两个，单个任务超过预算时逐个执行
+    assert estimate <= budget.peak <= max(limit, estimate)
+    assert budget.used == 0
@@ -0,0 +1,68 @@
+import json
+import re
+
+from conftest import make_task
+from fig_converter.engine import ConversionEngine
+from fig_converter.metrics import METRICS_JSON_NAME, METRICS_PROM_NAME, BatchMetrics, percentile
+from fig_converter.tasks import ERROR_CANCELLED, TaskResult, TaskTiming
+
+SAMPLE_RE = re.compile(r'^[a-z_]+(\{([a-z_]+="([^"\\]|\\.)*",?)*\})? -?[0-9.e+-]+$')
+
+
+def _result(tmp_path, name, export_type, wall, success=True, **timing):
+    task = make_task(tmp_path / name, export_type)
+    return TaskResult(task, success, "" if success else "失败", timing=TaskTiming(wall=wall, **timing))
+
+
+def _batch(tmp_path):
+    results = [_result(tmp_path, f"{number}.svg", "png", wall, input_bytes=100, output_bytes=40, render=wall / 2)
+               for number, wall in enumerate([1.0, 2.0, 3.0, 4.0])]
+    results.append(_result(tmp_path, "b.svg", "pdf", 0.5, success=False))
+    results.append(TaskResult(make_task(tmp_path / "c.svg", "pdf"), False, error_kind=ERROR_CANCELLED))
+    return BatchMetrics(results, wall_seconds=3.0, finished_at=1_700_000_000)
+
+
+def test_percentile_nearest_rank():
+    assert percentile([], 0.5) == 0.0
+    assert percentile([4, 1, 3, 2], 0.5) == 2
+    assert percentile([4, 1, 3, 2], 0.95) == 4
+    assert percentile([7], 0.01) == 7
+
+
+def test_summary(tmp_path):
+    summary = _batch(tmp_path).summary()
+    assert summary["tasks"] == 6
+    assert summary["tasks_per_second"] == 2.0
+    assert summary["statuses"] == {"converted": 4, "failed": 1, "cancelled": 1}
+    assert summary["input_bytes"] == 400 and summary["output_bytes"] == 160
+    assert summary["stage_seconds"]["render"] == 5.0
+    assert summary["formats"]["PNG"] == {"tasks": 4, "failed": 0, "p50_seconds": 2.0, "p95_seconds": 4.0}
+    assert summary["formats"]["PDF"]["failed"] == 2
+
+
+def test_prometheus_text_format(tmp_path):
+    text = _batch(tmp_path).to_prometheus()
+    lines = text.splitlines()
+    assert text.endswith("\n")
+    for line in lines:
+        assert line.startswith(("# HELP ", "# TYPE ")) or SAMPLE_RE.match(line), line
+    # 每个指标先有HELP和TYPE
+    names = [line.split()[2] for line in lines if line.startswith("# TYPE ")]
+    assert len(names) == len(set(names))
+    assert 'fig_converter_batch_tasks{status="failed"} 1' in lines
+    assert 'fig_converter_task_duration_seconds{format="PNG",quantile="0.95"} 4.0' in lines
+    assert 'fig_converter_task_duration_seconds_sum{format="PNG"} 10.0' in lines
+    assert 'fig_converter_task_duration_seconds_count{format="PDF"} 2' in lines
+    assert "fig_converter_batch_finished_timestamp_seconds 1700000000" in lines
+
+
+def test_engine_writes_reports(stub_inkscape, make_document, tmp_path):
+    tasks = [make_task(make_document(f"{number}.svg")) for number in range(2)]
+    metrics_dir = tmp_path / "metrics"
+    engine = ConversionEngine(stub_inkscape, workers=2, use_cache=False, timeout=30, metrics_dir=metrics_dir)
+    engine.run(tasks)
+    report = json.loads((metrics_dir / METRICS_JSON_NAME).read_text(encoding='utf-8'))
+    assert report["tasks"] == 2 and report["statuses"] == {"converted": 2}
+    assert [result["output"] for result in report["results"]] == [str(task.output_path) for task in tasks]
+    assert 'fig_converter_batch_tasks{status="converted"} 2' in (metrics_dir / METRICS_PROM_NAME).read_text()
+    assert sorted(path.name for path in metrics_dir.iterdir()) == [METRICS_JSON_NAME, METRICS_PROM_NAME]
@@ -0,0 +1,70 @@
+import zlib
+
+import pytest
+
+from fig_converter import pages
+from fig_converter.formats import FILE_TYPES
+from fig_converter.pages import page_count
+from fig_converter.tasks import build_tasks
+
+
+def _write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return path
+
+
+def _pdf(*objects):
+    return b"%PDF-1.7\n" + b"".join(b"%d 0 obj\n%s\nendobj\n" % (number, body)
+                                    for number, body in enumerate(objects, 1)) + b"%%EOF\n"
+
+
+PAGE = b"<< /Type /Page /Parent 2 0 R >>"
+
+
+def test_pdf_count_from_page_tree(tmp_path):
+    pdf = _write(tmp_path, "a.pdf", _pdf(b"<< /Type /Catalog /Pages 2 0 R >>",
+                                         b"<< /Kids [3 0 R 4 0 R 5 0 R] /Count 3 /Type /Pages >>", PAGE, PAGE, PAGE))
+    assert page_count(pdf) == 3
+    # 增量更新后追加了新版本的页树
+    updated = _write(tmp_path, "b.pdf", pdf.read_bytes() + _pdf(b"<< /Type /Pages /Count 5 /Kids [] >>"))
+    assert page_count(updated) == 5
+
+
+def test_pdf_page_tree_in_object_stream(tmp_path):
+    content = zlib.compress(b"2 0 << /Type /Pages /Kids [3 0 R 4 0 R] /Count 2 >>")
+    stream = b"<< /Type /ObjStm /N 1 /First 4 /Filter /FlateDecode /Length %d >>\nstream\n%s\nendstream" % (
+        len(content), content)
+    pdf = _write(tmp_path, "a.pdf", _pdf(b"<< /Type /Catalog /Pages 2 0 R >>", stream))
+    assert page_count(pdf) == 2
+
+
+def test_pdf_without_page_tree_counts_pages(tmp_path):
+    assert page_count(_write(tmp_path, "a.pdf", _pdf(PAGE, PAGE))) == 2
+    assert page_count(_write(tmp_path, "empty.pdf", b"")) is None
+    assert page_count(_write(tmp_path, "junk.pdf", b"not a pdf")) is None
+    assert page_count(tmp_path / "missing.pdf") is None
+
+
+def test_ps_dsc_pages(tmp_path, monkeypatch):
+    header = _write(tmp_path, "a.ps", b"%!PS-Adobe-3.0\n%%Pages: 4\n%%EndComments\n%%Pages: 1\nshowpage\n")
+    assert page_count(header) == 4
+    # 文件头之后只有内嵌EPS的注释，不是文档的页数
+    embedded = _write(tmp_path, "b.ps", b"%!PS-Adobe-3.0\n%%EndComments\n%%BeginDocument\n%%Pages: 7\n")
+    assert page_count(embedded) is None
+    monkeypatch.setattr(pages, "HEADER_SCAN_BYTES", 64)
+    atend = _write(tmp_path, "c.ps", b"%!PS-Adobe-3.0\n%%Pages: (atend)\n%%EndComments\n" + b"%" * 500
+                   + b"\n%%Trailer\n%%Pages: 12\n%%EOF\n")
+    assert page_count(atend) == 12
+    assert page_count(_write(tmp_path, "d.ps", b"%!PS-Adobe-3.0\n%%Pages: 0\n")) is None
+    assert page_count(_write(tmp_path, "e.eps", b"%!PS-Adobe-3.0 EPSF-3.0\n%%Pages: 3\n")) is None
+
+
+@pytest.mark.parametrize("count, names", [
+    (1, ["doc.png"]),
+    (12, [f"doc_p{page:02d}.png" for page in range(1, 13)])])
+def test_one_task_per_page(tmp_path, count, names):
+    document = _write(tmp_path, "doc.pdf", _pdf(b"<< /Type /Pages /Count %d >>" % count))
+    tasks, _ = build_tasks([document], ["PNG"], FILE_TYPES, 96)
+    assert [task.output_path.name for task in tasks] == names
+    assert [task.page for task in tasks] == (list(range(1, 13)) if count > 1 else [None])
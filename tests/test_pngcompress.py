@@ -0,0 +1,89 @@
+import struct
+import zlib
+
+import pytest
+
+from fig_converter import pngcompress
+from fig_converter.pngcompress import PNG_SIGNATURE, compress_png, read_chunks, write_chunk
+
+
+def _write_png(path, width=64, height=64, level=0, idat_parts=3, extra=((b"tEXt", b"Software\0Inkscape"),)):
+    """不透明的RGBA渐变图，图像数据按level压缩并拆分为多个IDAT块"""
+    rows = b"".join(b"\0" + bytes((x * 4, y * 4, (x + y) * 2, 255)[channel]
+                                  for x in range(width) for channel in range(4)) for y in range(height))
+    data = zlib.compress(rows, level)
+    step = len(data) // idat_parts + 1
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        write_chunk(f, b"pHYs", struct.pack(">IIB", 3780, 3780, 1))
+        for chunk_type, chunk_data in extra:
+            write_chunk(f, chunk_type, chunk_data)
+        for start in range(0, len(data), step):
+            write_chunk(f, b"IDAT", data[start:start + step])
+        write_chunk(f, b"IEND", b"")
+    return rows
+
+
+def _chunks(path):
+    with open(path, 'rb') as f:
+        return list(read_chunks(f))
+
+
+def _pixels(path):
+    return zlib.decompress(b"".join(data for chunk_type, data in _chunks(path) if chunk_type == b"IDAT"))
+
+
+def test_fast_mode_recompresses_without_changing_pixels(tmp_path, monkeypatch):
+    # 输出的IDAT块也拆分，覆盖跨块写出
+    monkeypatch.setattr(pngcompress, "IDAT_CHUNK_BYTES", 512)
+    path = tmp_path / "figure.png"
+    rows = _write_png(path)
+    report = compress_png(path, "fast")
+    assert report.compressed_bytes == path.stat().st_size < report.original_bytes
+    assert _pixels(path) == rows
+    types = [chunk_type for chunk_type, _ in _chunks(path)]
+    # 删除文本注释，保留分辨率
+    assert types[:2] == [b"IHDR", b"pHYs"] and types[-1] == b"IEND"
+    assert b"tEXt" not in types and types.count(b"IDAT") > 1
+    assert sorted(item.name for item in tmp_path.iterdir()) == ["figure.png"]
+
+
+def test_max_mode_drops_opaque_alpha(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    path = tmp_path / "figure.png"
+    _write_png(path, level=9, extra=())
+    with Image.open(path) as image:
+        original = image.convert("RGB").tobytes()
+    report = compress_png(path, "max")
+    assert report.saved_bytes > 0
+    with Image.open(path) as image:
+        assert image.mode == "RGB"
+        assert image.tobytes() == original
+        assert round(image.info["dpi"][0]) == 96
+
+
+def test_file_is_kept_when_not_smaller(tmp_path):
+    path = tmp_path / "figure.png"
+    _write_png(path, level=9, idat_parts=1, extra=())
+    # 已经是最高级别压缩的文件保持不变
+    compress_png(path, "fast")
+    before = path.read_bytes()
+    report = compress_png(path, "fast")
+    assert report.saved_bytes == 0
+    assert path.read_bytes() == before
+
+
+def test_invalid_input(tmp_path):
+    path = tmp_path / "figure.png"
+    path.write_bytes(b"GIF89a")
+    with pytest.raises(ValueError):
+        compress_png(path)
+    truncated = tmp_path / "truncated.png"
+    _write_png(truncated)
+    truncated.write_bytes(truncated.read_bytes()[:-30])
+    with pytest.raises(ValueError):
+        compress_png(truncated)
+    with pytest.raises(ValueError):
+        compress_png(truncated, "best")
+    assert sorted(item.name for item in tmp_path.iterdir()) == ["figure.png", "truncated.png"]
@@ -0,0 +1,113 @@
+import base64
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from urllib.parse import urlsplit
+from urllib.request import url2pathname
+
+import pytest
+
+from fig_converter.preflight import SvgPreflight, is_identity_transform, optimize_svg
+
+SVG_NS = "{http://www.w3.org/2000/svg}"
+XLINK_NS = "{http://www.w3.org/1999/xlink}"
+
+
+def _hrefs(path):
+    text = path.read_text(encoding='utf-8')
+    return [part.split('"', 1)[0] for part in text.split('href="')[1:]]
+
+
+def test_relative_hrefs_become_file_uris(tmp_path):
+    (tmp_path / "figs").mkdir()
+    (tmp_path / "figs" / "my image 100%.png").write_bytes(b"")
+    (tmp_path / "figs" / "icons.svg").write_bytes(b"")
+    source = tmp_path / "figs" / "doc.svg"
+    source.write_text('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">'
+                      '<image xlink:href="my%20image%20100%25.png"/><use href="icons.svg#arrow"/>'
+                      '<use href="#local"/><image href="https://example.com/a.png"/><g id="local"/></svg>\n',
+                      encoding='utf-8')
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    report = optimize_svg(source, work_dir)
+    folder = (tmp_path / "figs").resolve()
+    assert _hrefs(report.optimized) == [(folder / "my image 100%.png").as_uri(),
+                                        (folder / "icons.svg").as_uri() + "#arrow",
+                                        "#local", "https://example.com/a.png"]
+
+
+DOCUMENT = '''<?xml version="1.0" encoding="UTF-8"?>
+<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" width="10" height="10">
+  <!-- 注释 -->
+  <metadata><title>很长的元数据</title></metadata>
+  <style>.a { fill: url(#styled); }</style>
+  <defs>
+    <linearGradient id="used"/><linearGradient id="styled"/><linearGradient id="linked"/>
+    <linearGradient id="unused"><stop offset="0"/></linearGradient>
+  </defs>
+  <rect id="r" transform="translate(0, 0) scale(1)" fill="url(#used)" width="10" height="10"/>
+  <rect transform="translate(1,0)" width="1" height="1"/>
+  <use xlink:href="#linked"/>
+  <image width="1" height="1" xlink:href="data:image/png;base64,{data}"/>
+</svg>
+'''
+
+
+def _document(tmp_path, text):
+    source = tmp_path / "doc.svg"
+    source.write_text(text, encoding='utf-8')
+    work_dir = tmp_path / "work"
+    work_dir.mkdir()
+    return source, work_dir
+
+
+@pytest.mark.parametrize("value, identity", [
+    ("", True), ("translate(0)", True), ("translate(0,0) scale(1 1)", True), ("matrix(1,0,0,1,0,0)", True),
+    ("rotate(0 0 0)", True), ("translate(0,1)", False), ("scale(2)", False), ("translate(0) bogus", False),
+    ("skewX(a)", False)])
+def test_identity_transforms(value, identity):
+    assert is_identity_transform(value) is identity
+
+
+def test_optimized_document(tmp_path):
+    image = base64.b64encode(bytes(range(256)) * 400).decode()
+    source, work_dir = _document(tmp_path, DOCUMENT.replace("{data}", image))
+    report = optimize_svg(source, work_dir)
+    # metadata和未引用的定义
+    assert report.removed_elements == 2
+    assert report.removed_transforms == 1
+    assert report.externalized_images == 1
+    assert report.saved_bytes > len(image) - 200
+
+    root = ET.parse(report.optimized).getroot()
+    ids = [element.get("id") for element in root.iter() if element.get("id")]
+    assert ids == ["used", "styled", "linked", "r"]
+    rects = root.findall(f"{SVG_NS}rect")
+    assert [rect.get("transform") for rect in rects] == [None, "translate(1,0)"]
+    href = root.find(f"{SVG_NS}image").get(f"{XLINK_NS}href")
+    assert Path(url2pathname(urlsplit(href).path)).read_bytes() == bytes(range(256)) * 400
+    assert "注释" not in report.optimized.read_text(encoding='utf-8')
+
+
+def test_scripted_document_keeps_definitions(tmp_path):
+    source, work_dir = _document(tmp_path, DOCUMENT.replace("{data}", "AAAA").replace(
+        "<defs>", "<script>document.getElementById('unused')</script><defs>"))
+    report = optimize_svg(source, work_dir)
+    assert report.removed_elements == 1
+    assert report.externalized_images == 0
+    assert 'id="unused"' in report.optimized.read_text(encoding='utf-8')
+
+
+def test_preflight_context(tmp_path):
+    source, _ = _document(tmp_path, DOCUMENT.replace("{data}", "AAAA"))
+    with SvgPreflight(source) as report:
+        assert report is not None and report.optimized.exists()
+        optimized = report.optimized
+    assert not optimized.exists()
+    # 没有可以清理的内容、无法解析的文档和其他格式都使用原文档
+    clean = tmp_path / "clean.svg"
+    clean.write_text('<svg xmlns="http://www.w3.org/2000/svg"/>', encoding='utf-8')
+    broken = tmp_path / "broken.svg"
+    broken.write_text('<svg', encoding='utf-8')
+    for path in (clean, broken, tmp_path / "a.pdf"):
+        with SvgPreflight(path) as report:
+            assert report is None
@@ -0,0 +1,104 @@
+import threading
+
+import pytest
+
+from conftest import make_task
+from fig_converter.scheduler import ConversionScheduler, RetryPolicy
+from fig_converter.tasks import ERROR_CRASH, ERROR_TIMEOUT
+
+
+@pytest.mark.parametrize("use_shell", [True, False])
+def test_multi_task_units(stub_inkscape, make_document, use_shell):
+    tasks = []
+    for name in ("a.svg", "b.svg", "c.svg"):
+        document = make_document(name)
+        tasks += [make_task(document, "png", 96), make_task(document, "png", 192, "_2x"), make_task(document, "pdf")]
+    scheduler = ConversionScheduler(stub_inkscape, workers=2, use_shell=use_shell, timeout=30)
+    progress = []
+    delivered = []
+    results = scheduler.run(tasks, on_result=delivered.append,
+                            on_progress=lambda completed, total: progress.append((completed, total)))
+    assert [result.task for result in results] == tasks
+    assert all(result.success for result in results), [result.error for result in results]
+    # 结果按提交顺序交付，进度按完成数递增
+    assert [result.task for result in delivered] == tasks
+    assert progress[-1] == (len(tasks), len(tasks))
+    for task in tasks:
+        assert task.output_path.is_file()
+
+
+def test_streaming_tasks(stub_inkscape, make_document):
+    documents = [make_document(f"{number}.svg") for number in range(5)]
+    tasks = [make_task(document) for document in documents]
+    results = ConversionScheduler(stub_inkscape, workers=3, timeout=30).run(iter(tasks))
+    assert [result.task for result in results] == tasks
+    assert all(result.success for result in results)
+
+
+def test_crash_is_retried_and_other_documents_convert(stub_inkscape, make_document, monkeypatch):
+    monkeypatch.setenv("STUB_INKSCAPE_CRASH", "broken")
+    tasks = [make_task(make_document("broken.svg")), make_task(make_document("good.svg"))]
+    scheduler = ConversionScheduler(stub_inkscape, workers=1, timeout=30,
+                                    retry=RetryPolicy(max_attempts=2, backoff=0))
+    broken, good = scheduler.run(tasks)
+    assert not broken.success and broken.error_kind == ERROR_CRASH
+    assert broken.attempts == 2
+    assert good.success, good.error
+
+
+def test_timeout(stub_inkscape, make_document, monkeypatch):
+    monkeypatch.setenv("STUB_INKSCAPE_RENDER", "10")
+    tasks = [make_task(make_document("slow.svg"))]
+    results = ConversionScheduler(stub_inkscape, workers=1, timeout=0.5).run(tasks)
+    assert results[0].status == "failed"
+    assert results[0].error_kind == ERROR_TIMEOUT
+
+
+def test_cancel(stub_inkscape, make_document, monkeypatch):
+    monkeypatch.setenv("STUB_INKSCAPE_RENDER", "10")
+    tasks = [make_task(make_document(f"{number}.svg")) for number in range(4)]
+    cancel_event = threading.Event()
+    timer = threading.Timer(0.5, cancel_event.set)
+    timer.start()
+    try:
+        results = ConversionScheduler(stub_inkscape, workers=2, cancel_event=cancel_event).run(tasks)
+    finally:
+        timer.cancel()
+    assert [result.status for result in results] == ["cancelled"] * len(tasks)
+
+
+def test_unexpected_error_fails_only_its_unit(stub_inkscape, make_document):
+    tasks = [make_task(make_document(f"{name}.svg")) for name in "abcd"]
+    scheduler = ConversionScheduler(stub_inkscape, workers=2, timeout=30, memory_budget=1 << 40)
+    estimate = scheduler._estimate
+
+    def failing_estimate(pending):
+        if pending[0][1].input_path.name == "b.svg":
+            raise RuntimeError("boom")
+        return estimate(pending)
+
+    scheduler._estimate = failing_estimate
+    results = scheduler.run(tasks)
+    assert [result.success for result in results] == [True, False, True, True]
+    assert "boom" in results[1].error
+
+
+def test_preflight_runs_once_per_document(stub_inkscape, tmp_path, monkeypatch):
+    from fig_converter import preflight
+
+    document = tmp_path / "figure.svg"
+    document.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="10" height="10">'
+                        '<metadata>' + "x" * 4096 + '</metadata><rect width="10" height="10"/></svg>\n',
+                        encoding='utf-8')
+    calls = []
+    optimize = preflight.optimize_svg
+    monkeypatch.setattr(preflight, "optimize_svg", lambda *args: calls.append(args) or optimize(*args))
+    tasks = [make_task(document, "png", dpi, f"_{dpi}") for dpi in (96, 192, 288)]
+    # 只有一个文档时任务按任务拆分到各工作线程，仍然只预处理一次
+    results = ConversionScheduler(stub_inkscape, workers=3, timeout=30, preflight=True).run(tasks)
+    assert all(result.success for result in results)
+    assert len(calls) == 1
+    assert sum(1 for result in results if result.timing.preflight_saved_bytes) == 1
+    # 全部任务使用同一个预处理结果，完成后删除
+    assert len({result.task.load_path for result in results}) == 1
+    assert not results[0].task.load_path.exists()
@@ -0,0 +1,66 @@
+import threading
+
+from conftest import make_task
+from fig_converter.shell import InkscapeShell
+from fig_converter.tasks import ERROR_CANCELLED, ERROR_CRASH, ERROR_TIMEOUT
+
+
+def test_exports_all_tasks_of_a_document(stub_inkscape, make_document):
+    document = make_document("figure.svg")
+    tasks = [make_task(document, "png", 96), make_task(document, "png", 192, "_2x"), make_task(document, "pdf")]
+    with InkscapeShell(stub_inkscape, timeout=30) as shell:
+        results = list(shell.convert_document(document, tasks))
+        assert shell.running
+    assert [result.success for result in results] == [True, True, True]
+    for task in tasks:
+        assert task.output_path.is_file()
+    assert b"dpi=96" in tasks[2].output_path.read_bytes()
+    # 打开文档的耗时只记在第一个任务上，不留下临时输出
+    assert results[1].timing.parse == 0.0
+    assert not list(document.parent.glob(".*partial*"))
+
+
+def test_crash_fails_document_and_restarts(stub_inkscape, make_document, monkeypatch):
+    monkeypatch.setenv("STUB_INKSCAPE_CRASH", "broken")
+    broken = make_document("broken.svg")
+    good = make_document("good.svg")
+    with InkscapeShell(stub_inkscape, timeout=30) as shell:
+        first_pid = shell.process.pid
+        results = list(shell.convert_document(broken, [make_task(broken), make_task(broken, "pdf")]))
+        assert [result.error_kind for result in results] == [ERROR_CRASH, ERROR_CRASH]
+        assert shell.crashes == 1
+        assert not shell.running
+
+        # 下一个文档自动重启进程，旧进程的输出不会混入新进程
+        results = list(shell.convert_document(good, [make_task(good)]))
+        assert results[0].success, results[0].error
+        assert shell.process.pid != first_pid
+        results = list(shell.convert_document(good, [make_task(good, "pdf")]))
+        assert results[0].success, results[0].error
+
+
+def test_timeout_kills_process(stub_inkscape, make_document, monkeypatch):
+    monkeypatch.setenv("STUB_INKSCAPE_RENDER", "10")
+    document = make_document("slow.svg")
+    with InkscapeShell(stub_inkscape, timeout=0.5) as shell:
+        results = list(shell.convert_document(document, [make_task(document), make_task(document, "pdf")]))
+        assert not shell.running
+    assert results[0].error_kind == ERROR_TIMEOUT
+    # 同一文档后面的任务因进程被结束而失败，可以按崩溃重试
+    assert results[1].error_kind == ERROR_CRASH
+
+
+def test_cancel_stops_running_export(stub_inkscape, make_document, monkeypatch):
+    monkeypatch.setenv("STUB_INKSCAPE_RENDER", "10")
+    document = make_document("slow.svg")
+    cancel_event = threading.Event()
+    with InkscapeShell(stub_inkscape, cancel_event=cancel_event) as shell:
+        timer = threading.Timer(0.5, cancel_event.set)
+        timer.start()
+        try:
+            results = list(shell.convert_document(document, [make_task(document), make_task(document, "pdf")]))
+        finally:
+            timer.cancel()
+        assert not shell.running
+    assert [result.error_kind for result in results] == [ERROR_CANCELLED, ERROR_CANCELLED]
+    assert not make_task(document).output_path.exists()
@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+import time
+
+from conftest import ROOT
+from fig_converter import startup
+
+
+def test_started_at_is_process_start():
+    # 子进程导入程序包前先等待，启动耗时应包括这段时间
+    code = "import time; time.sleep(0.5); import fig_converter; print(time.time() - fig_converter.STARTED_AT)"
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    assert 0.5 <= float(output.stdout) < 5
+
+
+def test_onefile_child_uses_bootloader_start(monkeypatch, tmp_path):
+    monkeypatch.setattr(sys, "frozen", True, raising=False)
+    monkeypatch.setattr(sys, "executable", str(tmp_path / "app" / "fig_converter"))
+    monkeypatch.setattr(sys, "_MEIPASS", str(tmp_path / "app" / "_internal"), raising=False)
+    assert not startup._is_onefile_child()
+    monkeypatch.setattr(sys, "_MEIPASS", str(tmp_path / "_MEI12345"))
+    assert startup._is_onefile_child()
+    if sys.platform.startswith("linux"):
+        assert startup._linux_start_time(os.getppid()) <= startup._linux_start_time(os.getpid()) <= time.time()
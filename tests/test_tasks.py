@@ -0,0 +1,41 @@
+import pytest
+
+from fig_converter.formats import FILE_TYPES
+from fig_converter.tasks import build_tasks, parse_dpi_list, resolve_name_template
+
+
+def test_parse_dpi_list():
+    assert parse_dpi_list(96) == [96]
+    assert parse_dpi_list("96, 192，600,96") == [96, 192, 600]
+    assert parse_dpi_list([300, "150"]) == [300, 150]
+    for value in ("", "abc", "0", [-1]):
+        with pytest.raises(ValueError):
+            parse_dpi_list(value)
+
+
+def test_default_templates():
+    assert resolve_name_template(None, [96]) == "{stem}.{ext}"
+    assert resolve_name_template("", [96, 192]) == "{stem}_{dpi}dpi.{ext}"
+
+
+@pytest.mark.parametrize("template", ["{stem}.{ext}", "{name}.{ext}", "{stem", "figs/{stem}@{dpi}.{ext}"])
+def test_invalid_templates_for_several_dpis(template):
+    with pytest.raises(ValueError):
+        resolve_name_template(template, [96, 192])
+
+
+def test_one_raster_task_per_dpi(tmp_path):
+    source = tmp_path / "plot.svg"
+    tasks, skipped = build_tasks([source, tmp_path / "photo.png"], ["PNG", "PDF"], FILE_TYPES, [96, 192, 600],
+                                 "{stem}@{scale}x.{ext}")
+    names = [(task.output_path.name, task.dpi) for task in tasks]
+    # 矢量格式只有一个任务，位图格式每个DPI一个；同一文件的任务相邻
+    assert names == [("plot@1x.png", 96), ("plot@2x.png", 192), ("plot@6.25x.png", 600), ("plot.pdf", 96),
+                     ("photo.pdf", 96)]
+    assert all(task.output_path.parent == tmp_path for task in tasks)
+    assert skipped == [(tmp_path / "photo.png", "PNG")]
+
+
+def test_format_placeholder(tmp_path):
+    tasks, _ = build_tasks([tmp_path / "a.svg"], ["PNG"], FILE_TYPES, "96,300", "{format}-{stem}_{dpi}.{ext}")
+    assert [task.output_path.name for task in tasks] == ["png-a_96.png", "png-a_300.png"]
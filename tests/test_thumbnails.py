@@ -0,0 +1,93 @@
+import io
+import os
+import threading
+
+import pytest
+
+from fig_converter.thumbnails import ThumbnailCache, ThumbnailService
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _size(data):
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+def test_memory_lru_and_disk_cache(tmp_path):
+    cache = ThumbnailCache(tmp_path / "thumbs", max_items=2)
+    for digest in ("aa1", "bb2", "cc3"):
+        cache.put(digest, digest.encode())
+    assert list(cache._memory) == ["bb2", "cc3"]
+    # 内存中已淘汰的从磁盘读取；另一个实例（下次启动）同样可以读取
+    assert cache.get("aa1") == b"aa1"
+    assert ThumbnailCache(tmp_path / "thumbs").get("cc3") == b"cc3"
+    assert cache.get("dd4") is None
+
+
+def test_prune_removes_least_recently_used(tmp_path):
+    cache = ThumbnailCache(tmp_path / "thumbs", max_disk_bytes=250)
+    for number, digest in enumerate(("aa1", "bb2", "cc3")):
+        cache.put(digest, bytes(100))
+        os.utime(cache._path(digest), (1_000_000 + number, 1_000_000 + number))
+    # 读取时更新使用时间
+    ThumbnailCache(tmp_path / "thumbs").get("aa1")
+    cache.prune()
+    assert sorted(path.name.split("_")[0] for path in (tmp_path / "thumbs").glob("*/*.png")) == ["aa1", "cc3"]
+
+
+@pytest.fixture
+def service(tmp_path):
+    return ThumbnailService(lambda path, data: None, cache=ThumbnailCache(tmp_path / "thumbs"))
+
+
+def test_bitmap_thumbnails_are_shared_by_content(service, tmp_path, monkeypatch):
+    photo = tmp_path / "photo.jpg"
+    Image.new("RGB", (400, 100), (0, 128, 255)).save(photo)
+    data = service._thumbnail(str(photo))
+    assert _size(data) == (32, 8)
+    # 内容相同的文件（例如改名后）直接使用缓存
+    copy = tmp_path / "copy.jpg"
+    copy.write_bytes(photo.read_bytes())
+    monkeypatch.setattr(service, "_render", lambda path: pytest.fail("不应重新生成"))
+    assert service._thumbnail(str(copy)) == data
+
+
+def test_paused_and_failed_files_are_not_rendered(service, tmp_path, monkeypatch):
+    photo = tmp_path / "photo.png"
+    Image.new("RGB", (64, 64)).save(photo)
+    service.pause()
+    assert service._thumbnail(str(photo)) is None
+    service.resume()
+    assert service._thumbnail(str(photo)) is not None
+
+    broken = tmp_path / "broken.png"
+    broken.write_bytes(b"not a png")
+    renders = []
+    render = service._render
+    monkeypatch.setattr(service, "_render", lambda path: renders.append(path) or render(path))
+    assert service._thumbnail(str(broken)) is None
+    assert service._thumbnail(str(broken)) is None
+    assert len(renders) == 1
+    # 文件改动后再次尝试
+    broken.write_bytes(b"still not a png")
+    assert service._thumbnail(str(broken)) is None
+    assert len(renders) == 2
+
+
+def test_vector_thumbnails_use_inkscape(stub_inkscape, make_document, tmp_path):
+    ready = {}
+    done = threading.Event()
+
+    def on_ready(path, data):
+        ready[path] = data
+        done.set()
+
+    service = ThumbnailService(on_ready, inkscape_path=stub_inkscape, cache=ThumbnailCache(tmp_path / "thumbs"))
+    document = str(make_document("figure.svg"))
+    try:
+        service.request([document])
+        assert done.wait(30)
+    finally:
+        service.stop()
+    assert max(_size(ready[document])) <= 32
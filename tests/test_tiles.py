@@ -0,0 +1,175 @@
+import struct
+import threading
+import zlib
+from random import Random
+
+import pytest
+
+from conftest import make_task
+from fig_converter import scheduler as scheduler_module
+from fig_converter import tiles
+from fig_converter.scheduler import ConversionScheduler
+from fig_converter.shell import InkscapeShell
+from fig_converter.pngcompress import PNG_SIGNATURE, write_chunk
+from fig_converter.tiles import PngStitcher, TilePlan, plan_tiles
+
+
+def test_tile_area_is_in_document_pixels(tmp_path):
+    # 页面 2×1 英寸 (192×96 px)，viewBox 的用户单位为 1/10 px 且有偏移
+    document = tmp_path / "wide.svg"
+    document.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="2in" height="1in" '
+                        'viewBox="100 50 1920 960"><rect x="100" y="50" width="1920" height="960"/></svg>\n',
+                        encoding='utf-8')
+    plan = plan_tiles(make_task(document, "png", 96), threshold=192 * 96 // 4, parallelism=4)
+    assert (plan.width, plan.height) == (192, 96)
+    areas = [plan.area(strip) for strip in plan.strips]
+    assert areas[0] == pytest.approx((0, 0, 192, 24))
+    assert areas[-1] == pytest.approx((0, 72, 192, 96))
+    # 条带的导出尺寸与范围对应同一缩放比例
+    for area, strip in zip(areas, plan.strips):
+        assert area[3] - area[1] == pytest.approx(strip[1] - strip[0])
+
+
+def test_no_tiling_when_verification_is_unavailable(monkeypatch):
+    monkeypatch.setattr(scheduler_module, "can_verify", lambda: False)
+    assert ConversionScheduler("inkscape", tile_threshold=1000).tile_threshold == 1000
+    assert ConversionScheduler("inkscape", tile_threshold=1000, verify_tiles=True).tile_threshold is None
+
+
+def test_compare_images_in_bands(tmp_path, monkeypatch):
+    Image = pytest.importorskip("PIL.Image")
+    # 每段只有几行，覆盖段与段之间引用上一行的过滤方式
+    monkeypatch.setattr(tiles, "COMPARE_BAND_BYTES", 3 * 40 * 4)
+    random = Random(1)
+    image = Image.frombytes("RGBA", (40, 31), bytes(random.randrange(256) for _ in range(40 * 31 * 4)))
+    image.save(tmp_path / "a.png", optimize=True)
+    image.save(tmp_path / "b.png", compress_level=1)
+    assert tiles.compare_images(tmp_path / "a.png", tmp_path / "b.png") is None
+
+    image.putpixel((7, 20), (0, 0, 0, 0))
+    image.save(tmp_path / "c.png")
+    assert "第 21 行" in tiles.compare_images(tmp_path / "a.png", tmp_path / "c.png")
+    image.crop((0, 0, 40, 30)).save(tmp_path / "d.png")
+    assert "尺寸不同" in tiles.compare_images(tmp_path / "a.png", tmp_path / "d.png")
+
+
+def _png_size(path):
+    with open(path, 'rb') as f:
+        header = f.read(24)
+    return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+
+
+def test_tiles_stay_within_worker_count(stub_inkscape, make_document, tmp_path, monkeypatch):
+    document = tmp_path / "poster.svg"
+    document.write_text('<svg xmlns="http://www.w3.org/2000/svg" width="2in" height="1in"/>\n', encoding='utf-8')
+    tasks = [make_task(document)] + [make_task(make_document(f"{number}.svg")) for number in range(6)]
+    # 记录同时存在的Inkscape进程数：交互进程从启动到结束，单独的进程在导出期间
+    live = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def change(delta):
+        with lock:
+            live.append(delta)
+            peak[0] = max(peak[0], sum(live))
+
+    start, close, export = InkscapeShell.start, InkscapeShell.close, scheduler_module.run_export
+
+    def counting_start(shell):
+        change(1)
+        return start(shell)
+
+    def counting_close(shell, *args, **kwargs):
+        if shell.process is not None:
+            change(-1)
+        return close(shell, *args, **kwargs)
+
+    def counting_export(*args):
+        change(1)
+        try:
+            return export(*args)
+        finally:
+            change(-1)
+
+    monkeypatch.setattr(InkscapeShell, "start", counting_start)
+    monkeypatch.setattr(InkscapeShell, "close", counting_close)
+    monkeypatch.setattr(scheduler_module, "run_export", counting_export)
+    monkeypatch.setenv("STUB_INKSCAPE_RENDER", "0.05")
+    results = ConversionScheduler(stub_inkscape, workers=2, timeout=30, tile_threshold=192 * 96 // 4).run(tasks)
+    assert all(result.success for result in results), [result.error for result in results]
+    assert results[0].backend == "inkscape-tiled"
+    assert _png_size(tasks[0].output_path) == (192, 96)
+    # 条带的单独进程与工作线程的交互进程合计不超过workers个
+    assert 0 < peak[0] <= 2
+    assert sum(live) == 0
+
+
+def _filter_row(kind, row, previous, bpp):
+    """按PNG过滤方式kind编码一行，previous为上一行的原始数据（条带第一行为全零）"""
+    out = bytearray([kind])
+    for i, value in enumerate(row):
+        left = row[i - bpp] if i >= bpp else 0
+        up = previous[i]
+        upper_left = previous[i - bpp] if i >= bpp else 0
+        if kind == 0:
+            predictor = 0
+        elif kind == 1:
+            predictor = left
+        elif kind == 2:
+            predictor = up
+        elif kind == 3:
+            predictor = (left + up) >> 1
+        else:
+            estimate = left + up - upper_left
+            distances = (abs(estimate - left), abs(estimate - up), abs(estimate - upper_left))
+            predictor = (left, up, upper_left)[distances.index(min(distances))]
+        out.append((value - predictor) & 0xFF)
+    return bytes(out)
+
+
+def _write_strip(path, rows, width, first_kind):
+    """把原始像素行写为RGBA PNG，第一行使用first_kind，其余行轮流使用各种过滤方式"""
+    stride = width * 4
+    previous = bytes(stride)
+    filtered = []
+    for number, row in enumerate(rows):
+        filtered.append(_filter_row((first_kind + number) % 5, row, previous, 4))
+        previous = row
+    with open(path, 'wb') as f:
+        f.write(PNG_SIGNATURE)
+        write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, len(rows), 8, 6, 0, 0, 0))
+        write_chunk(f, b"IDAT", zlib.compress(b"".join(filtered)))
+        write_chunk(f, b"IEND", b"")
+
+
+@pytest.mark.parametrize("first_kind", range(5))
+def test_stitched_strips_match_single_image(tmp_path, first_kind):
+    Image = pytest.importorskip("PIL.Image")
+    width, height = 13, 20
+    random = Random(first_kind)
+    rows = [bytes(random.randrange(256) for _ in range(width * 4)) for _ in range(height)]
+    plan = TilePlan(width, height, (0, 0, width, height), (width, height), [(0, 7), (7, 8), (8, 15), (15, 20)])
+    output = tmp_path / "stitched.png"
+    stitcher = PngStitcher(output, plan, 96)
+    for number, (first, last) in enumerate(plan.strips):
+        strip = tmp_path / f"strip_{number}.png"
+        # 各条带第一行的过滤方式不同，覆盖 None/Sub/Up/Average/Paeth 的改写
+        _write_strip(strip, rows[first:last], width, (first_kind + number) % 5)
+        stitcher.add(strip)
+    stitcher.close()
+    single = tmp_path / "single.png"
+    _write_strip(single, rows, width, first_kind)
+    with Image.open(output) as stitched, Image.open(single) as reference:
+        assert stitched.size == (width, height)
+        assert stitched.tobytes() == reference.tobytes() == b"".join(rows)
+
+
+def test_stitcher_rejects_wrong_strip_size(tmp_path):
+    plan = TilePlan(4, 4, (0, 0, 4, 4), (4, 4), [(0, 2), (2, 4)])
+    strip = tmp_path / "strip.png"
+    _write_strip(strip, [bytes(16)] * 3, 4, 0)
+    stitcher = PngStitcher(tmp_path / "out.png", plan, 96)
+    with pytest.raises(ValueError):
+        stitcher.add(strip)
+    stitcher.abort()
+    assert [path.name for path in tmp_path.iterdir()] == ["strip.png"]